@@ -26,6 +26,13 @@ if config.config_file_name is not None:
 
 target_metadata = Base.metadata
 
+# Таблицы без ORM-модели (создаются миграциями вручную) — autogenerate их не трогает
+UNMANAGED_TABLES = {"product_vectors"}
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    return not (type_ == "table" and name in UNMANAGED_TABLES)
+
 
 # --- 🔥 ФУНКЦИЯ ПОЛУЧЕНИЯ URL ---
 def get_db_url():
@@ -58,6 +65,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -65,7 +73,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
 
     with context.begin_transaction():
         context.run_migrations()
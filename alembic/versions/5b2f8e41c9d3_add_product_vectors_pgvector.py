@@ -0,0 +1,70 @@
+"""add product_vectors (pgvector)
+
+Revision ID: 5b2f8e41c9d3
+Revises: 09617f64a26b
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2f8e41c9d3'
+down_revision: Union[str, Sequence[str], None] = '09617f64a26b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Размерность text-embedding-3-small
+EMBEDDING_DIM = 1536
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    # Таблица нужна только для SEARCH_BACKEND=pgvector. Образ без расширения
+    # (postgres:15-alpine) пропускаем, чтобы не ломать обычный деплой
+    available = bind.execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")
+    ).scalar()
+    if not available:
+        print("⚠️ Расширение pgvector не установлено — таблица product_vectors не создана")
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS product_vectors (
+            id VARCHAR(255) PRIMARY KEY,
+            embedding vector({EMBEDDING_DIM}) NOT NULL,
+            magazine_ids INTEGER[] NOT NULL DEFAULT '{{}}',
+            source_url VARCHAR NOT NULL,
+            metadata JSONB NOT NULL DEFAULT '{{}}',
+            document TEXT,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+    # ANN-индекс по косинусной дистанции (оператор <=>)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_product_vectors_embedding "
+        "ON product_vectors USING hnsw (embedding vector_cosine_ops)"
+    )
+    # Фильтр "товары магазинов X, Y": magazine_ids && ARRAY[X, Y]
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_product_vectors_magazine_ids "
+        "ON product_vectors USING gin (magazine_ids)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_product_vectors_source_url ON product_vectors (source_url)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP TABLE IF EXISTS product_vectors")
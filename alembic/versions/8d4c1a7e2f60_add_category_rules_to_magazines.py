@@ -0,0 +1,32 @@
+"""add category_rules to magazines
+
+Revision ID: 8d4c1a7e2f60
+Revises: 5b2f8e41c9d3
+Create Date: 2026-10-18 16:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4c1a7e2f60'
+down_revision: Union[str, Sequence[str], None] = '5b2f8e41c9d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'magazines',
+        sa.Column('category_rules', postgresql.JSONB(astext_type=sa.Text()), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('magazines', 'category_rules')
@@ -0,0 +1,7 @@
+"""
+Замеры производительности поиска по товарам.
+
+Запускаются вручную как модули, например:
+  python -m app.benchmarks.quantization
+  python -m app.benchmarks.search_suite
+"""
@@ -0,0 +1,109 @@
+"""
+Детерминированный локальный эмбеддер вместо OpenAI для бенчмарков.
+
+Вектор текста — хэширование признаков (feature hashing): слова, пары соседних слов
+и буквенные триграммы раскладываются по координатам со знаком ±1, затем нормировка.
+Похожие тексты дают близкие векторы, а одинаковые — всегда один и тот же вектор,
+поэтому замеры повторяемы и не требуют сети и ключа API.
+
+FakeOpenAIClient повторяет нужный кусок AsyncOpenAI (embeddings.create),
+его можно подставить вместо openai_client в update_vectors.py и search_service.py.
+max_concurrency — имитация лимита OpenAI: лишние одновременные запросы получают 429 (RateLimitError).
+"""
+
+import asyncio
+import hashlib
+from types import SimpleNamespace
+from typing import List
+
+import httpx
+import numpy as np
+import openai
+
+from app.core.services.lexical_index import tokenize
+from app.core.services.search_config import EMBEDDING_DIMENSIONS
+
+
+WORD_WEIGHT = 1.0
+BIGRAM_WEIGHT = 0.5
+TRIGRAM_WEIGHT = 0.2
+
+
+def _bucket(feature: str, dims: int):
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dims, 1.0 if (value >> 63) & 1 else -1.0
+
+
+class HashEmbedder:
+    def __init__(self, dims: int = EMBEDDING_DIMENSIONS):
+        self.dims = dims
+
+    def embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        tokens = tokenize(text)
+
+        features = [(token, WORD_WEIGHT) for token in tokens]
+        features += [(f"{a} {b}", BIGRAM_WEIGHT) for a, b in zip(tokens, tokens[1:])]
+        features += [
+            (f"#{token[i:i + 3]}", TRIGRAM_WEIGHT)
+            for token in tokens
+            for i in range(max(len(token) - 2, 1))
+        ]
+
+        for feature, weight in features:
+            index, sign = _bucket(feature, self.dims)
+            vector[index] += sign * weight
+
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed(text) for text in texts]
+
+
+class _FakeEmbeddings:
+    def __init__(self, embedder: HashEmbedder, latency_ms: float, max_concurrency: int = 0):
+        self._embedder = embedder
+        self._latency = latency_ms / 1000
+        self._max_concurrency = max_concurrency
+        self._active = 0
+        self.calls = 0
+        self.texts = 0
+        self.rate_limited = 0
+
+    def _rate_limit_error(self) -> openai.RateLimitError:
+        retry_ms = max(self._latency * 1000, 10)
+        response = httpx.Response(
+            429, headers={"retry-after-ms": f"{retry_ms:.0f}"},
+            request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"),
+        )
+        return openai.RateLimitError("Rate limit reached (benchmark)", response=response, body=None)
+
+    async def create(self, model: str, input, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        self.calls += 1
+        if self._max_concurrency and self._active >= self._max_concurrency:
+            self.rate_limited += 1
+            raise self._rate_limit_error()
+
+        self.texts += len(texts)
+        self._active += 1
+        try:
+            if self._latency:
+                # Имитация сетевого запроса к OpenAI (для замеров параллельной загрузки)
+                await asyncio.sleep(self._latency)
+        finally:
+            self._active -= 1
+        vectors = self._embedder.embed_many(texts)
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=v) for i, v in enumerate(vectors)])
+
+
+class FakeOpenAIClient:
+    """Вместо AsyncOpenAI: client.embeddings.create(model=..., input=[...])."""
+
+    def __init__(self, dims: int = EMBEDDING_DIMENSIONS, latency_ms: float = 0.0, max_concurrency: int = 0):
+        self.embeddings = _FakeEmbeddings(HashEmbedder(dims), latency_ms, max_concurrency)
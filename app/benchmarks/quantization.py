@@ -0,0 +1,244 @@
+"""
+Усечение размерности и квантование векторов: сколько экономим и сколько теряем.
+
+Для каждой комбинации (размерность x формат хранения x длина префикса для перебора) замеряет:
+- размер файлов на диске (полные векторы в выбранном формате + префикс для перебора);
+- прирост RSS процесса, который открыл индекс и выполнил запросы (отдельный процесс на замер):
+  собственная память и страницы mmap-файлов отдельно;
+- задержку запроса p50/p99 (перебор + пересчёт top-k, как в exact_index.py);
+- recall@10 относительно полного float32-вектора.
+
+Векторы берутся из рабочей коллекции (--from-db) или генерируются синтетически:
+у синтетики энергия убывает к хвосту вектора, как у text-embedding-3, но цифры
+recall на ней — ориентир, а не замена замеру на реальной базе.
+
+Запуск:
+  python -m app.benchmarks.quantization
+  python -m app.benchmarks.quantization --from-db --queries 300 --chroma
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(BASE_DIR))
+
+from app.core.services.vector_codec import (
+    QUANTIZATION_MODES, dequantize_rows, normalize_rows, quantize, score_quantized, truncate_matrix,
+)
+
+
+TOP_K = 10
+RESCORE_FACTOR = 4
+DIMENSIONS = [1536, 1024, 512, 256]
+COARSE_DIMS = [0, 128, 256]      # 0 — перебор по полному вектору, без префикса
+
+
+def _rss_bytes() -> dict:
+    """
+    RSS процесса (Linux): anon — собственная память процесса, file — страницы mmap-файлов
+    (общий page cache: делится между процессами и вытесняется ОС). Нули — если /proc недоступен.
+    """
+    rss = {"anon": 0, "file": 0}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("RssAnon:", "RssFile:")):
+                    key = "anon" if line.startswith("RssAnon") else "file"
+                    rss[key] = int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return rss
+
+
+def synthetic_corpus(rows: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Кластеры товаров; дисперсия координат убывает к концу вектора."""
+    rng = np.random.default_rng(seed)
+    decay = 1.0 / np.sqrt(1.0 + np.arange(dim) / 64.0)
+    centers = rng.normal(size=(max(rows // 50, 1), dim)) * decay
+    labels = rng.integers(0, len(centers), size=rows)
+    corpus = centers[labels] + 0.35 * rng.normal(size=(rows, dim)) * decay
+    return normalize_rows(corpus.astype(np.float32))
+
+
+def load_db_corpus() -> np.ndarray:
+    import chromadb
+    from app.core.services.search_config import CHROMA_DB_PATH
+    from app.core.services.index_version import collection_name, current_index_version
+
+    collection = chromadb.PersistentClient(path=CHROMA_DB_PATH).get_collection(
+        name=collection_name(current_index_version())
+    )
+    vectors, offset = [], 0
+    while True:
+        page = collection.get(include=["embeddings"], limit=5000, offset=offset)
+        if not page["ids"]:
+            break
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+    return normalize_rows(np.vstack(vectors))
+
+
+def make_queries(corpus: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Запросы "рядом" с товарами: случайные строки базы + шум."""
+    rng = np.random.default_rng(seed)
+    rows = corpus[rng.integers(0, len(corpus), size=count)]
+    return normalize_rows(rows + 0.5 * rng.normal(size=rows.shape).astype(np.float32) / np.sqrt(corpus.shape[1]))
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> list:
+    scores = queries @ corpus.T
+    return [set(row) for row in np.argpartition(-scores, k - 1, axis=1)[:, :k]]
+
+
+def write_index(path: str, corpus: np.ndarray, dims: int, mode: str, coarse_dims: int) -> int:
+    """Файлы как у шарда exact_index.py. Возвращает размер на диске."""
+    matrix = truncate_matrix(corpus, dims)
+    quantized = quantize(matrix, mode)
+    np.save(os.path.join(path, "codes.npy"), quantized["codes"])
+    if "scale" in quantized:
+        np.save(os.path.join(path, "scale.npy"), quantized["scale"])
+    if coarse_dims:
+        np.save(os.path.join(path, "coarse.npy"), truncate_matrix(matrix, coarse_dims))
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def run_queries(path: str, queries: np.ndarray, dims: int, mode: str, coarse_dims: int, k: int) -> dict:
+    """Выполняется в отдельном процессе: чистый замер RSS открытого индекса."""
+    rss_before = _rss_bytes()
+    codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+    scale = np.load(os.path.join(path, "scale.npy"), mmap_mode="r") if mode == "int8" else None
+    coarse = np.load(os.path.join(path, "coarse.npy"), mmap_mode="r") if coarse_dims else None
+    approximate = coarse is not None or mode != "none"
+
+    queries = truncate_matrix(queries, dims)
+    coarse_queries = truncate_matrix(queries, coarse_dims) if coarse_dims else queries
+    results, latencies = [], []
+    for query, coarse_query in zip(queries, coarse_queries):
+        started = time.perf_counter()
+        # Тот же путь, что в ExactIndex.query: перебор -> кандидаты с запасом -> точный пересчёт
+        if coarse is not None:
+            scores = np.asarray(coarse @ coarse_query)
+        else:
+            scores = score_quantized(codes, scale, query[None, :])[:, 0]
+        if approximate:
+            candidates = np.sort(np.argpartition(-scores, k * RESCORE_FACTOR - 1)[:k * RESCORE_FACTOR])
+            exact = dequantize_rows(codes, scale, candidates) @ query
+            top = candidates[np.argpartition(-exact, k - 1)[:k]]
+        else:
+            top = np.argpartition(-scores, k - 1)[:k]
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([int(x) for x in top])
+
+    rss_after = _rss_bytes()
+    return {
+        "results": results,
+        "rss_anon_mb": round((rss_after["anon"] - rss_before["anon"]) / 2 ** 20, 1),
+        "rss_file_mb": round((rss_after["file"] - rss_before["file"]) / 2 ** 20, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def chroma_sizes(corpus: np.ndarray, queries: np.ndarray, truth: list, dims_list: list) -> list:
+    """Размер HNSW-индекса Chroma и задержка при разных размерностях (квантования в Chroma нет)."""
+    import chromadb
+    from chromadb.api.client import SharedSystemClient
+
+    rows = []
+    for dims in dims_list:
+        matrix = truncate_matrix(corpus, dims)
+        with tempfile.TemporaryDirectory(prefix="bench_chroma_") as path:
+            client = chromadb.PersistentClient(path=path)
+            collection = client.create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+            ids = [str(i) for i in range(len(matrix))]
+            for i in range(0, len(ids), 5000):
+                collection.add(ids=ids[i:i + 5000], embeddings=matrix[i:i + 5000].tolist())
+
+            latencies, hits = [], 0
+            for query, expected in zip(truncate_matrix(queries, dims), truth):
+                started = time.perf_counter()
+                found = collection.query(query_embeddings=[query.tolist()], n_results=TOP_K, include=[])
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += len({int(x) for x in found["ids"][0]} & expected)
+
+            size = sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+            client._system.stop()
+            SharedSystemClient.clear_system_cache()
+
+        rows.append({
+            "backend": "chroma", "dims": dims, "quantization": "none",
+            "size_mb": round(size / 2 ** 20, 1),
+            "recall_at_10": round(hits / (len(queries) * TOP_K), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Усечение размерности и квантование векторов товаров")
+    parser.add_argument("--from-db", action="store_true", help="векторы из рабочей коллекции (иначе синтетика)")
+    parser.add_argument("--rows", type=int, default=20000, help="размер синтетической базы")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--chroma", action="store_true", help="дополнительно замерить HNSW-индекс Chroma")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args()
+
+    corpus = load_db_corpus() if args.from_db else synthetic_corpus(args.rows, 1536)
+    queries = make_queries(corpus, args.queries)
+    truth = exact_top_k(corpus, queries, TOP_K)
+    dims_list = [d for d in DIMENSIONS if d <= corpus.shape[1]]
+    print(f"📊 Векторов: {len(corpus)} x {corpus.shape[1]}, запросов: {len(queries)}\n")
+
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    for dims in dims_list:
+        for mode in QUANTIZATION_MODES:
+            for coarse_dims in COARSE_DIMS:
+                if coarse_dims >= dims:
+                    continue
+                with tempfile.TemporaryDirectory(prefix="bench_quant_") as path:
+                    size = write_index(path, corpus, dims, mode, coarse_dims)
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                        measured = pool.submit(run_queries, path, queries, dims, mode, coarse_dims, TOP_K).result()
+
+                hits = sum(len(set(found) & expected) for found, expected in zip(measured.pop("results"), truth))
+                row = {
+                    "backend": "exact", "dims": dims, "quantization": mode, "coarse_dims": coarse_dims,
+                    "size_mb": round(size / 2 ** 20, 1),
+                    "recall_at_10": round(hits / (len(queries) * TOP_K), 4),
+                    **measured,
+                }
+                rows.append(row)
+                print(
+                    f"dims={dims:<5} {mode:<8} префикс={coarse_dims:<4} диск={row['size_mb']:>7.1f}MB  "
+                    f"RSS+ anon={row['rss_anon_mb']:>6.1f}MB file={row['rss_file_mb']:>6.1f}MB  p50={row['p50_ms']:>7.2f}ms  p99={row['p99_ms']:>7.2f}ms  "
+                    f"recall@10={row['recall_at_10']:.3f}"
+                )
+
+    if args.chroma:
+        print()
+        for row in chroma_sizes(corpus, queries, truth, dims_list):
+            rows.append(row)
+            print(
+                f"chroma dims={row['dims']:<5} диск={row['size_mb']:>7.1f}MB  "
+                f"p50={row['p50_ms']:>7.2f}ms  p99={row['p99_ms']:>7.2f}ms  recall@10={row['recall_at_10']:.3f}"
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Офлайн-бенчмарк загрузки и поиска: без OpenAI, без Postgres и без настоящих фидов.
+
+1. Генерирует синтетические YML-фиды (synthetic_feed.py) и раздаёт их локальным aiohttp-сервером.
+2. Подменяет OpenAI детерминированным хэш-эмбеддером (fake_embedder.py).
+3. Загружает фиды настоящим путём update_vectors.build_index во временную базу
+   (Chroma + шарды фидов + точный индекс + BM25) и публикует версию индекса, как run_update_cycle.
+4. Гоняет search_hits_many при разной селективности фильтра по магазинам:
+   один магазин, четверть магазинов, все магазины списком, без фильтра.
+
+Отчёт: скорость загрузки (товаров/с), размер индекса на диске, задержка поиска p50/p99
+и fill rate — доля запросов, которым хватило top_k уникальных товаров.
+
+Запуск:
+  python -m app.benchmarks.search_suite
+  python -m app.benchmarks.search_suite --shops 20 --offers 1000 --duplicates 0.3 --backend chroma --json before.json
+  python -m app.benchmarks.search_suite --embed-latency-ms 300 --embed-max-concurrency 3   # загрузка под лимитом OpenAI
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(BASE_DIR))
+
+
+TOP_K = 10
+
+QUERY_TEMPLATES = [
+    "{vendor} {model}",
+    "коляска {kind} {vendor}",
+    "легкая коляска {kind} до {weight} кг",
+    "коляска {kind} до {price} рублей",
+    "коляска {kind} для зимы, большие колеса",
+    "компактная коляска для самолета",
+    "коляска для бездорожья и снега",
+    "{model} {kind}",
+]
+
+
+def _dir_size(path: str) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def make_queries(catalog: list, count: int, seed: int = 2) -> list:
+    """(текст, квиз) — тексты из каталога моделей + часть запросов с ответами квиза."""
+    from app.core.services.quiz_shortlist import iter_quiz_profiles
+
+    rng = random.Random(seed)
+    profiles = list(iter_quiz_profiles())
+    queries = []
+    for _ in range(count):
+        model = rng.choice(catalog)
+        text = rng.choice(QUERY_TEMPLATES).format(
+            vendor=model["vendor"],
+            model=" ".join(model["name"].split()[-3:-1]),
+            kind=model["kind"],
+            weight=rng.choice([6, 7, 8, 10]),
+            price=rng.choice([15000, 25000, 40000, 80000]),
+        )
+        quiz = rng.choice(profiles) if profiles and rng.random() < 0.3 else None
+        queries.append((text, quiz))
+    return queries
+
+
+async def serve_feeds(feeds: dict):
+    """Локальный HTTP-сервер с фидами. Возвращает (runner, базовый URL)."""
+    from aiohttp import web
+
+    async def handler(request):
+        body = feeds.get(request.match_info["name"])
+        if body is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=body.encode("utf-8"), content_type="application/xml")
+
+    app = web.Application()
+    app.router.add_get("/feeds/{name}", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/feeds"
+
+
+async def ingest(update_vectors, feed_urls: list) -> dict:
+    """Загрузка фидов тем же путём, что run_update_cycle (без чтения магазинов из Postgres)."""
+    import aiohttp
+    from app.core.db.models import Magazine
+
+    feed_groups = {url: [Magazine(id=i, name=f"Shop {i}", feed_url=url)] for i, url in enumerate(feed_urls, 1)}
+
+    stats = update_vectors.StageStats()
+    started = time.perf_counter()
+    update_vectors.open_index_build()
+    async with aiohttp.ClientSession() as http_session:
+        entries = await update_vectors.ingest_feeds(http_session, feed_groups, stats=stats)
+    feeds_s = time.perf_counter() - started
+
+    # Остальное — как build_index в run_update_cycle (фиды уже загружены выше)
+    update_vectors.save_build_manifest(entries)
+    registry = update_vectors.build_shard_registry(feed_groups)
+    update_vectors.rebuild_lexical_index()
+    if not update_vectors.validate_build(registry):
+        raise RuntimeError("Собранная версия индекса не прошла проверку")
+    update_vectors.publish_build()
+    total_s = time.perf_counter() - started
+
+    products = update_vectors.collection.count()
+    return {
+        "products": products,
+        "feeds_s": round(feeds_s, 2),
+        "total_s": round(total_s, 2),
+        "products_per_s": round(products / feeds_s, 1) if feeds_s else None,
+        "stages": stats.as_dict(),
+    }
+
+
+async def run_searches(queries: list, selectivities: dict, top_k: int) -> list:
+    from app.core.services import search_service
+
+    # Эмбеддинги запросов — заранее (попадают в LRU-кэш): замеряем сам поиск, а не эмбеддер
+    await search_service.compose_query_vectors(queries)
+
+    rows = []
+    for label, allowed in selectivities.items():
+        latencies, full, found = [], 0, 0
+        for text, quiz in queries:
+            request = search_service.SearchRequest(text, quiz, allowed)
+            started = time.perf_counter()
+            hits = (await search_service.search_hits_many([request], top_k))[0]
+            latencies.append((time.perf_counter() - started) * 1000)
+            found += len(hits)
+            full += len(hits) >= top_k
+
+        rows.append({
+            "filter": label,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+            "fill_rate": round(full / len(queries), 3),
+            "avg_hits": round(found / len(queries), 2),
+        })
+    return rows
+
+
+async def run(args) -> dict:
+    # Переменные окружения — до импорта модулей приложения (пути и бэкенд читаются при импорте)
+    workdir = args.keep or tempfile.mkdtemp(prefix="bench_search_")
+    os.makedirs(workdir, exist_ok=True)
+    os.environ["CHROMA_DB_PATH"] = workdir
+    os.environ["SEARCH_BACKEND"] = args.backend
+    os.environ["SEARCH_SERVICE_URL"] = ""
+    os.environ.setdefault("DB_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    from app import update_vectors
+    from app.core.services import search_service
+    from app.core.services.vector_backends import close_backend
+    from app.core.services.exact_index import exact_index_dir
+    from app.benchmarks.fake_embedder import FakeOpenAIClient
+    from app.benchmarks.synthetic_feed import build_model_catalog, generate_feeds
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    fake_client = FakeOpenAIClient(latency_ms=args.embed_latency_ms, max_concurrency=args.embed_max_concurrency)
+    update_vectors.openai_client = fake_client
+    search_service.openai_client = fake_client
+
+    models = max(args.offers * args.shops // 3, 10)
+    feeds = generate_feeds(args.shops, args.offers, args.duplicates, models=models, seed=args.seed)
+    catalog = build_model_catalog(models, args.seed)
+
+    runner, base_url = await serve_feeds(feeds)
+    try:
+        ingest_report = await ingest(update_vectors, [f"{base_url}/{name}" for name in feeds])
+    finally:
+        await runner.cleanup()
+
+    exact_dir = exact_index_dir()
+    sizes = {
+        "total_mb": round(_dir_size(workdir) / 2 ** 20, 1),
+        "exact_index_mb": round(_dir_size(exact_dir) / 2 ** 20, 1) if os.path.isdir(exact_dir) else 0.0,
+    }
+
+    shop_ids = list(range(1, args.shops + 1))
+    quarter = max(args.shops // 4, 1)
+    selectivities = {f"1 из {args.shops}": shop_ids[0]}
+    if 1 < quarter < args.shops:
+        selectivities[f"{quarter} из {args.shops}"] = shop_ids[:quarter]
+    selectivities[f"{args.shops} из {args.shops}"] = shop_ids
+    selectivities["без фильтра"] = None
+    queries = make_queries(catalog, args.queries, args.seed + 1)
+    search_rows = await run_searches(queries, selectivities, args.top_k)
+    await close_backend()
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "params": {
+            "shops": args.shops, "offers": args.offers, "duplicates": args.duplicates,
+            "backend": args.backend, "queries": args.queries, "top_k": args.top_k,
+        },
+        "ingest": {
+            **ingest_report,
+            "embedding_calls": fake_client.embeddings.calls,
+            "rate_limited": fake_client.embeddings.rate_limited,
+        },
+        "index": sizes,
+        "search": search_rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк загрузки фидов и поиска")
+    parser.add_argument("--shops", type=int, default=8)
+    parser.add_argument("--offers", type=int, default=500, help="офферов в фиде одного магазина")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="доля цветовых дублей в фиде")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--backend", default="auto", choices=["auto", "chroma", "exact"])
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="имитация задержки OpenAI на запрос")
+    parser.add_argument("--embed-max-concurrency", type=int, default=0, help="имитация лимита OpenAI (0 — без лимита)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", help="папка для базы (не удалять после замера)")
+    parser.add_argument("--json", help="сохранить отчёт в файл")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    ingest_report, index = report["ingest"], report["index"]
+    print(
+        f"\n📦 Загрузка: {ingest_report['products']} товаров за {ingest_report['feeds_s']}s "
+        f"({ingest_report['products_per_s']} товаров/с), с индексами {ingest_report['total_s']}s, "
+        f"запросов к эмбеддеру: {ingest_report['embedding_calls']} (из них 429: {ingest_report['rate_limited']})"
+    )
+    for stage, row in ingest_report["stages"].items():
+        print(f"   {stage:<9} {row['units']:>10} за {row['seconds']:>6}s работы стадии -> {row['per_s']}/s")
+    print(f"💾 Индекс на диске: {index['total_mb']}MB (точный индекс {index['exact_index_mb']}MB)\n")
+    for row in report["search"]:
+        print(
+            f"{row['filter']:<12} p50={row['p50_ms']:>7.2f}ms  p99={row['p99_ms']:>7.2f}ms  "
+            f"fill rate={row['fill_rate']:.3f}  товаров в среднем={row['avg_hits']:.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
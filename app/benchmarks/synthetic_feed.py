@@ -0,0 +1,135 @@
+"""
+Синтетические YML-фиды магазинов колясок для бенчмарков.
+
+Фид устроен как настоящий (yml_catalog -> shop -> categories / offers -> offer с <param>),
+значения правдоподобны (цены, вес, колёса, механизм складывания, возраст), поэтому
+через фид проходят и product_cards.py, и product_attributes.py.
+
+- одни и те же модели есть у нескольких магазинов (общий каталог моделей);
+- duplicate_rate — доля офферов-дублей внутри фида (та же модель в другом цвете с тем же названием),
+  именно они съедают выдачу до анти-дубля и влияют на fill rate;
+- всё детерминировано от seed.
+"""
+
+import random
+from typing import Dict, List
+from xml.sax.saxutils import escape
+
+
+BRANDS = [
+    "Cybex", "Anex", "Tutis", "Bugaboo", "Joolz", "Valco Baby", "Yoya", "Babyzen", "Inglesina", "Peg Perego",
+    "Carrello", "Riko", "Espiro", "Noordline", "Adamex", "Stokke", "Thule", "Mima", "Chicco", "Jetem",
+]
+MODEL_WORDS = [
+    "Priam", "Balios", "Mia", "Fox", "Day", "Snap", "Plus", "Yoyo", "Trilogy", "Book", "Ultra", "Quadro",
+    "Alfa", "Sonic", "Aria", "Onyx", "Nova", "Orbit", "Terra", "Urban", "Sport", "Air", "Lite", "Max",
+]
+COLORS = ["черный", "серый", "бежевый", "синий", "зеленый", "графит", "оливковый", "песочный"]
+
+# Тип коляски -> (категория, механизм складывания, возраст, колёса, вес, диапазон цен)
+STROLLER_TYPES = {
+    "3 в 1": ("Коляски 3 в 1", "книжка", "с рождения", (10, 14), (11, 16), (45000, 140000)),
+    "2 в 1": ("Коляски 2 в 1", "книжка", "с рождения", (9, 13), (10, 15), (35000, 120000)),
+    "трансформер": ("Коляски-трансформеры", "книжка", "с рождения", (8, 12), (12, 17), (20000, 45000)),
+    "прогулочная": ("Прогулочные коляски", "книжка", "от 6 месяцев", (6, 9), (6, 10), (12000, 60000)),
+    "трость": ("Коляски-трости", "трость", "от 6 месяцев", (5, 7), (4.5, 8), (6000, 35000)),
+}
+DESCRIPTION_PHRASES = [
+    "Большой капюшон с окошком для наблюдения за ребенком.",
+    "Амортизация всех колес для мягкого хода по неровной дороге.",
+    "Компактно складывается одной рукой и помещается в багажник.",
+    "Подходит для путешествий, вес позволяет брать в самолет как ручную кладь.",
+    "Теплый конверт для ног и непродуваемая ткань для зимних прогулок.",
+    "Вентиляционные вставки и москитная сетка для жаркого лета.",
+    "Регулируемая ручка, вместительная корзина для покупок.",
+    "Надувные колеса для грунта, снега и бездорожья.",
+    "Легкая алюминиевая рама, маневренная на городском асфальте.",
+]
+
+
+def build_model_catalog(models: int, seed: int = 0) -> List[dict]:
+    """Общий каталог моделей, из которого магазины набирают ассортимент."""
+    rng = random.Random(seed)
+    catalog = []
+    for i in range(models):
+        kind = rng.choice(list(STROLLER_TYPES))
+        category, fold, age, wheels, weight, prices = STROLLER_TYPES[kind]
+        brand = rng.choice(BRANDS)
+        name = f"Коляска {kind} {brand} {rng.choice(MODEL_WORDS)} {rng.choice(MODEL_WORDS)} {i}"
+        catalog.append({
+            "name": name,
+            "vendor": brand,
+            "kind": kind,
+            "category": category,
+            "price": round(rng.uniform(*prices), -2),
+            "params": [
+                ("Вес коляски", f"{round(rng.uniform(*weight), 1)} кг".replace(".", ",")),
+                ("Диаметр колес", f'{rng.randint(*wheels)}"'),
+                ("Механизм складывания", fold),
+                ("Возраст", age),
+                ("Тип", kind),
+            ],
+            "description": " ".join(rng.sample(DESCRIPTION_PHRASES, 3)),
+        })
+    return catalog
+
+
+def generate_feed(
+        shop_index: int,
+        catalog: List[dict],
+        offers: int,
+        duplicate_rate: float = 0.2,
+        seed: int = 0,
+) -> str:
+    """YML-фид одного магазина: offers офферов, из них ~duplicate_rate — цветовые дубли моделей."""
+    rng = random.Random(seed * 1000 + shop_index)
+    categories = sorted({model["category"] for model in catalog})
+    category_ids = {name: i + 1 for i, name in enumerate(categories)}
+
+    rows = []
+    picked: List[dict] = []
+    for i in range(offers):
+        if picked and rng.random() < duplicate_rate:
+            model = rng.choice(picked)
+        else:
+            model = rng.choice(catalog)
+            picked.append(model)
+
+        params = [*model["params"], ("Цвет", rng.choice(COLORS))]
+        price = model["price"] * rng.uniform(0.93, 1.07)
+        rows.append(
+            f'<offer id="{shop_index}-{i}" available="true">'
+            f"<url>https://shop{shop_index}.example/product/{i}</url>"
+            f"<price>{round(price, -1):.0f}</price>"
+            f"<categoryId>{category_ids[model['category']]}</categoryId>"
+            f"<vendor>{escape(model['vendor'])}</vendor>"
+            f"<name>{escape(model['name'])}</name>"
+            f"<description>{escape(model['description'])}</description>"
+            + "".join(f'<param name="{escape(n)}">{escape(v)}</param>' for n, v in params)
+            + "</offer>"
+        )
+
+    categories_xml = "".join(f'<category id="{i}">{escape(name)}</category>' for name, i in category_ids.items())
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<yml_catalog date="2024-01-01 00:00"><shop>'
+        f"<name>Shop {shop_index}</name><url>https://shop{shop_index}.example</url>"
+        f"<categories>{categories_xml}</categories>"
+        f"<offers>{''.join(rows)}</offers>"
+        "</shop></yml_catalog>"
+    )
+
+
+def generate_feeds(
+        shops: int,
+        offers_per_shop: int,
+        duplicate_rate: float = 0.2,
+        models: int = None,
+        seed: int = 0,
+) -> Dict[str, str]:
+    """{"shop1.xml": xml, ...}. Каталог моделей по умолчанию — на треть меньше среднего фида * магазины."""
+    catalog = build_model_catalog(models or max(offers_per_shop * shops // 3, 10), seed)
+    return {
+        f"shop{i}.xml": generate_feed(i, catalog, offers_per_shop, duplicate_rate, seed)
+        for i in range(1, shops + 1)
+    }
@@ -38,6 +38,9 @@ class Magazine(Base):
     map_url: Mapped[str] = mapped_column(String(500), nullable=True)
     username_magazine: Mapped[str] = mapped_column(String(150), nullable=True)
     vk_magazine: Mapped[str] = mapped_column(String(150), nullable=True)
+    # Какие категории фида индексировать: {"include": [...], "exclude": [...]} — фрагменты названий или id категорий;
+    # NULL — только коляски (классификатор по умолчанию), {} — весь фид (см. feed_categories.py)
+    category_rules = Column(JSONB, nullable=True)
 
 
 
@@ -0,0 +1,92 @@
+"""
+Двухуровневый кэш эмбеддингов поисковых запросов.
+
+1. LRU в памяти процесса — мгновенный ответ без сети.
+2. Redis — общий для всех процессов (Telegram, VK). Вектор хранится
+   компактно: float32-байты в base64 (~8 КБ на 1536-мерный вектор вместо ~30 КБ JSON).
+
+Ключ = модель + sha1 от текста ровно в том виде, в каком он уходит в OpenAI:
+«Коляска» и «коляска» дают разные векторы, поэтому и ключи у них разные.
+Авто-запрос «Подобрать коляску» даёт ограниченный набор строк (ответы квиза),
+поэтому почти все такие запросы попадают в кэш и не ходят в OpenAI.
+"""
+
+import base64
+import hashlib
+import logging
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.core.redis_client import redis_client
+
+
+logger = logging.getLogger(__name__)
+
+LRU_MAX_SIZE = 2048              # Сколько векторов держим в памяти процесса
+REDIS_TTL = 60 * 60 * 24 * 30    # 30 дней — эмбеддинг текста со временем не меняется
+REDIS_PREFIX = "emb"
+
+_lru: "OrderedDict[str, List[float]]" = OrderedDict()
+
+
+def cache_key(text: str, model: str) -> str:
+    """Ключ кэша: emb:<модель>:<sha1 текста, который эмбеддится>."""
+    digest = hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+    return f"{REDIS_PREFIX}:{model}:{digest}"
+
+
+def _pack(vector: List[float]) -> str:
+    return base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+
+
+def _unpack(raw: str) -> List[float]:
+    vector = array("f")
+    vector.frombytes(base64.b64decode(raw))
+    return vector.tolist()
+
+
+def _lru_get(key: str) -> Optional[List[float]]:
+    vector = _lru.get(key)
+    if vector is not None:
+        _lru.move_to_end(key)
+    return vector
+
+
+def _lru_put(key: str, vector: List[float]):
+    _lru[key] = vector
+    _lru.move_to_end(key)
+    while len(_lru) > LRU_MAX_SIZE:
+        _lru.popitem(last=False)
+
+
+async def get_cached_embedding(text: str, model: str) -> Optional[List[float]]:
+    """Ищет вектор сначала в памяти, потом в Redis. None — промах."""
+    key = cache_key(text, model)
+
+    vector = _lru_get(key)
+    if vector is not None:
+        return vector
+
+    raw = await redis_client.get(key)
+    if not raw:
+        return None
+
+    try:
+        vector = _unpack(raw)
+    except Exception as e:
+        logger.warning(f"Битый эмбеддинг в Redis ({key}): {e}")
+        return None
+
+    # Поднимаем в локальный уровень, чтобы следующий раз не ходить в Redis
+    _lru_put(key, vector)
+    return vector
+
+
+async def store_embedding(text: str, model: str, vector: List[float]):
+    """Кладёт вектор в оба уровня кэша."""
+    if not vector:
+        return
+    key = cache_key(text, model)
+    _lru_put(key, vector)
+    await redis_client.set(key, _pack(vector), ex=REDIS_TTL)
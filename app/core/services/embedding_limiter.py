@@ -0,0 +1,94 @@
+"""
+Ограничитель запросов к OpenAI Embeddings при загрузке фидов.
+
+Фиды загружаются параллельно, и каждый держит несколько пачек в эмбеддинге,
+поэтому запросы к OpenAI идут через один общий EmbeddingLimiter:
+- в полёте не больше EMBEDDING_CONCURRENCY запросов на все фиды сразу;
+- 429 (RateLimitError) и временные ошибки (сеть, таймаут, 5xx) — повтор с экспоненциальной паузой и джиттером;
+  Retry-After из ответа OpenAI важнее расчётной паузы;
+- пауза после 429 общая: пока она не кончилась, новые запросы не уходят,
+  иначе параллельные запросы добивают лимит и получают 429 все вместе.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRY_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+EMBEDDING_MAX_RETRIES = 6       # Повторов одного запроса, потом ошибка уходит выше
+EMBEDDING_BACKOFF_BASE = 1.0    # Первая пауза, секунды (дальше x2 на каждый повтор)
+EMBEDDING_BACKOFF_MAX = 60.0    # Потолок паузы
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Пауза из заголовков ответа OpenAI (retry-after-ms / retry-after), если они есть."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        try:
+            value = float(headers.get(header) or 0) / scale
+        except ValueError:
+            continue
+        if value > 0:
+            return min(value, EMBEDDING_BACKOFF_MAX)
+    return None
+
+
+class EmbeddingLimiter:
+    def __init__(
+            self,
+            concurrency: int,
+            max_retries: int = EMBEDDING_MAX_RETRIES,
+            base_delay: float = EMBEDDING_BACKOFF_BASE,
+            max_delay: float = EMBEDDING_BACKOFF_MAX,
+    ):
+        self.concurrency = max(concurrency, 1)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._resume_at = 0.0   # time.monotonic(), до которого запросы не отправляются (после 429)
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0}
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        return retry_after_seconds(error) or delay
+
+    async def _cooldown(self):
+        while (delay := self._resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    async def call(self, request: Callable[[], Awaitable[T]]) -> T:
+        """
+        request() — фабрика запроса (новый запрос на каждый повтор).
+        Ошибка, которую повторять бессмысленно (нет квоты, неверный запрос), или последняя после повторов — уходит выше.
+        """
+        async with self._slots:
+            for attempt in range(self.max_retries + 1):
+                await self._cooldown()
+                self.stats["requests"] += 1
+                try:
+                    return await request()
+                except RETRY_ERRORS as e:
+                    # Кончились деньги на счёте — тоже 429, но ждать бесполезно
+                    if attempt == self.max_retries or getattr(e, "code", None) == "insufficient_quota":
+                        raise
+
+                    delay = self.backoff(attempt, e)
+                    self.stats["retries"] += 1
+                    if isinstance(e, openai.RateLimitError):
+                        self.stats["rate_limited"] += 1
+                        self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                    logger.warning(
+                        f"⏳ OpenAI Embeddings: {type(e).__name__}, повтор {attempt + 1}/{self.max_retries} через {delay:.1f}s"
+                    )
+                    await asyncio.sleep(delay)
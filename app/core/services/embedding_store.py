@@ -0,0 +1,100 @@
+"""
+Постоянное хранилище эмбеддингов по содержимому (embedding_store.sqlite3 в папке базы).
+
+Ключ — sha1(модель + текст), значение — вектор OpenAI целиком (float32, до усечения в vector_codec.py):
+- один и тот же товар с одинаковым текстом у агрегатора и у магазина-партнёра (разные фиды) эмбеддится один раз;
+- пересборка базы с нуля (пустая коллекция, другое EMBEDDING_DIMENSIONS) не ходит в OpenAI за уже виденными текстами;
+- search_service берёт отсюда фразы квиза после перезапуска бота, когда их ещё нет ни в памяти, ни в Redis.
+
+SQLite в режиме WAL: update_vectors.py пишет, процессы ботов параллельно читают.
+Хранилище — только ускорение: ошибка SQLite пишется в лог и считается промахом.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+from typing import List, Optional
+
+from app.core.services.search_config import EMBEDDING_STORE_PATH, EMBEDDING_MODEL
+
+
+logger = logging.getLogger(__name__)
+
+SQLITE_MAX_PARAMS = 500   # Ключей в одном SELECT ... IN (...)
+
+
+def store_key(text: str, model: str = EMBEDDING_MODEL) -> bytes:
+    return hashlib.sha1(f"{model}:{text}".encode("utf-8")).digest()
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(raw: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(raw)
+    return vector.tolist()
+
+
+class EmbeddingStore:
+    def __init__(self, path: str = EMBEDDING_STORE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # Одно соединение на процесс, под замком: его можно звать и из потоков (asyncio.to_thread)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL) WITHOUT ROWID"
+            )
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, texts: List[str], model: str = EMBEDDING_MODEL) -> List[Optional[List[float]]]:
+        """Векторы по текстам, None — промах."""
+        keys = [store_key(text, model) for text in texts]
+        found = {}
+        try:
+            with self._lock:
+                conn = self._connect()
+                for i in range(0, len(keys), SQLITE_MAX_PARAMS):
+                    chunk = keys[i:i + SQLITE_MAX_PARAMS]
+                    placeholders = ",".join("?" * len(chunk))
+                    found.update(conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                    ))
+        except sqlite3.Error as e:
+            logger.warning(f"Хранилище эмбеддингов недоступно ({self.path}): {e}")
+
+        return [_unpack(found[key]) if key in found else None for key in keys]
+
+    def put_many(self, texts: List[str], vectors: List[List[float]], model: str = EMBEDDING_MODEL):
+        rows = [(store_key(text, model), _pack(vector)) for text, vector in zip(texts, vectors) if vector]
+        if not rows:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось сохранить эмбеддинги ({self.path}): {e}")
+
+    def count(self) -> int:
+        try:
+            with self._lock:
+                return self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+
+embedding_store = EmbeddingStore()
@@ -0,0 +1,341 @@
+"""
+Точный (brute-force) векторный поиск по небольшим каталогам магазинов.
+
+У большинства партнёрских магазинов от сотен до нескольких тысяч товаров. Для таких размеров
+одно матрично-векторное произведение по float32-матрице (mmap) быстрее и стабильнее,
+чем отфильтрованный HNSW-запрос через SQLite/метаданные Chroma, и даёт точный top-k.
+
+Хранение (пишет update_vectors.py после загрузки каждого фида, в папку своей версии индекса — index_version.py):
+
+    index_versions/<версия>/exact_index/
+        manifest.json            — список шардов: фид, магазины, число строк, формат
+        <url_hash>.npy           — нормированные векторы товаров фида (float32/float16/int8, EXACT_QUANTIZATION)
+        <url_hash>.scale.npy     — масштаб строк для int8
+        <url_hash>.coarse.npy    — префикс векторов (EXACT_COARSE_DIMS координат, float32) для перебора
+        <url_hash>.json          — ids и метаданные в том же порядке строк
+
+Перебор идёт по короткому префиксу — в памяти (RSS) живёт в основном он. Полные векторы
+читаются из mmap только для кандидатов, чей top-k пересчитывается точно (vector_codec.py).
+"""
+
+import json
+import logging
+import os
+import shutil
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.services.index_version import artifact_path
+from app.core.services.search_config import (
+    EXACT_INDEX_DIR, EXACT_QUANTIZATION, EXACT_COARSE_DIMS, EXACT_RESCORE_FACTOR,
+)
+from app.core.services.search_filters import (
+    is_magazine_only_where, match_where, required_magazine_ids,
+)
+from app.core.services.vector_codec import (
+    dequantize_rows, normalize_rows, quantize, score_quantized, truncate_matrix,
+)
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+# Сколько масок where-фильтров помним на шард (фильтры повторяются: одни и те же магазины/квизы)
+MASK_CACHE_SIZE = 64
+
+
+def exact_index_dir(version: Optional[str] = None) -> str:
+    """Папка точного индекса версии (None — рабочей)."""
+    return artifact_path(EXACT_INDEX_DIR, version)
+
+
+def _shard_paths(index_dir: str, shard_key: str):
+    return (
+        os.path.join(index_dir, f"{shard_key}.npy"),
+        os.path.join(index_dir, f"{shard_key}.json"),
+    )
+
+
+def _extra_paths(index_dir: str, shard_key: str):
+    return (
+        os.path.join(index_dir, f"{shard_key}.scale.npy"),
+        os.path.join(index_dir, f"{shard_key}.coarse.npy"),
+    )
+
+
+def _replace_npy(path: str, array: np.ndarray):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _replace_json(path: str, data):
+    """Атомарная запись (читатели никогда не видят полузаписанный файл)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+# === Запись (update_vectors.py) ===
+
+def save_exact_shard(
+        shard_key: str,
+        source_url: str,
+        magazine_ids: List[str],
+        ids: List[str],
+        embeddings,
+        metadatas: List[dict],
+        quantization: str = EXACT_QUANTIZATION,
+        coarse_dims: int = EXACT_COARSE_DIMS,
+        version: Optional[str] = None,
+) -> dict:
+    """Сохраняет шард фида. Возвращает запись для manifest.json."""
+    index_dir = exact_index_dir(version)
+    os.makedirs(index_dir, exist_ok=True)
+    matrix_path, meta_path = _shard_paths(index_dir, shard_key)
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(ids), -1)
+    # Нормируем заранее: при поиске косинус = одно скалярное произведение
+    matrix = normalize_rows(matrix)
+
+    scale_path, coarse_path = _extra_paths(index_dir, shard_key)
+    quantized = quantize(matrix, quantization)
+    _replace_npy(matrix_path, quantized["codes"])
+    if "scale" in quantized:
+        _replace_npy(scale_path, quantized["scale"])
+
+    # Префикс имеет смысл, только если он заметно короче полного вектора
+    if not coarse_dims or coarse_dims >= matrix.shape[1]:
+        coarse_dims = 0
+    else:
+        _replace_npy(coarse_path, truncate_matrix(matrix, coarse_dims))
+    _replace_json(meta_path, {"ids": list(ids), "metadatas": list(metadatas)})
+
+    return {
+        "source_url": source_url,
+        "magazine_ids": list(magazine_ids),
+        "rows": len(ids),
+        "dim": int(matrix.shape[1]),
+        "quantization": quantization,
+        "coarse_dims": coarse_dims,
+    }
+
+
+def link_exact_shard(shard_key: str, from_version: str, to_version: str) -> bool:
+    """
+    Переносит неизменившийся шард фида из прошлой версии в новую без перезаписи:
+    жёсткие ссылки (файлы шарда не меняются на месте — только os.replace), копия — если ссылки не работают.
+    False — в прошлой версии шарда нет.
+    """
+    from_dir, to_dir = exact_index_dir(from_version), exact_index_dir(to_version)
+    paths = [*_shard_paths(from_dir, shard_key), *_extra_paths(from_dir, shard_key)]
+    if not all(os.path.exists(path) for path in paths[:2]):
+        return False
+
+    os.makedirs(to_dir, exist_ok=True)
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        target = os.path.join(to_dir, os.path.basename(path))
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)
+    return True
+
+
+def _read_manifest(index_dir: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f).get("shards", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def load_exact_manifest(version: Optional[str] = None) -> Dict[str, dict]:
+    return _read_manifest(exact_index_dir(version))
+
+
+def save_exact_manifest(shards: Dict[str, dict], version: Optional[str] = None):
+    """Записывается последним, когда все шарды цикла уже на диске."""
+    index_dir = exact_index_dir(version)
+    os.makedirs(index_dir, exist_ok=True)
+    _replace_json(os.path.join(index_dir, MANIFEST_FILE), {"shards": shards})
+
+
+# === Чтение и поиск (search_service / поисковый сервис) ===
+
+class _Shard:
+    def __init__(self, index_dir: str, key: str, info: dict):
+        matrix_path, meta_path = _shard_paths(index_dir, key)
+        # mmap: страницы подгружаются ОС по мере надобности и делятся между процессами
+        self.codes = np.load(matrix_path, mmap_mode="r")
+        scale_path, coarse_path = _extra_paths(index_dir, key)
+        self.scale = np.load(scale_path, mmap_mode="r") if info.get("quantization") == "int8" else None
+        self.coarse_dims = info.get("coarse_dims", 0)
+        self.coarse = np.load(coarse_path, mmap_mode="r") if self.coarse_dims else None
+        # Оценки перебора приблизительные — top-k нужно пересчитать по полным векторам
+        self.approximate = self.coarse is not None or self.codes.dtype != np.float32
+        with open(meta_path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.ids: List[str] = data["ids"]
+        self.metadatas: List[dict] = data["metadatas"]
+        self.magazine_ids = set(info.get("magazine_ids", []))
+        self._masks: OrderedDict = OrderedDict()
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Скалярные произведения (строк x запросов) для перебора: по префиксу, если он есть."""
+        # 🔥 Весь шард одним произведением: (строк x dim) @ (dim x запросов)
+        if self.coarse is not None:
+            return np.asarray(self.coarse @ truncate_matrix(queries, self.coarse_dims).T)
+        return score_quantized(self.codes, self.scale, queries)
+
+    def vectors(self, rows) -> np.ndarray:
+        """Полные float32-векторы строк (из mmap читаются только они)."""
+        return dequantize_rows(self.codes, self.scale, rows)
+
+    def mask(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """Булева маска строк под where. None — подходят все строки."""
+        if is_magazine_only_where(where):
+            return None  # Магазины всего шарда уже проверены в ExactIndex._select_shards
+
+        key = json.dumps(where, sort_keys=True)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.fromiter((match_where(m, where) for m in self.metadatas), dtype=bool, count=len(self.ids))
+            self._masks[key] = mask
+            if len(self._masks) > MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        else:
+            self._masks.move_to_end(key)
+        return mask
+
+
+class ExactIndex:
+    """
+    Все шарды из manifest.json рабочей версии.
+    Перечитывается, когда update_vectors.py записал новый манифест или переключил версию индекса.
+    """
+
+    def __init__(self):
+        self._shards: Dict[str, _Shard] = {}
+        self._positions: Dict[str, tuple] = {}
+        self._key: Optional[tuple] = None   # (папка версии, mtime манифеста)
+
+    def refresh(self) -> bool:
+        """Подхватывает новый манифест. False — индекса на диске нет."""
+        index_dir = exact_index_dir()
+        try:
+            key = (index_dir, os.path.getmtime(os.path.join(index_dir, MANIFEST_FILE)))
+        except OSError:
+            self._shards, self._positions, self._key = {}, {}, None
+            return False
+
+        if key != self._key:
+            shards = {}
+            for shard_key, info in _read_manifest(index_dir).items():
+                try:
+                    shards[shard_key] = _Shard(index_dir, shard_key, info)
+                except Exception as e:
+                    logger.warning(f"Шард точного индекса {shard_key} не загружен: {e}")
+            self._shards = shards
+            self._positions = {
+                product_id: (key, row)
+                for key, shard in shards.items()
+                for row, product_id in enumerate(shard.ids)
+            }
+            self._key = key
+            logger.info(f"🎯 Точный индекс загружен: {len(shards)} шардов, {len(self._positions)} товаров")
+
+        return bool(self._shards)
+
+    def reset(self):
+        self._shards, self._positions, self._key = {}, {}, None
+
+    def _select_shards(self, where: Optional[dict]) -> List[_Shard]:
+        mag_ids = required_magazine_ids(where)
+        if mag_ids is None:
+            return list(self._shards.values())
+        return [shard for shard in self._shards.values() if shard.magazine_ids & mag_ids]
+
+    def candidate_rows(self, where: Optional[dict]) -> int:
+        """Сколько строк придётся перебрать (для выбора между точным поиском и HNSW)."""
+        return sum(len(shard.ids) for shard in self._select_shards(where))
+
+    def has_ids(self, ids: List[str]) -> bool:
+        return all(product_id in self._positions for product_id in ids)
+
+    def query(self, vectors: List[List[float]], n_results: int, where: Optional[dict] = None) -> dict:
+        queries = normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+        shards = self._select_shards(where)
+        scores = []
+        for shard in shards:
+            shard_scores = shard.scores(queries)
+            mask = shard.mask(where)
+            if mask is not None:
+                shard_scores[~mask] = -np.inf
+            scores.append(shard_scores)
+
+        result = {"ids": [], "metadatas": [], "distances": []}
+        if not scores:
+            for name in result:
+                result[name] = [[] for _ in range(len(queries))]
+            return result
+
+        scores = np.vstack(scores)
+        # Номер строки в общей матрице -> (шард, строка шарда)
+        offsets = np.cumsum([0] + [len(shard.ids) for shard in shards])
+        # Перебор по префиксу/кодам — кандидатов берём с запасом: их порядок пересчитаем по полным векторам
+        approximate = any(shard.approximate for shard in shards)
+        k = min(n_results * (EXACT_RESCORE_FACTOR if approximate else 1), scores.shape[0])
+        # argpartition — O(n) отбор top-k, сортируем только его
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+
+        for q in range(scores.shape[1]):
+            candidates = []
+            for row in top[:, q]:
+                if not np.isfinite(scores[row, q]):
+                    continue  # Строка не прошла фильтр
+                shard_idx = int(np.searchsorted(offsets, row, side="right")) - 1
+                shard = shards[shard_idx]
+                local_row = int(row - offsets[shard_idx])
+                score = scores[row, q]
+                if shard.approximate:
+                    # Точный пересчёт: читаем с диска только строку кандидата
+                    score = np.dot(shard.vectors(local_row), queries[q])
+                candidates.append((float(score), shard, local_row))
+
+            candidates.sort(key=lambda item: item[0], reverse=True)
+            candidates = candidates[:n_results]
+            result["ids"].append([shard.ids[row] for _, shard, row in candidates])
+            result["metadatas"].append([shard.metadatas[row] for _, shard, row in candidates])
+            # Как в Chroma с hnsw:space=cosine: distance = 1 - косинусное сходство
+            result["distances"].append([1.0 - score for score, _, _ in candidates])
+
+        return result
+
+    def get(self, ids: List[str], include_embeddings: bool = False) -> dict:
+        found_ids, metadatas, embeddings = [], [], []
+        for product_id in ids:
+            position = self._positions.get(product_id)
+            if position is None:
+                continue
+            shard = self._shards[position[0]]
+            found_ids.append(product_id)
+            metadatas.append(shard.metadatas[position[1]])
+            if include_embeddings:
+                embeddings.append(shard.vectors(position[1]))
+
+        matrix = None
+        if include_embeddings and found_ids:
+            matrix = np.asarray(embeddings, dtype=np.float32)
+        return {"ids": found_ids, "metadatas": metadatas, "embeddings": matrix}
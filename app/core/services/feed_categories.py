@@ -0,0 +1,254 @@
+"""
+Категории YML-фида: какие ветки каталога индексировать и как категория попадает в метаданные.
+
+Фиды агрегаторов и крупных магазинов — весь детский каталог: автокресла, одежда, игрушки, запчасти.
+Раньше всё это эмбеддилось и лежало в индексе рядом с колясками: база росла, поиск по «коляске
+для новорождённого» мог вернуть конверт или дождевик. Теперь фид разбирается с учётом дерева
+<categories> (id, parentId, название):
+
+- CategoryRules — правила магазина (Magazine.category_rules, JSON):
+      {"include": ["коляск", "15"], "exclude": ["аксессуар"]}
+  элемент — фрагмент названия категории (без регистра) или точный id категории фида.
+  Путь категории проверяется от листа к корню, на каждом уровне exclude важнее include:
+  «Коляски / Аксессуары для колясок» — исключена, «Аксессуары / Коляски-трости» — включена.
+  Ничего не совпало — товар берётся, только если include пуст. {} — индексировать всё;
+  NULL — классификатор по умолчанию (DEFAULT_RULES, только коляски). В нём аксессуары исключаются,
+  только когда это главное слово названия: «Конверты в коляску» — нет, «Коляски с люлькой-конвертом» — да.
+- CategoryFilter — правила всех магазинов фида: товар индексируется, если он нужен хотя бы одному
+  (шард фида общий, все его строки принадлежат всем магазинам группы).
+  bind(дерево) -> таблица {id категории: метаданные или None — не индексировать}; её получают воркеры
+  разбора (feed_parser.parse_offer_chunk), и исключённые офферы даже не собираются в товар.
+- category_kind / product_kind — нормализованный тип (walk, modular, transformer, cradle, twin, stroller)
+  по названиям категорий, а если они общие («Коляски») или их нет — по названию товара.
+  Лежит в метаданных (category_kind) и фильтруется как fold_type (product_attributes.py).
+
+Защита от пустого индекса: если классификатор по умолчанию не нашёл в дереве фида ни одной
+коляски (названия категорий нестандартные), фид индексируется целиком, как раньше.
+Явные правила магазина не подстраховываются — они применяются как есть.
+"""
+
+import hashlib
+import json
+import logging
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Классификатор по умолчанию: ветки колясок без аксессуаров, запчастей и соседних разделов
+STROLLER_KEYWORDS = ("коляск", "stroller", "pram")
+# Кукольные и игрушечные коляски — не исключение ни при каком названии
+NON_STROLLER_KEYWORDS = ("кукол", "кукл", "игрушк", "игрушеч")
+# Аксессуары и соседние разделы — только если это главное слово названия (стоит раньше «коляск»):
+# «Сумки для колясок» — исключена, «Коляски с сумкой», «Коляски 3 в 1 с автокреслом» — коляски
+ACCESSORY_KEYWORDS = (
+    "аксессуар", "запчаст", "комплектующ", "чехл", "дождевик", "москитн", "сумк", "муфт", "конверт",
+    "подстаканник", "органайзер", "автокресл", "одежд",
+)
+
+# Тип коляски: нормализованное значение -> маркеры в названии категории или товара (порядок важен)
+CATEGORY_KINDS = (
+    ("twin", ("двойн", "погодк", "погодок", "близнец")),
+    ("modular", ("2 в 1", "3 в 1", "2в1", "3в1", "2-в-1", "3-в-1", "модульн")),
+    ("transformer", ("трансформер",)),
+    ("cradle", ("люльк",)),
+    ("walk", ("прогулоч", "трост")),
+)
+
+CATEGORY_PATH_SEPARATOR = " / "
+
+Path = List[Tuple[str, str]]   # [(id, название)] от корня к листу
+
+
+def _normalize(text: str) -> str:
+    return (text or "").lower().replace("ё", "е")
+
+
+def kind_from_text(text: str) -> Optional[str]:
+    text = _normalize(text)
+    for kind, markers in CATEGORY_KINDS:
+        if any(marker in text for marker in markers):
+            return kind
+    return None
+
+
+def category_kind(path: Path) -> Optional[str]:
+    """Тип по категориям: ближайшая к листу категория с маркером, просто «Коляски» — stroller."""
+    for _, name in reversed(path):
+        kind = kind_from_text(name)
+        if kind:
+            return kind
+    if any("коляск" in _normalize(name) for _, name in path):
+        return "stroller"
+    return None
+
+
+def product_kind(kind: Optional[str], product_name: str) -> Optional[str]:
+    """Тип товара: общий тип категории (или его отсутствие) уточняется по названию товара."""
+    if kind and kind != "stroller":
+        return kind
+    name_kind = kind_from_text(product_name)
+    if name_kind:
+        return name_kind
+    return kind or ("stroller" if "коляск" in _normalize(product_name) else None)
+
+
+class CategoryTree:
+    """Дерево <categories> фида: id -> (название, parentId)."""
+
+    def __init__(self, categories: Optional[Dict[str, Tuple[str, Optional[str]]]] = None):
+        self.categories = categories or {}
+        self._paths: Dict[str, Path] = {}
+
+    @classmethod
+    def from_xml(cls, data: bytes, encoding: str = "utf-8") -> "CategoryTree":
+        """Блок <categories>...</categories> целиком (байты из фида) -> дерево."""
+        root = ET.fromstring(b'<?xml version="1.0" encoding="' + encoding.encode("ascii") + b'"?>' + data)
+        return cls.from_element(root)
+
+    @classmethod
+    def from_element(cls, root: ET.Element) -> "CategoryTree":
+        categories = {}
+        for category in root.iter("category"):
+            category_id = category.get("id")
+            if category_id:
+                categories[category_id] = ((category.text or "").strip(), category.get("parentId"))
+        return cls(categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def path(self, category_id: str) -> Path:
+        """Путь от корня к категории; неизвестная категория — пустой путь, цикл в parentId обрывается."""
+        if category_id in self._paths:
+            return self._paths[category_id]
+
+        path, seen = [], set()
+        current = category_id
+        while current in self.categories and current not in seen:
+            seen.add(current)
+            name, parent = self.categories[current]
+            path.append((current, name))
+            current = parent
+        path.reverse()
+        self._paths[category_id] = path
+        return path
+
+
+def _items(items: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(_normalize(str(item)) for item in items if str(item).strip())
+
+
+class CategoryRules:
+    """
+    include / exclude — фрагменты названий или id категорий (exclude важнее include на одном уровне).
+    head_exclude — фрагменты, которые исключают категорию, только если стоят в названии раньше
+    совпадения с include (или include в названии нет): главное слово — аксессуар, а не коляска.
+    """
+
+    def __init__(self, include: Iterable[str] = (), exclude: Iterable[str] = (), head_exclude: Iterable[str] = ()):
+        self.include = _items(include)
+        self.exclude = _items(exclude)
+        self.head_exclude = _items(head_exclude)
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "CategoryRules":
+        """Magazine.category_rules -> правила (None — классификатор по умолчанию)."""
+        if config is None:
+            return DEFAULT_RULES
+        return cls(config.get("include") or (), config.get("exclude") or ())
+
+    @property
+    def is_default(self) -> bool:
+        return self is DEFAULT_RULES
+
+    @staticmethod
+    def _matches(items: Sequence[str], category_id: str, name: str) -> bool:
+        return any(item == category_id or item in name for item in items)
+
+    @staticmethod
+    def _first_position(items: Sequence[str], name: str) -> Optional[int]:
+        positions = [name.find(item) for item in items if item in name]
+        return min(positions) if positions else None
+
+    def _head_excluded(self, name: str) -> bool:
+        excluded_at = self._first_position(self.head_exclude, name)
+        if excluded_at is None:
+            return False
+        included_at = self._first_position(self.include, name)
+        return included_at is None or excluded_at < included_at
+
+    def keeps(self, path: Path) -> bool:
+        """Индексировать ли товар из категории с таким путём."""
+        for category_id, name in reversed(path):
+            name = _normalize(name)
+            if self._matches(self.exclude, category_id, name) or self._head_excluded(name):
+                return False
+            if self._matches(self.include, category_id, name):
+                return True
+        return not self.include
+
+    def key(self) -> dict:
+        key = {"include": sorted(self.include), "exclude": sorted(self.exclude)}
+        if self.head_exclude:
+            key["head_exclude"] = sorted(self.head_exclude)
+        return key
+
+
+DEFAULT_RULES = CategoryRules(STROLLER_KEYWORDS, NON_STROLLER_KEYWORDS, ACCESSORY_KEYWORDS)
+
+
+class CategoryFilter:
+    """Правила магазинов одного фида (товар нужен хотя бы одному из них)."""
+
+    def __init__(self, rules: Sequence[CategoryRules]):
+        self.rules = list(rules) or [DEFAULT_RULES]
+
+    @classmethod
+    def for_magazines(cls, magazines) -> "CategoryFilter":
+        return cls([CategoryRules.from_config(m.category_rules) for m in magazines])
+
+    def key(self) -> str:
+        """Отпечаток правил для feed_state: правила поменялись — фид грузится заново."""
+        raw = json.dumps(sorted(
+            (rules.key() for rules in self.rules), key=lambda k: json.dumps(k, ensure_ascii=False)
+        ), ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:10]
+
+    def bind(self, tree: CategoryTree, feed_url: str = "") -> Dict[str, Optional[dict]]:
+        """
+        Таблица для воркеров разбора: {id категории: метаданные категории или None — не индексировать}.
+        Категория, которой нет в таблице (нет <categoryId> или id вне дерева), не фильтруется.
+        """
+        paths = {category_id: tree.path(category_id) for category_id in tree.categories}
+        keep = {category_id: False for category_id in paths}
+        for rules in self.rules:
+            kept = {category_id for category_id, path in paths.items() if rules.keeps(path)}
+            if not kept and rules.is_default:
+                logger.warning(
+                    f"⚠️ Фид {feed_url}: в {len(paths)} категориях не найдено колясок — индексируем всё"
+                )
+                kept = set(paths)
+            for category_id in kept:
+                keep[category_id] = True
+
+        table = {}
+        for category_id, path in paths.items():
+            if not keep[category_id]:
+                table[category_id] = None
+                continue
+            info = {
+                "category": path[-1][1],
+                "category_path": CATEGORY_PATH_SEPARATOR.join(name for _, name in path),
+            }
+            # Товары общей ветки («Коляски») уточняются по названию в parse_offer (product_kind)
+            kind = category_kind(path)
+            if kind:
+                info["category_kind"] = kind
+            table[category_id] = info
+
+        excluded = sum(info is None for info in table.values())
+        if excluded:
+            logger.info(f"🗂 Фид {feed_url}: категорий {len(table)}, не индексируем {excluded}")
+        return table
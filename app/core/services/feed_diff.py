@@ -0,0 +1,101 @@
+"""
+Инкрементальная загрузка фидов: сверка с тем, что уже лежит в базе.
+
+У каждого товара в метаданных два хэша:
+- text_hash    — от текста для эмбеддинга (+ модель и размерность): совпал — вектор можно не пересчитывать;
+- content_hash — от текста, метаданных и магазинов фида: совпал — товар вообще не трогаем.
+
+При загрузке фида каждая пачка делится на:
+- без изменений                  -> вектор из рабочей версии копируется в новую (ни OpenAI, ни pgvector);
+- изменились только метаданные   -> старый вектор + новые метаданные (цена, наличие, магазины);
+- новый товар или новый текст    -> эмбеддинг.
+
+Новая версия индекса собирается с нуля (index_version.py), поэтому товары, которых больше нет в фиде
+(сняты с продажи, available="false"), в неё просто не попадают. Из pgvector (он без версий) они удаляются —
+но только если фид скачан и разобран полностью (FeedStream.complete).
+"""
+
+import hashlib
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.services.search_config import EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+
+
+def text_hash(text: str) -> str:
+    raw = f"{EMBEDDING_MODEL}:{EMBEDDING_DIMENSIONS}:{text}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def content_hash(product: Dict, mag_ids: List[str]) -> str:
+    raw = json.dumps(
+        {"text": product["text"], "metadata": product["metadata"], "magazines": sorted(mag_ids)},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class FeedDiff:
+    """
+    Состояние фида в базе и сверка с ним пачек из FeedStream.
+
+    known      — id -> (content_hash, text_hash) товаров, которые есть во ВСЕХ хранилищах
+                 (общая коллекция, шард фида, pgvector), только их можно пропустить;
+    stored_ids — все id фида хоть в одном хранилище (кандидаты на удаление).
+    """
+
+    def __init__(self, known: Dict[str, Tuple[Optional[str], Optional[str]]], stored_ids: Iterable[str]):
+        self.known = known
+        self.stored_ids = set(stored_ids)
+        self.seen = set()
+        self.stats = {"new": 0, "changed": 0, "metadata_only": 0, "unchanged": 0}
+
+    @classmethod
+    def from_metadatas(cls, ids: List[str], metadatas: List[dict], stored_ids: Iterable[str] = ()):
+        known = {
+            product_id: ((meta or {}).get("content_hash"), (meta or {}).get("text_hash"))
+            for product_id, meta in zip(ids, metadatas)
+        }
+        return cls(known, {*ids, *stored_ids})
+
+    def plan(
+            self, ids: List[str], products: List[Dict], mag_ids: List[str]
+    ) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+        """
+        Пачка -> (нужен эмбеддинг, старый вектор + новые метаданные, без изменений).
+        Каждому товару проставляются vector_id и хэши в метаданных.
+        """
+        to_embed, to_reuse, unchanged = [], [], []
+
+        for vector_id, product in zip(ids, products):
+            self.seen.add(vector_id)
+            product["vector_id"] = vector_id
+            new_content = content_hash(product, mag_ids)
+            new_text = text_hash(product["text"])
+            old_content, old_text = self.known.get(vector_id, (None, None))
+
+            product["metadata"]["content_hash"] = new_content
+            product["metadata"]["text_hash"] = new_text
+
+            if vector_id not in self.known:
+                self.stats["new"] += 1
+                to_embed.append(product)
+            elif old_content == new_content:
+                self.stats["unchanged"] += 1
+                unchanged.append(product)
+            elif old_text == new_text:
+                self.stats["metadata_only"] += 1
+                to_reuse.append(product)
+            else:
+                self.stats["changed"] += 1
+                to_embed.append(product)
+
+        return to_embed, to_reuse, unchanged
+
+    def vanished(self) -> List[str]:
+        """ID, которых нет в фиде (имеет смысл только после полной загрузки фида)."""
+        return sorted(self.stored_ids - self.seen)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.stats["new"] or self.stats["changed"] or self.stats["metadata_only"] or self.vanished())
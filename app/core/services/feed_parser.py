@@ -0,0 +1,505 @@
+"""
+Потоковый разбор YML-фидов.
+
+Раньше фид целиком скачивался (response.text()) и разбирался ET.fromstring —
+большой фид агрегатора лежал в памяти трижды (bytes, str, дерево элементов),
+и эмбеддинг не начинался, пока не скачан последний байт.
+
+Теперь байты из HTTP-потока (iter_chunked) сразу скармливаются XMLPullParser:
+каждый закрытый <offer> превращается в товар и удаляется из дерева,
+товары отдаются пачками по FEED_BATCH_SIZE прямо в стадию эмбеддинга.
+Пиковая память не зависит от размера фида, скачивание/разбор/эмбеддинг идут внахлёст.
+
+Запрос условный и сжатый (feed_validators.py): If-None-Match / If-Modified-Since + gzip.
+На 304 или тот же sha256, что в прошлый раз, фид не разбирается вовсе (FeedStream.not_modified).
+probe_feed — та же проверка до сборки: если не изменился ни один фид, update_vectors.py новую версию не собирает.
+
+🔥 Разбор — в пуле процессов (parse_pool, см. update_vectors.ingest_feeds): сборка text/metadata
+для десятков тысяч офферов держала event loop секундами. Теперь в loop остаётся только нарезка потока
+на целые <offer>...</offer> (OfferChunker, bytes.find), а XML и parse_offer идут в воркерах
+кусками по FEED_PARSE_CHUNK_OFFERS. Пока воркеры разбирают следующие куски, предыдущие уже эмбеддятся.
+
+🔥 Категории (feed_categories.py): блок <categories> идёт до офферов, OfferChunker вырезает его целиком,
+правила магазинов фида превращают дерево в таблицу {id категории: метаданные или None}, и воркеры
+сразу отбрасывают офферы из ненужных веток (FeedStream.excluded), а остальным пишут category / category_kind.
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import Executor
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+import aiohttp
+
+from app.core.services.product_attributes import extract_product_attributes
+from app.core.services.product_cards import build_product_card
+from app.core.services.feed_validators import conditional_headers
+from app.core.services.feed_categories import CategoryFilter, CategoryTree, product_kind
+
+
+logger = logging.getLogger(__name__)
+
+FEED_BATCH_SIZE = 100          # Товаров в пачке на эмбеддинг (один запрос в OpenAI)
+FEED_CHUNK_BYTES = 64 * 1024   # Размер куска HTTP-потока для парсера
+FEED_QUEUE_BATCHES = 4         # Сколько разобранных пачек может ждать эмбеддинга
+FEED_SPOOL_BYTES = 8 * 2 ** 20  # Фид, ждущий сверки sha256, держим в памяти до 8MB, дальше — во временном файле
+FEED_PARSE_CHUNK_OFFERS = 500  # Офферов в одном задании воркеру (одна пересылка между процессами)
+FEED_PARSE_INFLIGHT = 8        # Заданий фида в пуле одновременно (дальше скачивание ждёт разбора)
+# Общего лимита нет: большой фид качается долго, но поток не должен замолкать надолго
+FEED_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+
+
+def offer_category(offer: ET.Element, categories: Optional[Dict[str, Optional[dict]]]) -> Optional[dict]:
+    """Метаданные категории оффера по таблице CategoryFilter.bind; None — категория не индексируется."""
+    if not categories:
+        return {}
+    return categories.get((offer.findtext("categoryId") or "").strip(), {})
+
+
+def parse_offer(offer: ET.Element, category: Optional[dict] = None) -> Optional[Dict]:
+    """
+    Один <offer> -> товар {"id", "text", "metadata"}; None — недоступен или без названия/ссылки.
+    category — метаданные категории (offer_category), тип коляски уточняется по названию товара.
+    """
+    available = offer.get("available")
+    if available == "false":
+        return None
+
+    name = offer.findtext("name") or offer.findtext("model")
+    # Важно: используем raw_description, чтобы не было ошибки имени переменной
+    raw_description = offer.findtext("description") or ""
+    url = offer.findtext("url")
+    price = offer.findtext("price")
+    vendor = offer.findtext("vendor") or ""
+
+    if not (name and url):
+        return None
+
+    # --- Сбор характеристик из тегов <param> ---
+    params_list = []
+    params_pairs = []
+    for param in offer.findall("param"):
+        p_name = param.get("name")
+        p_value = param.text
+        if p_name and p_value:
+            params_list.append(f"{p_name}: {p_value}")
+            params_pairs.append((p_name, p_value))
+
+    # Собираем строку характеристик
+    params_str = "; ".join(params_list)
+
+    # Формируем "Умное описание" для AI
+    # Сначала факты (параметры), потом лирика (описание)
+    full_description = f"Характеристики: {params_str}. Описание: {raw_description}"
+
+    # Текст для Вектора. Цены в нём нет: она меняется чаще всего, а для фильтра есть price_num —
+    # смена цены не должна заставлять заново эмбеддить товар (см. feed_diff.py)
+    full_text_for_search = f"{name} {vendor} {params_str} {raw_description}".strip()
+
+    # 🔥 Категория и нормализованный тип коляски — для фильтра category_kind (product_attributes.py)
+    category = dict(category or {})
+    kind = product_kind(category.pop("category_kind", None), name)
+    if kind:
+        category["category_kind"] = kind
+
+    return {
+        "id": offer.get("id"),
+        "text": full_text_for_search,
+        "metadata": {
+            "name": name,
+            "url": url,
+            "price": price,
+            # Обрезаем описание до 3000 символов (твой новый лимит)
+            "description": full_description[:3000],
+            # 🔥 Компактная карточка для контекста LLM (ключевые параметры + короткое описание)
+            "card": build_product_card(params_pairs, raw_description),
+            **category,
+            # 🔥 Числа и нормализованные характеристики для фильтров (price_num, weight_kg, ...)
+            **extract_product_attributes(price, params_pairs)
+        }
+    }
+
+
+class OfferStreamParser:
+    """
+    Инкрементальный разбор: feed(кусок байтов) -> товары из <offer>, закрытых в этом куске.
+    Разобранный <offer> удаляется из дерева, поэтому в памяти живёт только текущий.
+    category_filter — правила категорий (feed_categories.py); None — фид целиком, без метаданных категорий.
+    """
+
+    def __init__(self, category_filter: Optional[CategoryFilter] = None):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._containers: List[ET.Element] = []  # Открытые <offers>, из которых выкидываем разобранное
+        self.category_filter = category_filter
+        self.categories: Optional[Dict[str, Optional[dict]]] = None
+
+    def feed(self, chunk: bytes) -> Iterator[Dict]:
+        self._parser.feed(chunk)
+        yield from self._drain()
+
+    def close(self) -> Iterator[Dict]:
+        self._parser.close()
+        yield from self._drain()
+
+    def _drain(self) -> Iterator[Dict]:
+        for event, elem in self._parser.read_events():
+            if elem.tag == "offers":
+                if event == "start":
+                    self._containers.append(elem)
+                elif self._containers:
+                    self._containers.pop()
+                continue
+
+            if event == "end" and elem.tag == "categories" and self.category_filter is not None:
+                self.categories = self.category_filter.bind(CategoryTree.from_element(elem))
+                continue
+
+            if event != "end" or elem.tag != "offer":
+                continue
+
+            category = offer_category(elem, self.categories)
+            product = parse_offer(elem, category) if category is not None else None
+            elem.clear()
+            if self._containers:
+                self._containers[-1].remove(elem)
+            if product:
+                yield product
+
+
+_OFFER_START = re.compile(rb"<offer[\s>]")
+_OFFER_END = b"</offer>"
+_OFFERS_END = b"</offers>"
+_CATEGORIES_START = re.compile(rb"<categories[\s>/]")
+_CATEGORIES_END = b"</categories>"
+_XML_ENCODING = re.compile(rb"""<\?xml[^>]*?encoding=["']([A-Za-z0-9._-]+)["']""")
+
+
+class OfferChunker:
+    """
+    Нарезка потока байтов фида на целые <offer>...</offer> без разбора XML (дёшево, можно в event loop).
+    Кодировка берётся из <?xml ... encoding="..."?> — воркер разбирает куски в ней же.
+    Оборванный фид (нет </offers> после последнего оффера) — ET.ParseError в close(), как у XMLPullParser.
+    categories — блок <categories>...</categories> целиком (b"" — офферы начались без него, None — ещё не дошли).
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.encoding: Optional[str] = None
+        self.categories: Optional[bytes] = None
+        self._finished = False   # После последнего оффера уже был </offers>
+
+    def feed(self, data: bytes) -> List[bytes]:
+        buffer = self._buffer
+        buffer += data
+        # Объявление <?xml ... ?> дошло целиком (или его нет: уже 1KB или начались офферы)
+        if self.encoding is None and (b"?>" in buffer[:1024] or len(buffer) >= 1024 or _OFFER_START.search(buffer)):
+            match = _XML_ENCODING.match(buffer.lstrip(b"\xef\xbb\xbf \t\r\n"))
+            self.encoding = match.group(1).decode("ascii") if match else "utf-8"
+
+        if self.categories is None:
+            start = _CATEGORIES_START.search(buffer)
+            if start is not None:
+                close = buffer.find(b">", start.start())
+                if close != -1 and buffer[close - 1:close] == b"/":
+                    self.categories = b""   # <categories/>
+                else:
+                    end = buffer.find(_CATEGORIES_END, start.start())
+                    if end == -1:
+                        return []   # Блок категорий ещё качается — копим целиком (он небольшой)
+                    self.categories = bytes(buffer[start.start():end + len(_CATEGORIES_END)])
+            elif _OFFER_START.search(buffer):
+                self.categories = b""
+
+        offers = []
+        pos = 0
+        while True:
+            start = _OFFER_START.search(buffer, pos)
+            if start is None:
+                if _OFFERS_END in buffer[pos:]:
+                    self._finished = True
+                # Хвост оставляем: в нём может начинаться следующий <offer, </offers> или <categories.
+                # Пока кодировка не известна, не режем ничего — иначе потеряется начало объявления
+                keep_from = max(pos, len(buffer) - len(b"<categories")) if self.encoding else pos
+                break
+
+            end = buffer.find(_OFFER_END, start.start())
+            if end == -1:
+                keep_from = start.start()
+                break
+            end += len(_OFFER_END)
+            offers.append(bytes(buffer[start.start():end]))
+            self._finished = False
+            pos = end
+
+        del buffer[:keep_from]
+        return offers
+
+    def close(self):
+        if _OFFER_START.search(self._buffer):
+            raise ET.ParseError("фид оборван посреди <offer>")
+        if not self._finished:
+            raise ET.ParseError("нет закрывающего </offers>: фид оборван")
+
+
+def parse_offer_chunk(
+        data: bytes,
+        encoding: str,
+        categories: Optional[Dict[str, Optional[dict]]] = None
+) -> Tuple[List[Dict], List[str], float]:
+    """
+    Разбор куска целых <offer> (задание для воркера пула): -> (товары, id офферов вне категорий, CPU-секунды).
+    Верхнего уровня и без состояния — чтобы пересылаться в другой процесс.
+    categories — таблица CategoryFilter.bind (None — без фильтра по категориям).
+    """
+    started = time.process_time()
+    root = ET.fromstring(
+        b'<?xml version="1.0" encoding="' + encoding.encode("ascii") + b'"?><offers>' + data + b"</offers>"
+    )
+    products, excluded = [], []
+    for offer in root:
+        category = offer_category(offer, categories)
+        if category is None:
+            excluded.append(offer.get("id"))
+            continue
+        product = parse_offer(offer, category)
+        if product:
+            products.append(product)
+    return products, excluded, time.process_time() - started
+
+
+def parse_offers_from_xml(xml_content, category_filter: Optional[CategoryFilter] = None) -> List[Dict]:
+    """Весь фид разом (строка или байты) — для утилит и проверок; загрузка идёт через FeedStream."""
+    parser = OfferStreamParser(category_filter)
+    try:
+        data = xml_content.encode("utf-8") if isinstance(xml_content, str) else xml_content
+        return [*parser.feed(data), *parser.close()]
+    except ET.ParseError as e:
+        logger.error(f"Ошибка парсинга XML: {e}")
+        return []
+
+
+async def probe_feed(session: aiohttp.ClientSession, url: str, validators: Optional[dict]) -> Optional[dict]:
+    """
+    Не изменился ли фид с прошлой загрузки — без разбора, до сборки новой версии индекса:
+    304 на условный запрос или тот же sha256 тела (если сервер без ETag / Last-Modified).
+    Возвращает валидаторы для сохранения (новый ETag при том же теле) или None — фид изменился
+    или проверить не удалось (тогда решает полная загрузка).
+    """
+    if not validators:
+        return None
+    headers = {"Accept-Encoding": "gzip, deflate", **conditional_headers(validators)}
+    try:
+        async with session.get(url, timeout=FEED_TIMEOUT, headers=headers) as response:
+            if response.status == 304:
+                return dict(validators)
+            if response.status != 200 or not validators.get("sha256"):
+                return None
+
+            digest = hashlib.sha256()
+            async for chunk in response.content.iter_chunked(FEED_CHUNK_BYTES):
+                digest.update(chunk)
+            if digest.hexdigest() != validators["sha256"]:
+                return None
+            return {
+                **validators,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"Не удалось проверить фид {url}: {e}")
+        return None
+
+
+class FeedStream:
+    """
+    Фид как асинхронный поток пачек товаров:
+
+        stream = FeedStream(session, url)
+        async for batch in stream.batches():
+            ...
+        if stream.complete: ...   # фид скачан и разобран до конца
+
+    complete = False — сеть/HTTP-статус/битый XML: часть пачек могла уже уйти дальше,
+    но считать фид полным (например, удалять пропавшие товары) нельзя.
+
+    validators — прошлые ETag / Last-Modified / sha256 фида (feed_validators.py).
+    not_modified = True — сервер ответил 304 или отдал те же байты: пачек не будет.
+    new_validators — что сохранить после успешной загрузки.
+
+    parse_pool — пул процессов для разбора офферов (None — поток по умолчанию, loop всё равно не блокируется).
+    download_s / parse_s — время стадий: ожидание сети и CPU воркеров на разбор.
+
+    category_filter — правила категорий магазинов фида (feed_categories.py); None — фид целиком.
+    excluded — id офферов из неиндексируемых категорий (в пачки не попадают).
+    """
+
+    def __init__(
+            self,
+            session: aiohttp.ClientSession,
+            url: str,
+            batch_size: int = FEED_BATCH_SIZE,
+            validators: Optional[dict] = None,
+            parse_pool: Optional[Executor] = None,
+            category_filter: Optional[CategoryFilter] = None
+    ):
+        self.session = session
+        self.url = url
+        self.batch_size = batch_size
+        self.validators = validators or {}
+        self.parse_pool = parse_pool
+        self.category_filter = category_filter
+        self.categories: Optional[Dict[str, Optional[dict]]] = None   # Таблица для воркеров (bind)
+        self.excluded: List[str] = []
+        self.new_validators: Dict[str, Optional[str]] = {}
+        self.not_modified = False
+        self.complete = False
+        self.offers = 0
+        self.bytes = 0
+        self.encoding = None   # Content-Encoding ответа (gzip — по сети шло сжатое тело)
+        self.download_s = 0.0
+        self.parse_s = 0.0
+
+    async def _download(self, response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+        """Куски тела из сети с учётом байтов и времени ожидания."""
+        chunks = response.content.iter_chunked(FEED_CHUNK_BYTES).__aiter__()
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                self.download_s += time.perf_counter() - started
+            self.bytes += len(chunk)
+            yield chunk
+
+    async def _body(self, response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+        """
+        Тело фида (уже распакованное aiohttp) с подсчётом sha256.
+        Прошлый хэш неизвестен — куски сразу идут в разбор.
+        Известен — фид сначала скачивается во временный файл, и разбор начинается, только если хэш другой.
+        """
+        digest = hashlib.sha256()
+        known = self.validators.get("sha256")
+
+        if not known:
+            async for chunk in self._download(response):
+                digest.update(chunk)
+                yield chunk
+            self.new_validators["sha256"] = digest.hexdigest()
+            return
+
+        with tempfile.SpooledTemporaryFile(max_size=FEED_SPOOL_BYTES) as body:
+            async for chunk in self._download(response):
+                digest.update(chunk)
+                body.write(chunk)
+
+            self.new_validators["sha256"] = digest.hexdigest()
+            if self.new_validators["sha256"] == known:
+                self.not_modified = True
+                logger.info(f"⏭ Фид {self.url} не изменился (тот же sha256)")
+                return
+
+            body.seek(0)
+            while chunk := body.read(FEED_CHUNK_BYTES):
+                yield chunk
+
+    def _bind_categories(self, block: bytes, encoding: str) -> Dict[str, Optional[dict]]:
+        """Блок <categories> фида -> таблица для воркеров; битый блок — фид без фильтра по категориям."""
+        if not block or self.category_filter is None:
+            return {}
+        try:
+            return self.category_filter.bind(CategoryTree.from_xml(block, encoding), self.url)
+        except ET.ParseError as e:
+            logger.warning(f"⚠️ Фид {self.url}: не удалось разобрать <categories> ({e}) — индексируем без фильтра")
+            return {}
+
+    async def batches(self) -> AsyncIterator[List[Dict]]:
+        chunker = OfferChunker()
+        loop = asyncio.get_running_loop()
+        # Задания в пуле по порядку фида: пачки отдаются в том же порядке, что офферы в файле
+        pending: Deque[asyncio.Future] = deque()
+        offers: List[bytes] = []
+        batch: List[Dict] = []
+        headers = {"Accept-Encoding": "gzip, deflate", **conditional_headers(self.validators)}
+
+        def submit(chunk_offers: List[bytes]):
+            pending.append(loop.run_in_executor(
+                self.parse_pool, parse_offer_chunk, b"".join(chunk_offers), chunker.encoding or "utf-8",
+                self.categories
+            ))
+
+        async def collect() -> List[List[Dict]]:
+            """Результат самого старого задания -> готовые пачки по batch_size."""
+            nonlocal batch
+            products, excluded, cpu_s = await pending.popleft()
+            self.parse_s += cpu_s
+            self.excluded.extend(excluded)
+            ready = []
+            for product in products:
+                batch.append(product)
+                if len(batch) >= self.batch_size:
+                    ready.append(batch)
+                    batch = []
+            return ready
+
+        try:
+            async with self.session.get(self.url, timeout=FEED_TIMEOUT, headers=headers) as response:
+                if response.status == 304:
+                    self.not_modified = self.complete = True
+                    self.new_validators = dict(self.validators)
+                    logger.info(f"⏭ Фид {self.url} не изменился (304)")
+                    return
+                if response.status != 200:
+                    logger.error(f"Ошибка скачивания фида {self.url}: Status {response.status}")
+                    return
+
+                self.encoding = response.headers.get("Content-Encoding")
+                self.new_validators = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+                async for chunk in self._body(response):
+                    offers.extend(chunker.feed(chunk))
+                    if self.categories is None and chunker.categories is not None:
+                        self.categories = self._bind_categories(chunker.categories, chunker.encoding or "utf-8")
+                    while len(offers) >= FEED_PARSE_CHUNK_OFFERS:
+                        submit(offers[:FEED_PARSE_CHUNK_OFFERS])
+                        del offers[:FEED_PARSE_CHUNK_OFFERS]
+
+                    # Готовое отдаём сразу; пул забит — скачивание ждёт разбора (память не растёт)
+                    while pending and (pending[0].done() or len(pending) >= FEED_PARSE_INFLIGHT):
+                        for ready in await collect():
+                            self.offers += len(ready)
+                            yield ready
+
+            if self.not_modified:
+                self.complete = True
+                return
+
+            if offers:
+                submit(offers)
+            while pending:
+                for ready in await collect():
+                    self.offers += len(ready)
+                    yield ready
+            # Целые офферы оборванного фида уже отданы, но полным он не считается
+            chunker.close()
+            self.complete = True
+        except ET.ParseError as e:
+            logger.error(f"Ошибка парсинга XML {self.url}: {e}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Ошибка соединения с {self.url}: {e}")
+        finally:
+            for future in pending:
+                future.cancel()
+
+        if batch:
+            self.offers += len(batch)
+            yield batch
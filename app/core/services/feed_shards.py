@@ -0,0 +1,87 @@
+"""
+Шарды Chroma по фидам.
+
+Кроме общей коллекции версии индекса, update_vectors.py пишет товары каждого фида
+в отдельную коллекцию strollers_<версия>_<url_hash> и ведёт реестр "шард -> магазины"
+(shard_registry.json в папке версии, см. index_version.py).
+
+Запрос по одному магазину идёт в маленький индекс его фида, а запрос по нескольким
+магазинам (PREMIUM_AGGREGATOR, TOP_SHOPS_IDS) параллельно опрашивает только нужные шарды
+и сливает top-k по дистанции. Общая коллекция остаётся для поиска по всей базе и для утилит.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from app.core.services.index_version import artifact_path, collection_name, resolve_version
+from app.core.services.search_config import SHARD_REGISTRY_FILE
+from app.core.services.search_filters import required_magazine_ids
+
+
+logger = logging.getLogger(__name__)
+
+_registry: Dict[str, dict] = {}
+_registry_key: Optional[tuple] = None   # (путь версии, mtime)
+
+
+def feed_url_hash(feed_url: str) -> str:
+    """Тот же хэш, что в ID товаров фида: feed_<url_hash>_<offer id>"""
+    return hashlib.md5(feed_url.encode()).hexdigest()[:10]
+
+
+def shard_collection_name(feed_url: str, version: Optional[str] = None) -> str:
+    return f"{collection_name(resolve_version(version))}_{feed_url_hash(feed_url)}"
+
+
+def load_shard_registry_file(version: Optional[str] = None) -> Dict[str, dict]:
+    try:
+        with open(artifact_path(SHARD_REGISTRY_FILE, version), encoding="utf-8") as f:
+            return json.load(f).get("shards", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_shard_registry(shards: Dict[str, dict], version: Optional[str] = None):
+    """Атомарная запись (читатели никогда не видят полузаписанный файл)."""
+    path = artifact_path(SHARD_REGISTRY_FILE, version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"shards": shards}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _load_registry() -> Dict[str, dict]:
+    """Лениво читает реестр рабочей версии и перечитывает его при новой записи или смене версии."""
+    global _registry, _registry_key
+
+    path = artifact_path(SHARD_REGISTRY_FILE)
+    try:
+        key = (path, os.path.getmtime(path))
+    except OSError:
+        return {}
+
+    if key != _registry_key:
+        _registry = load_shard_registry_file()
+        _registry_key = key
+
+    return _registry
+
+
+def select_shards(where: Optional[dict]) -> Optional[List[str]]:
+    """
+    Коллекции-шарды, в которых могут быть товары под этот фильтр.
+    None — фильтр не ограничен магазинами или реестра нет: искать в общей коллекции.
+    """
+    mag_ids = required_magazine_ids(where)
+    if mag_ids is None:
+        return None
+
+    registry = _load_registry()
+    if not registry:
+        return None
+
+    return [name for name, entry in registry.items() if mag_ids.intersection(entry.get("magazine_ids", []))]
@@ -0,0 +1,62 @@
+"""
+Валидаторы фидов для условных запросов (feed_validators.json в папке базы).
+
+Большинство партнёрских фидов неделями не меняются, а update_vectors.py каждый цикл
+скачивал и разбирал их целиком. Теперь для каждого feed_url хранится:
+- etag / last_modified — из ответа сервера, уходят обратно в If-None-Match / If-Modified-Since;
+  ответ 304 — фид не скачиваем и не разбираем;
+- sha256 — хэш тела фида: сервер без валидаторов (или с новым ETag на тот же файл)
+  отдал те же байты — разбор, эмбеддинг и upsert пропускаются;
+- state — модель эмбеддингов, магазины фида и их правила категорий (feed_categories.py):
+  поменялись — фид грузится заново, даже если он тот же.
+
+Валидаторы записываются только после полностью успешной загрузки фида,
+иначе следующий цикл пропустил бы фид с недогруженными товарами.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from app.core.services.search_config import FEED_VALIDATORS_PATH, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+
+
+logger = logging.getLogger(__name__)
+
+
+def feed_state(mag_ids: List[str], category_key: str = "") -> str:
+    """Всё, кроме самого фида, от чего зависят товары в базе (category_key — CategoryFilter.key())."""
+    return f"{EMBEDDING_MODEL}:{EMBEDDING_DIMENSIONS}:{','.join(sorted(mag_ids))}:{category_key}"
+
+
+def conditional_headers(validators: Optional[dict]) -> Dict[str, str]:
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def load_feed_validators() -> Dict[str, dict]:
+    try:
+        with open(FEED_VALIDATORS_PATH, encoding="utf-8") as f:
+            return json.load(f).get("feeds", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_feed_validators(feeds: Dict[str, dict]):
+    """Атомарная запись (как shard_registry.json)."""
+    tmp_path = f"{FEED_VALIDATORS_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"feeds": feeds}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, FEED_VALIDATORS_PATH)
+
+
+def forget_feed_validators(feed_url: str):
+    """Фид удалён из базы вручную (manage_chroma.py) — следующая загрузка должна быть полной."""
+    feeds = load_feed_validators()
+    if feeds.pop(feed_url, None) is not None:
+        save_feed_validators(feeds)
@@ -0,0 +1,76 @@
+"""
+Параметры HNSW-индекса коллекций товаров.
+
+- M и construction_ef задаются при создании коллекции (общая strollers и шарды фидов);
+- search_ef можно менять у живой коллекции (действует после переоткрытия базы).
+
+Значения по умолчанию — из .env (HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF).
+Если app/tune_hnsw.py подобрал настройки, они лежат в hnsw_params.json и важнее .env.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+from app.core.services.search_config import (
+    COLLECTION_METADATA, HNSW_PARAMS_PATH, HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def load_hnsw_params() -> dict:
+    """{'M': .., 'construction_ef': .., 'search_ef': ..} — результат тюнера поверх .env."""
+    params = {"M": HNSW_M, "construction_ef": HNSW_CONSTRUCTION_EF, "search_ef": HNSW_SEARCH_EF}
+    try:
+        with open(HNSW_PARAMS_PATH, encoding="utf-8") as f:
+            tuned = json.load(f)
+        params.update({key: int(tuned[key]) for key in params if key in tuned})
+    except (OSError, ValueError):
+        pass
+    return params
+
+
+def save_hnsw_params(params: dict, report: dict = None):
+    """Атомарная запись выбранных тюнером параметров (+ замеры, чтобы было видно, откуда они)."""
+    data = {
+        "M": int(params["M"]),
+        "construction_ef": int(params["construction_ef"]),
+        "search_ef": int(params["search_ef"]),
+        "tuned_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **(report or {}),
+    }
+    tmp_path = f"{HNSW_PARAMS_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, HNSW_PARAMS_PATH)
+
+
+def collection_metadata(params: dict = None) -> dict:
+    """Метаданные для get_or_create_collection: метрика + параметры HNSW."""
+    params = params or load_hnsw_params()
+    return {
+        **COLLECTION_METADATA,
+        "hnsw:M": params["M"],
+        "hnsw:construction_ef": params["construction_ef"],
+        "hnsw:search_ef": params["search_ef"],
+    }
+
+
+def apply_search_ef(collection, search_ef: int = None):
+    """
+    Меняет search_ef у уже созданной коллекции (M и construction_ef — только при пересоздании).
+    Старые версии Chroma не умеют менять конфигурацию (нет configuration / аргумента modify) —
+    тогда предупреждение в лог, коллекция ищет с search_ef из своих метаданных.
+    Остальные ошибки (неверный ключ или значение) уходят выше: подобранный тюнером search_ef не должен теряться молча.
+    """
+    search_ef = search_ef or load_hnsw_params()["search_ef"]
+    try:
+        current = (collection.configuration or {}).get("hnsw") or {}
+        if current.get("ef_search") != search_ef:
+            collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+            logger.info(f"⚙️ {collection.name}: search_ef = {search_ef}")
+    except (AttributeError, TypeError) as e:
+        logger.warning(f"⚠️ {collection.name}: Chroma не поддерживает смену search_ef ({e}), {search_ef} не применён")
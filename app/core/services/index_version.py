@@ -0,0 +1,166 @@
+"""
+Версии индекса (blue/green) и атомарное переключение читателей.
+
+Раньше update_vectors.py писал прямо в коллекцию, по которой в этот момент искал бот:
+долгое обновление показывало смесь старых и новых товаров, а запись конкурировала с поиском.
+Теперь каждый цикл собирает новую версию рядом с рабочей:
+
+    коллекции Chroma    strollers_<версия>, strollers_<версия>_<url_hash> (шарды фидов)
+    файлы               index_versions/<версия>/ (exact_index/, lexical_index.json,
+                        quiz_shortlists.json, shard_registry.json)
+
+проверяет её и только потом атомарно переписывает указатель index_version.json.
+Читатели (search_service, поисковый сервис) сверяют указатель на каждом запросе
+(os.stat, как с остальными файлами индекса) и переходят на новую версию без перезапуска.
+Всё, что закэшировано по содержимому индекса, привязано к версии.
+
+LEGACY_VERSION ("") — индекс до перехода на версии: коллекция strollers и файлы в корне папки базы.
+Первая сборка читает его как предыдущую версию, после следующей он удаляется.
+
+Chroma (1.5) при delete_collection удаляет записи о коллекции из chroma.sqlite3, но не папку
+её HNSW-сегмента (<uuid>/ в корне базы). После удаления версий такие папки убирает
+remove_orphan_segment_dirs(), иначе каждая сборка оставляла бы на диске полную копию индекса.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import time
+from typing import List, Optional
+
+from app.core.services.search_config import (
+    CHROMA_DB_PATH, COLLECTION_NAME, INDEX_VERSION_PATH, INDEX_VERSIONS_PATH,
+    QUIZ_SHORTLISTS_FILE, SHARD_REGISTRY_FILE, LEXICAL_INDEX_FILE, EXACT_INDEX_DIR,
+)
+
+
+logger = logging.getLogger(__name__)
+
+LEGACY_VERSION = ""
+VERSION_FILES = (QUIZ_SHORTLISTS_FILE, SHARD_REGISTRY_FILE, LEXICAL_INDEX_FILE, EXACT_INDEX_DIR)
+# strollers, strollers_<url_hash> — без версии; strollers_v<дата>, strollers_v<дата>_<url_hash> — версия
+_COLLECTION_RE = re.compile(rf"^{COLLECTION_NAME}(?:_(v\d{{14}}))?(?:_[0-9a-f]{{10}})?$")
+_SEGMENT_DIR_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+_pointer: dict = {}
+_pointer_mtime: Optional[float] = None
+
+
+def new_index_version() -> str:
+    return time.strftime("v%Y%m%d%H%M%S")
+
+
+def collection_name(version: str) -> str:
+    return f"{COLLECTION_NAME}_{version}" if version else COLLECTION_NAME
+
+
+def collection_version(name: str) -> Optional[str]:
+    """Версия, которой принадлежит коллекция товаров (или шард). None — чужая коллекция."""
+    match = _COLLECTION_RE.match(name)
+    if match is None:
+        return None
+    return match.group(1) or LEGACY_VERSION
+
+
+def version_dir(version: str) -> str:
+    return os.path.join(INDEX_VERSIONS_PATH, version) if version else CHROMA_DB_PATH
+
+
+def load_index_pointer() -> dict:
+    try:
+        with open(INDEX_VERSION_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index_pointer(version: str, history: List[str], **info):
+    """Атомарное переключение: читатели видят либо старую версию, либо новую целиком."""
+    payload = {"version": version, "history": history, "switched_at": int(time.time()), **info}
+    tmp_path = f"{INDEX_VERSION_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, INDEX_VERSION_PATH)
+
+
+def current_index_version() -> str:
+    """Рабочая версия по указателю (перечитывается, когда update_vectors.py переключил версию)."""
+    global _pointer, _pointer_mtime
+
+    try:
+        mtime = os.path.getmtime(INDEX_VERSION_PATH)
+    except OSError:
+        return LEGACY_VERSION
+
+    if mtime != _pointer_mtime:
+        pointer = load_index_pointer()
+        if pointer:
+            _pointer, _pointer_mtime = pointer, mtime
+    return _pointer.get("version", LEGACY_VERSION)
+
+
+def resolve_version(version: Optional[str]) -> str:
+    """None — рабочая версия (читатели), строка — конкретная версия (сборка в update_vectors.py)."""
+    return current_index_version() if version is None else version
+
+
+def artifact_path(name: str, version: Optional[str] = None) -> str:
+    """Путь к файлу (или папке) индекса в версии: artifact_path(LEXICAL_INDEX_FILE)."""
+    return os.path.join(version_dir(resolve_version(version)), name)
+
+
+def remove_version_files(version: str):
+    """Файлы версии. У версии без номера — только файлы индекса в корне (остальное там общее)."""
+    if version:
+        shutil.rmtree(version_dir(version), ignore_errors=True)
+        return
+
+    for name in VERSION_FILES:
+        path = artifact_path(name, LEGACY_VERSION)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def list_version_dirs() -> List[str]:
+    """Версии, у которых есть файлы на диске (LEGACY_VERSION — если в корне остались файлы старого индекса)."""
+    try:
+        versions = sorted(name for name in os.listdir(INDEX_VERSIONS_PATH) if re.fullmatch(r"v\d{14}", name))
+    except OSError:
+        versions = []
+    if any(os.path.exists(artifact_path(name, LEGACY_VERSION)) for name in VERSION_FILES):
+        versions.insert(0, LEGACY_VERSION)
+    return versions
+
+
+def remove_orphan_segment_dirs(chroma_path: str = CHROMA_DB_PATH) -> int:
+    """
+    Папки сегментов удалённых коллекций: <uuid>/ в корне базы, которых больше нет в таблице segments.
+    Звать после delete_collection. Возвращает, сколько папок удалено.
+    """
+    db_path = os.path.join(chroma_path, "chroma.sqlite3")
+    if not os.path.exists(db_path):
+        return 0
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+        try:
+            live = {row[0] for row in conn.execute("SELECT id FROM segments")}
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Не удалось прочитать сегменты Chroma ({db_path}): {e}")
+        return 0
+
+    removed = 0
+    for name in os.listdir(chroma_path):
+        path = os.path.join(chroma_path, name)
+        if _SEGMENT_DIR_RE.match(name) and name not in live and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    if removed:
+        logger.info(f"🧹 Удалено папок сегментов удалённых коллекций: {removed}")
+    return removed
@@ -0,0 +1,144 @@
+"""
+Локальный лексический индекс (BM25) по тем же документам, что лежат в ChromaDB.
+
+Зачем:
+- точные названия моделей и брендов ("Cybex Balios") эмбеддинги ранжируют плохо,
+  а инвертированный индекс находит их за миллисекунды и без запроса в OpenAI;
+- если OpenAI недоступен, поиск по каталогу продолжает работать.
+
+Индекс строит update_vectors.py после обновления базы и кладёт рядом с chromadb_storage.
+Результаты смешиваются с векторными через Reciprocal Rank Fusion (RRF).
+"""
+
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.services.index_version import artifact_path
+from app.core.services.search_config import LEXICAL_INDEX_FILE
+from app.core.services.search_filters import MagazineIds, normalize_magazine_ids
+
+
+logger = logging.getLogger(__name__)
+
+# Стандартные параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Название товара важнее описания — его токены считаем несколько раз
+NAME_BOOST = 3
+# Константа RRF: чем больше, тем меньше разница между соседними местами
+RRF_K = 60
+
+_index: dict = {}
+_index_key: Optional[tuple] = None   # (путь версии, mtime)
+
+
+def tokenize(text: str) -> List[str]:
+    """'Cybex Balios S Lux, 2в1' -> ['cybex', 'balios', 'lux', '2в1']"""
+    text = (text or "").lower().replace("ё", "е")
+    return [token for token in re.findall(r"\w+", text) if len(token) > 1]
+
+
+def build_lexical_index(ids: List[str], documents: List[str], metadatas: List[dict]) -> dict:
+    """Собирает инвертированный индекс: термин -> [[номер документа, частота], ...]."""
+    postings: Dict[str, List[List[int]]] = defaultdict(list)
+    doc_len = []
+    doc_mags = []
+
+    for doc_idx, (document, meta) in enumerate(zip(documents, metadatas)):
+        meta = meta or {}
+        tokens = tokenize(meta.get("name", "")) * NAME_BOOST + tokenize(document)
+        doc_len.append(len(tokens))
+        doc_mags.append([x for x in meta.get("magazine_ids_str", "").split(",") if x])
+
+        for term, tf in Counter(tokens).items():
+            postings[term].append([doc_idx, tf])
+
+    return {
+        "doc_ids": list(ids),
+        "doc_len": doc_len,
+        "doc_mags": doc_mags,
+        "avgdl": (sum(doc_len) / len(doc_len)) if doc_len else 0.0,
+        "postings": postings,
+    }
+
+
+def save_lexical_index(index: dict, version: Optional[str] = None):
+    """Атомарная запись (читатели никогда не видят полузаписанный файл)."""
+    path = artifact_path(LEXICAL_INDEX_FILE, version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _load_index() -> dict:
+    """Лениво читает индекс рабочей версии и перечитывает его при новой записи или смене версии."""
+    global _index, _index_key
+
+    path = artifact_path(LEXICAL_INDEX_FILE)
+    try:
+        key = (path, os.path.getmtime(path))
+    except OSError:
+        return {}
+
+    if key != _index_key:
+        try:
+            with open(path, encoding="utf-8") as f:
+                _index = json.load(f)
+            _index_key = key
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать лексический индекс: {e}")
+            return {}
+
+    return _index
+
+
+def search_lexical(
+        query: str,
+        allowed_magazine_ids: MagazineIds = None,
+        limit: int = 20,
+) -> List[Tuple[str, float]]:
+    """BM25-поиск: [(id товара, score), ...] по убыванию score."""
+    index = _load_index()
+    terms = set(tokenize(query))
+    if not index or not terms:
+        return []
+
+    doc_ids = index["doc_ids"]
+    doc_len = index["doc_len"]
+    doc_mags = index["doc_mags"]
+    avgdl = index["avgdl"] or 1.0
+    postings = index["postings"]
+    n_docs = len(doc_ids)
+    allowed = set(normalize_magazine_ids(allowed_magazine_ids))
+
+    scores: Dict[int, float] = defaultdict(float)
+    for term in terms:
+        term_postings = postings.get(term)
+        if not term_postings:
+            continue
+
+        idf = math.log(1 + (n_docs - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+        for doc_idx, tf in term_postings:
+            if allowed and not allowed.intersection(doc_mags[doc_idx]):
+                continue
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[doc_idx] / avgdl)
+            scores[doc_idx] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [(doc_ids[doc_idx], score) for doc_idx, score in best]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[str]:
+    """Смешивает несколько ранжированных списков ID: score = сумма 1 / (k + место)."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, product_id in enumerate(ranking, start=1):
+            scores[product_id] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
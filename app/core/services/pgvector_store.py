@@ -0,0 +1,221 @@
+"""
+Векторы товаров в Postgres (расширение pgvector) — альтернатива ChromaDB.
+
+Chroma PersistentClient — файловая база на одной машине: реплики бота на разных хостах
+не могут искать по одному индексу. В Postgres таблица product_vectors (миграция 5b2f8e41c9d3)
+доступна всем репликам через общий пул app.core.db.config.engine:
+
+- embedding    vector(1536) + HNSW-индекс (vector_cosine_ops);
+- magazine_ids INTEGER[] + GIN-индекс — фильтр по магазинам в том же SQL-запросе;
+- metadata     JSONB — те же метаданные, что пишутся в Chroma.
+
+Фильтры приходят в синтаксисе Chroma (search_filters.py) и переводятся в SQL здесь.
+"""
+
+import json
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from app.core.services.search_filters import is_magazine_only_where, required_magazine_ids
+
+
+_MAG_PREFIX = "mag_"
+_SQL_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+UPSERT_SQL = text("""
+    INSERT INTO product_vectors (id, embedding, magazine_ids, source_url, metadata, document, updated_at)
+    VALUES (:id, CAST(CAST(:embedding AS TEXT) AS vector), CAST(:magazine_ids AS INTEGER[]), :source_url,
+            CAST(:metadata AS JSONB), :document, now())
+    ON CONFLICT (id) DO UPDATE SET
+        embedding = EXCLUDED.embedding,
+        magazine_ids = EXCLUDED.magazine_ids,
+        source_url = EXCLUDED.source_url,
+        metadata = EXCLUDED.metadata,
+        document = EXCLUDED.document,
+        updated_at = now()
+""")
+
+
+def vector_literal(vector) -> str:
+    """[0.1, 0.2] -> '[0.1,0.2]' (текстовый формат типа vector)"""
+    # Передаём текстом и приводим в SQL: у asyncpg нет встроенного кодека для типа vector
+    return "[" + ",".join(f"{float(x):.7g}" for x in vector) + "]"
+
+
+def parse_vector(raw) -> np.ndarray:
+    """'[0.1,0.2]' из Postgres -> np.ndarray"""
+    return np.asarray(json.loads(raw) if isinstance(raw, str) else raw, dtype=np.float32)
+
+
+def _mag_id(key: str) -> int:
+    return int(key[len(_MAG_PREFIX):])
+
+
+def where_to_sql(where: Optional[dict], params: dict) -> str:
+    """
+    where-фильтр Chroma -> условие SQL. Значения уходят в params (без подстановки в строку).
+    Флаги магазинов превращаются в условие по magazine_ids (работает GIN-индекс).
+    """
+    if not where:
+        return "TRUE"
+
+    if is_magazine_only_where(where):
+        name = f"p{len(params)}"
+        params[name] = sorted(int(x) for x in required_magazine_ids(where))
+        return f"magazine_ids && CAST(:{name} AS INTEGER[])"
+
+    clauses = []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(where_to_sql(sub, params) for sub in condition) + ")")
+            continue
+
+        if key.startswith(_MAG_PREFIX) and condition is True:
+            name = f"p{len(params)}"
+            params[name] = [_mag_id(key)]
+            clauses.append(f"magazine_ids @> CAST(:{name} AS INTEGER[])")
+            continue
+
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        for op, arg in condition.items():
+            name = f"p{len(params)}"
+            if op in ("$in", "$nin"):
+                params[name] = [json.dumps(x, ensure_ascii=False) for x in arg]
+                negate = "NOT " if op == "$nin" else ""
+                clauses.append(f"{negate}(metadata -> '{_safe_key(key)}')::text = ANY(CAST(:{name} AS TEXT[]))")
+            elif isinstance(arg, (int, float)) and not isinstance(arg, bool):
+                params[name] = float(arg)
+                clauses.append(f"(metadata ->> '{_safe_key(key)}')::float {_SQL_OPERATORS[op]} :{name}")
+            else:
+                # Строки и булевы значения сравниваем как JSON
+                params[name] = json.dumps(arg, ensure_ascii=False)
+                clauses.append(f"metadata -> '{_safe_key(key)}' {_SQL_OPERATORS[op]} CAST(:{name} AS JSONB)")
+
+    return " AND ".join(clauses) or "TRUE"
+
+
+def _safe_key(key: str) -> str:
+    """Имя поля метаданных попадает в SQL как литерал — пускаем только \\w."""
+    if not key.replace("_", "").isalnum():
+        raise ValueError(f"Недопустимое имя поля фильтра: {key}")
+    return key
+
+
+def _load_meta(raw) -> dict:
+    return raw if isinstance(raw, dict) else json.loads(raw or "{}")
+
+
+async def query_vectors(conn, vectors: List[List[float]], n_results: int, where: Optional[dict] = None) -> dict:
+    """Ответ в формате Chroma. Один SQL-запрос на вектор, все в одном соединении."""
+    params: Dict = {}
+    condition = where_to_sql(where, params)
+    sql = text(f"""
+        SELECT id, metadata, embedding <=> CAST(CAST(:query AS TEXT) AS vector) AS distance
+        FROM product_vectors
+        WHERE {condition}
+        ORDER BY embedding <=> CAST(CAST(:query AS TEXT) AS vector)
+        LIMIT :limit
+    """)
+
+    result = {"ids": [], "metadatas": [], "distances": []}
+    for vector in vectors:
+        rows = (await conn.execute(sql, {**params, "query": vector_literal(vector), "limit": n_results})).all()
+        result["ids"].append([row.id for row in rows])
+        result["metadatas"].append([_load_meta(row.metadata) for row in rows])
+        result["distances"].append([float(row.distance) for row in rows])
+    return result
+
+
+async def get_vectors(conn, ids: List[str], include_embeddings: bool = False) -> dict:
+    columns = "id, metadata, embedding::text AS embedding" if include_embeddings else "id, metadata"
+    rows = (await conn.execute(
+        text(f"SELECT {columns} FROM product_vectors WHERE id = ANY(CAST(:ids AS VARCHAR[]))"),
+        {"ids": list(ids)},
+    )).all()
+
+    embeddings = None
+    if include_embeddings and rows:
+        embeddings = np.vstack([parse_vector(row.embedding) for row in rows])
+    return {
+        "ids": [row.id for row in rows],
+        "metadatas": [_load_meta(row.metadata) for row in rows],
+        "embeddings": embeddings,
+    }
+
+
+def upsert_rows(
+        ids: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[dict],
+        documents: List[str],
+        magazine_ids: List[str],
+        source_url: str,
+) -> List[Dict]:
+    """Параметры для UPSERT_SQL (executemany)."""
+    mags = [int(x) for x in magazine_ids]
+    return [
+        {
+            "id": product_id,
+            "embedding": vector_literal(embedding),
+            "magazine_ids": mags,
+            "source_url": source_url,
+            "metadata": json.dumps(meta, ensure_ascii=False),
+            "document": document,
+        }
+        for product_id, embedding, meta, document in zip(ids, embeddings, metadatas, documents)
+    ]
+
+
+async def upsert_vectors(engine, rows: List[Dict]):
+    async with engine.begin() as conn:
+        await conn.execute(UPSERT_SQL, rows)
+
+
+async def load_feed_ids(engine, source_url: str) -> set:
+    """ID товаров фида, которые уже лежат в таблице (для сверки при инкрементальной загрузке)."""
+    async with engine.connect() as conn:
+        rows = (await conn.execute(
+            text("SELECT id FROM product_vectors WHERE source_url = :source_url"), {"source_url": source_url}
+        )).all()
+    return {row.id for row in rows}
+
+
+async def count_vectors(engine, source_urls: Iterable[str]) -> int:
+    """Строк таблицы от этих фидов (сверка с рабочей версией Chroma)."""
+    async with engine.connect() as conn:
+        return (await conn.execute(
+            text("SELECT count(*) FROM product_vectors WHERE source_url = ANY(CAST(:urls AS VARCHAR[]))"),
+            {"urls": list(source_urls)},
+        )).scalar_one()
+
+
+DELETE_SQL = text("DELETE FROM product_vectors WHERE id = ANY(CAST(:ids AS VARCHAR[]))")
+
+
+async def delete_vectors(engine, ids: List[str]):
+    if not ids:
+        return
+    async with engine.begin() as conn:
+        await conn.execute(DELETE_SQL, {"ids": list(ids)})
+
+
+async def apply_vector_changes(engine, delete_ids: Iterable[str], upsert_pages: AsyncIterator[List[Dict]]) -> int:
+    """
+    Удаления и upsert (страницами upsert_rows) одной транзакцией: до COMMIT читатели видят
+    прежний каталог, после — новый целиком. Возвращает число записанных строк.
+    """
+    written = 0
+    async with engine.begin() as conn:
+        delete_ids = list(delete_ids)
+        if delete_ids:
+            await conn.execute(DELETE_SQL, {"ids": delete_ids})
+        async for rows in upsert_pages:
+            if rows:
+                await conn.execute(UPSERT_SQL, rows)
+                written += len(rows)
+    return written
@@ -0,0 +1,297 @@
+"""
+Типизированные характеристики товаров и жёсткие условия из запроса.
+
+В фиде цена и <param> — просто строки, поэтому «до 30 000 рублей» или «вес до 7 кг»
+раньше учитывались только через эмбеддинг (то есть почти никак).
+
+Теперь:
+- update_vectors.py при загрузке фида кладёт в метаданные числа и нормализованные значения
+  (price_num, weight_kg, wheel_inch, fold_type, age_from_months) — extract_product_attributes(),
+  и тип коляски по категории фида (category_kind, feed_categories.py);
+- search_service вытаскивает из текста юзера и ответов квиза условия (parse_query_constraints,
+  quiz_constraints) и добавляет их к where-фильтру по магазинам — векторный поиск идёт
+  только среди подходящих товаров;
+- если под условия попало слишком мало товаров, условия ослабляются по одному
+  (relax_constraints): сначала «мягкие» характеристики, цена — последней.
+
+Поля, которые не удалось разобрать, в метаданные не пишутся (Chroma не хранит None):
+товар без поля не проходит фильтр по нему — отсюда и ослабление условий.
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# === 1. ХАРАКТЕРИСТИКИ ТОВАРА (при загрузке фида) ===
+
+# Механизм складывания: нормализованное значение -> маркеры в тексте <param>
+FOLD_TYPES = {
+    "cane": ("трост",),
+    "book": ("книжк",),
+}
+
+# Вес коляски, а не ребёнка / допустимой нагрузки / упаковки
+_WEIGHT_EXCLUDE = ("ребен", "ребён", "нагруз", "макс", "допуст", "упаков", "брутто", "корзин")
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def _to_float(raw: str) -> Optional[float]:
+    match = _NUMBER_RE.search((raw or "").replace(" ", "").replace(" ", ""))
+    if not match:
+        return None
+    return float(match.group().replace(",", "."))
+
+
+def parse_price(raw: Optional[str]) -> Optional[float]:
+    """'12 990.00' -> 12990.0"""
+    value = _to_float(raw)
+    return value if value and value > 0 else None
+
+
+def parse_weight_kg(raw: str) -> Optional[float]:
+    """'7,5 кг' -> 7.5; '7500 г' -> 7.5. Неправдоподобные значения отбрасываем."""
+    value = _to_float(raw)
+    if value is None:
+        return None
+    text = raw.lower()
+    if re.search(r"\d\s*(г|гр|грамм)\b", text) and "кг" not in text:
+        value /= 1000
+    return round(value, 2) if 1 <= value <= 40 else None
+
+
+def parse_wheel_inch(raw: str) -> Optional[float]:
+    """'10"' / '10 дюймов' -> 10; '25 см' -> 9.8; '250 мм' -> 9.8. Берём наибольшее колесо."""
+    text = raw.lower().replace(",", ".")
+    numbers = [float(x) for x in re.findall(r"\d+(?:\.\d+)?", text)]
+    if not numbers:
+        return None
+    value = max(numbers)
+    if "мм" in text or value > 60:
+        value /= 25.4
+    elif "см" in text or value > 20:
+        value /= 2.54
+    return round(value, 1) if 3 <= value <= 20 else None
+
+
+def parse_fold_type(raw: str) -> Optional[str]:
+    text = raw.lower()
+    for fold_type, markers in FOLD_TYPES.items():
+        if any(marker in text for marker in markers):
+            return fold_type
+    return None
+
+
+def parse_age_from_months(raw: str) -> Optional[int]:
+    """'с рождения' -> 0; 'от 6 месяцев до 3 лет' -> 6; '0-36 мес' -> 0."""
+    text = raw.lower()
+    if "рожд" in text:
+        return 0
+    match = re.search(r"(\d+(?:[.,]\d+)?)\s*(?:-|–|до)?\s*(?:\d+\s*)?(мес|год|лет)", text)
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", "."))
+    months = value if match.group(2) == "мес" else value * 12
+    return int(months) if 0 <= months <= 48 else None
+
+
+def extract_product_attributes(price: Optional[str], params: Sequence[Tuple[str, str]]) -> Dict:
+    """
+    Типизированные поля для метаданных товара (только те, что удалось разобрать).
+    Пример: {"price_num": 24990.0, "weight_kg": 7.2, "wheel_inch": 8.0, "fold_type": "book", "age_from_months": 6}
+    """
+    attributes = {}
+
+    price_num = parse_price(price)
+    if price_num is not None:
+        attributes["price_num"] = price_num
+
+    for p_name, p_value in params:
+        name = p_name.lower()
+
+        if "weight_kg" not in attributes and "вес" in name and not any(x in name for x in _WEIGHT_EXCLUDE):
+            weight = parse_weight_kg(p_value)
+            if weight is not None:
+                attributes["weight_kg"] = weight
+
+        elif "wheel_inch" not in attributes and ("колес" in name or "колёс" in name) and (
+                "диаметр" in name or "размер" in name):
+            wheel = parse_wheel_inch(p_value)
+            if wheel is not None:
+                attributes["wheel_inch"] = wheel
+
+        elif "fold_type" not in attributes and ("склад" in name or "механизм" in name):
+            fold_type = parse_fold_type(p_value)
+            if fold_type is not None:
+                attributes["fold_type"] = fold_type
+
+        elif "age_from_months" not in attributes and "возраст" in name:
+            age = parse_age_from_months(p_value)
+            if age is not None:
+                attributes["age_from_months"] = age
+
+    return attributes
+
+
+# === 2. УСЛОВИЯ ИЗ ЗАПРОСА И КВИЗА ===
+# Условия — плоский словарь: {"price_max": 30000, "weight_max": 7, "fold_type": "cane", ...}
+
+# Порядок ослабления: первыми убираем то, что юзер скорее простит
+RELAXATION_ORDER = ("category", "wheel_min", "fold_type", "age_max", "weight_max", "price_min", "price_max")
+
+# Тип коляски из запроса -> category_kind товара. Только однозначные формулировки:
+# «с люлькой» бывает и у модульной, «трость» — это fold_type
+QUERY_CATEGORY_KINDS = (
+    ("twin", ("двойн", "погодк", "погодок", "близнец")),
+    ("modular", ("2 в 1", "3 в 1", "2в1", "3в1", "2-в-1", "3-в-1", "модульн")),
+    ("transformer", ("трансформер",)),
+    ("walk", ("прогулоч",)),
+)
+
+# Ответы квиза, которые однозначно задают характеристику (подтип прогулочной коляски)
+QUIZ_CONSTRAINTS = {
+    "stroller_folds_like_a_cane": {"fold_type": "cane"},
+    "The_child's_age_is_from_6_months": {"fold_type": "book"},
+}
+
+# Число (тысячи можно разделять пробелом: «30 000») и множитель: «тыс», «т.р.», «к» вплотную к числу («30к»)
+# или отдельное «к» перед валютой / в конце фразы («30 к руб»); в «до 5 к лету» это предлог, а не тысячи
+_AMOUNT = r"((?:\d{1,3}(?:[  ]\d{3})+(?!\d)|\d+)(?:[.,]\d+)?)(\s*(?:тыс\w*|т\.?р\.?)|(?<=\d)[кk]\b|\s[кk](?=\s*(?:руб|р\.|₽)|\s*[,.;!?)]|\s*$))?"
+_PRICE_RE = re.compile(
+    r"(до|не дороже|дешевле|не более|максимум|бюджет\w*|в пределах|за|от|дороже|не дешевле)?\s*"
+    + _AMOUNT + r"\s*(руб\w*|р\.|₽)?",
+    re.IGNORECASE,
+)
+_PRICE_RANGE_RE = re.compile(r"от\s*" + _AMOUNT + r"\s*до\s*" + _AMOUNT, re.IGNORECASE)
+_WEIGHT_RE = re.compile(
+    r"(?:до|не более|легче|не тяжелее|меньше|максимум)\s*(\d+(?:[.,]\d+)?)\s*(?:кг|килограм)", re.IGNORECASE
+)
+_WHEEL_RE = re.compile(
+    r"колес\w*\s*(?:от|больше|не меньше|минимум)?\s*(\d+(?:[.,]\d+)?)\s*(?:\"|дюйм|″)", re.IGNORECASE
+)
+
+_MAX_WORDS = ("до", "не дороже", "дешевле", "не более", "максимум", "в пределах", "за")
+_MIN_WORDS = ("от", "дороже", "не дешевле")
+# После «за» / «от» голое число — чаще год или возраст («за 2024 год», «от 2000 года»), а не цена
+_AMBIGUOUS_WORDS = ("за", "от")
+_YEAR_AFTER_RE = re.compile(r"\s*(?:год\w*|гг?\.|г\b)", re.IGNORECASE)
+
+
+def _amount_to_rub(number: str, multiplier: Optional[str]) -> Optional[float]:
+    value = _to_float(number)
+    if value is None:
+        return None
+    if multiplier:
+        value *= 1000
+    return value
+
+
+def _parse_price_constraints(text: str) -> Dict:
+    constraints = {}
+
+    match = _PRICE_RANGE_RE.search(text)
+    if match and not _YEAR_AFTER_RE.match(text, match.end()):
+        low = _amount_to_rub(match.group(1), match.group(2))
+        high = _amount_to_rub(match.group(3), match.group(4))
+        # «от 20 до 40 тыс» — множитель указан один раз, в конце
+        if match.group(4) and not match.group(2) and low and low < 1000:
+            low *= 1000
+        if low and high and 500 <= low < high:
+            return {"price_min": low, "price_max": high}
+
+    for match in _PRICE_RE.finditer(text):
+        word, number, multiplier, currency = match.groups()
+        value = _amount_to_rub(number, multiplier)
+        # Голое число без валюты и «тыс» — цена, только если перед ним «до/бюджет...» (не «за/от»),
+        # оно похоже на цену и после него не «год» (иначе это вес, возраст, год модели или размер колёс)
+        if value is None or value < 500 or not (multiplier or currency or (word and value >= 1000)):
+            continue
+        word = (word or "").lower()
+        if not multiplier and _YEAR_AFTER_RE.match(text, match.end(2)):
+            continue
+        if word in _AMBIGUOUS_WORDS and not (multiplier or currency):
+            continue
+        if word.startswith(_MIN_WORDS):
+            constraints["price_min"] = value
+        elif not word or word.startswith(_MAX_WORDS) or word.startswith("бюджет"):
+            constraints["price_max"] = value
+
+    return constraints
+
+
+def parse_query_constraints(user_text: str) -> Dict:
+    """Жёсткие условия из свободного текста юзера. Пустой словарь — условий нет."""
+    text = (user_text or "").lower().replace("ё", "е")
+    if not text.strip():
+        return {}
+
+    constraints = _parse_price_constraints(text)
+
+    match = _WEIGHT_RE.search(text)
+    if match:
+        constraints["weight_max"] = float(match.group(1).replace(",", "."))
+
+    match = _WHEEL_RE.search(text)
+    if match:
+        constraints["wheel_min"] = float(match.group(1).replace(",", "."))
+
+    fold_type = parse_fold_type(text)
+    if fold_type:
+        constraints["fold_type"] = fold_type
+
+    if "с рождения" in text or "новорожденн" in text:
+        constraints["age_max"] = 0
+
+    for kind, markers in QUERY_CATEGORY_KINDS:
+        if any(marker in text for marker in markers):
+            constraints["category"] = kind
+            break
+
+    return constraints
+
+
+def quiz_constraints(quiz_json: Optional[dict]) -> Dict:
+    constraints = {}
+    for value in (quiz_json or {}).values():
+        for item in (value if isinstance(value, list) else [value]):
+            if isinstance(item, str):
+                constraints.update(QUIZ_CONSTRAINTS.get(item, {}))
+    return constraints
+
+
+def extract_constraints(user_text: str, quiz_json: Optional[dict] = None) -> Dict:
+    """Условия квиза + текста (текст важнее: он уточняет или переопределяет квиз)."""
+    return {**quiz_constraints(quiz_json), **parse_query_constraints(user_text)}
+
+
+def relax_constraints(constraints: Dict) -> Dict:
+    """Убирает одно условие — первое по RELAXATION_ORDER."""
+    for key in RELAXATION_ORDER:
+        if key in constraints:
+            return {k: v for k, v in constraints.items() if k != key}
+    return {}
+
+
+def constraints_key(constraints: Dict) -> str:
+    """Ключ для группировки запросов с одинаковыми условиями: 'fold_type=cane;price_max=30000.0'."""
+    return ";".join(f"{key}={constraints[key]}" for key in sorted(constraints))
+
+
+def constraint_filters(constraints: Dict) -> List[dict]:
+    """Условия -> список where-условий Chroma по типизированным полям метаданных."""
+    filters = []
+    if "price_min" in constraints:
+        filters.append({"price_num": {"$gte": float(constraints["price_min"])}})
+    if "price_max" in constraints:
+        filters.append({"price_num": {"$lte": float(constraints["price_max"])}})
+    if "weight_max" in constraints:
+        filters.append({"weight_kg": {"$lte": float(constraints["weight_max"])}})
+    if "wheel_min" in constraints:
+        filters.append({"wheel_inch": {"$gte": float(constraints["wheel_min"])}})
+    if "fold_type" in constraints:
+        filters.append({"fold_type": {"$eq": constraints["fold_type"]}})
+    if "age_max" in constraints:
+        filters.append({"age_from_months": {"$lte": int(constraints["age_max"])}})
+    if "category" in constraints:
+        filters.append({"category_kind": {"$eq": constraints["category"]}})
+    return filters
@@ -0,0 +1,121 @@
+"""
+Компактные карточки товаров для контекста LLM.
+
+Раньше в промпт уходило до 10 товаров с описанием до 3000 символов каждый (~30k символов),
+и именно этот блок определял время и стоимость ответа Gemini/OpenAI.
+
+Теперь:
+- update_vectors.py при загрузке фида кладёт в метаданные короткую карточку
+  (ключевые <param> + обрезанное описание) — build_product_card();
+- search_service собирает контекст из карточек в порядке релевантности,
+  пока не кончится бюджет токенов — pack_products_context().
+"""
+
+import re
+from typing import Dict, List, Sequence, Tuple
+
+from app.core.services.search_config import (
+    PRODUCT_CONTEXT_TOKEN_BUDGET, CARD_MAX_PARAMS, CARD_DESCRIPTION_CHARS, CHARS_PER_TOKEN,
+)
+
+
+# Параметры, которые реально влияют на выбор коляски (ищем по подстроке в названии <param>)
+KEY_PARAM_MARKERS = (
+    "тип", "вес", "колес", "колёс", "механизм", "склад", "возраст", "люльк", "амортиз",
+    "ширин", "габарит", "размер", "сезон", "спинк", "корзин", "бренд", "страна",
+)
+
+# Для старых записей без карточки: сколько символов полного описания брать
+FALLBACK_DESCRIPTION_CHARS = 600
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка без токенизатора: русский текст ~3 символа на токен."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _trim(text: str, limit: int) -> str:
+    """Обрезает по границе слова и схлопывает пробелы/переносы."""
+    text = re.sub(r"\s+", " ", text or "").strip()
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def select_key_params(params: Sequence[Tuple[str, str]], limit: int = CARD_MAX_PARAMS) -> List[Tuple[str, str]]:
+    """Сначала параметры из KEY_PARAM_MARKERS, остальными добиваем до limit."""
+    key, rest = [], []
+    for p_name, p_value in params:
+        if any(marker in p_name.lower() for marker in KEY_PARAM_MARKERS):
+            key.append((p_name, p_value))
+        else:
+            rest.append((p_name, p_value))
+    return (key + rest)[:limit]
+
+
+def build_product_card(params: Sequence[Tuple[str, str]], raw_description: str) -> str:
+    """
+    Тело карточки для метаданных (название, цена и ссылка лежат в своих полях).
+    Пример: 'Вес: 7.5 кг; Колёса: 8"; Механизм складывания: книжка\\nКоротко: Лёгкая коляска...'
+    """
+    lines = []
+    key_params = select_key_params(params)
+    if key_params:
+        lines.append("; ".join(f"{_trim(n, 40)}: {_trim(v, 60)}" for n, v in key_params))
+
+    description = _trim(raw_description, CARD_DESCRIPTION_CHARS)
+    if description:
+        lines.append(f"Коротко: {description}")
+
+    return "\n".join(lines)
+
+
+def render_product(hit: Dict) -> str:
+    """Один товар в блоке контекста промпта."""
+    meta = hit["metadata"]
+    name = meta.get('name', 'Без названия')
+    price = meta.get('price', 'Цена не указана')
+    url = meta.get('url', '#')
+
+    text = (
+        f"- <b>{name}</b>\n"
+        f"  Цена: {price} руб.\n"
+        f"  Ссылка: {url}\n"
+    )
+
+    card = meta.get('card')
+    if card:
+        text += "".join(f"  {line}\n" for line in card.split("\n"))
+    else:
+        # Запись из старой базы (до карточек) — берём начало полного описания
+        text += f"  Описание: {_trim(meta.get('description', ''), FALLBACK_DESCRIPTION_CHARS)}\n"
+
+    # 🔥 ВОССТАНОВЛЕНА РЕЛЕВАНТНОСТЬ 🔥
+    # В Chroma чем меньше distance, тем лучше (0 = копия).
+    # Превращаем в % схожести: (1 - distance) * 100
+    # distance = None — товар найден только по словам (BM25), без вектора
+    if hit["distance"] is not None:
+        # Защита от отрицательных чисел (если векторы странные), хотя обычно distance <= 1
+        similarity = max(0.0, 1.0 - hit["distance"])
+        text += f"  <i>(Релевантность: {int(similarity * 100)}%)</i>\n"
+
+    return text + "\n"
+
+
+def pack_products_context(hits: List[Dict], token_budget: int = PRODUCT_CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Складывает карточки в порядке релевантности, пока влезают в бюджет.
+    Первый товар попадает в контекст всегда, даже если он один больше бюджета.
+    """
+    blocks = []
+    used_tokens = 0
+
+    for hit in hits:
+        block = render_product(hit)
+        tokens = estimate_tokens(block)
+        if blocks and used_tokens + tokens > token_budget:
+            break
+        blocks.append(block)
+        used_tokens += tokens
+
+    return "".join(blocks)
@@ -0,0 +1,131 @@
+"""
+Готовые подборки товаров для каждого профиля квиза.
+
+Ответы квиза — это небольшой закрытый набор комбинаций (QUIZ_CONFIG).
+Авто-запрос «Подобрать коляску» ищет только по ним (user_query пустой),
+поэтому update_vectors.py заранее считает top-k для каждой комбинации
+и каждого набора магазинов и сохраняет компактную таблицу:
+
+    {"sets": {"<id магазинов>": {"<ключ профиля>": [["<id товара>", distance], ...]}}}
+
+В рантайме авто-запрос берёт подборку из таблицы за O(1) —
+без эмбеддинга и без векторного запроса.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.core.quiz.config_quiz import QUIZ_CONFIG
+from app.core.services.index_version import artifact_path
+from app.core.services.search_config import QUIZ_SHORTLISTS_FILE
+from app.core.services.search_filters import MagazineIds, normalize_magazine_ids
+
+
+logger = logging.getLogger(__name__)
+
+_table: dict = {}
+_table_key: Optional[tuple] = None   # (путь версии, mtime)
+
+
+def iter_quiz_profiles() -> Iterator[dict]:
+    """
+    Обходит QUIZ_CONFIG так же, как quiz_state_service.save_and_next,
+    и отдаёт все достижимые итоговые наборы ответов (profile.data).
+    """
+
+    def walk(branch: str, level, data: dict):
+        step = QUIZ_CONFIG.get(branch, {}).get(level)
+        if step is None:
+            yield dict(data)
+            return
+
+        for option in step["options"].values():
+            answers = {**data, **option.get("save", {})}
+
+            if option.get("finish"):
+                yield answers
+            elif "branch" in option:
+                yield from walk(option["branch"], 2, answers)
+            elif step.get("next_level") is None:
+                yield answers
+            else:
+                yield from walk(branch, step["next_level"], answers)
+
+    yield from walk("root", 1, {})
+
+
+def profile_key(quiz_json: dict) -> str:
+    """Ключ профиля: не зависит от порядка ключей (JSONB его не хранит) и служебных полей."""
+    answers = {k: v for k, v in (quiz_json or {}).items() if not str(k).startswith("_")}
+    raw = json.dumps(answers, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def magazine_set_key(allowed_magazine_ids: MagazineIds) -> str:
+    """[5, 1] -> "1,5"; None -> "*" (вся база)."""
+    ids = normalize_magazine_ids(allowed_magazine_ids)
+    return ",".join(ids) if ids else "*"
+
+
+def save_shortlists(
+        sets: Dict[str, Dict[str, List[Tuple[str, float]]]],
+        top_k: int,
+        version: Optional[str] = None
+):
+    """Атомарно записывает таблицу (читатели никогда не видят полузаписанный файл)."""
+    payload = {"built_at": int(time.time()), "top_k": top_k, "sets": sets}
+    path = artifact_path(QUIZ_SHORTLISTS_FILE, version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _load_table() -> dict:
+    """Лениво читает таблицу рабочей версии и перечитывает её при новой записи или смене версии."""
+    global _table, _table_key
+
+    path = artifact_path(QUIZ_SHORTLISTS_FILE)
+    try:
+        key = (path, os.path.getmtime(path))
+    except OSError:
+        return {}
+
+    if key != _table_key:
+        try:
+            with open(path, encoding="utf-8") as f:
+                _table = json.load(f)
+            _table_key = key
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать таблицу подборок квиза: {e}")
+            return {}
+
+    return _table
+
+
+def lookup_shortlist(
+        quiz_json: Optional[dict],
+        allowed_magazine_ids: MagazineIds,
+        top_k: int,
+) -> Optional[List[Tuple[str, float]]]:
+    """
+    Готовая подборка [(id товара, distance), ...] или None, если такой комбинации
+    нет в таблице (квиз не пройден до конца, новый магазин, таблица не построена).
+    """
+    if not quiz_json:
+        return None
+
+    table = _load_table()
+    if not table or table.get("top_k", 0) < top_k:
+        return None
+
+    shortlist = table.get("sets", {}).get(magazine_set_key(allowed_magazine_ids), {}).get(profile_key(quiz_json))
+    if not shortlist:
+        return None
+
+    return [(product_id, distance) for product_id, distance in shortlist[:top_k]]
@@ -0,0 +1,165 @@
+"""
+Переранжирование кандидатов перед сборкой контекста LLM.
+
+После поиска кандидаты упорядочены только по косинусной дистанции (и RRF с BM25).
+Здесь все кандидаты запроса оцениваются одним проходом NumPy по матрице признаков:
+
+    similarity   — 1 - distance (товары только из BM25 получают худшую дистанцию пула);
+    quiz         — доля ответов квиза (ключи QUIZ_TRANSLATIONS), которым товар соответствует
+                   по характеристикам из product_attributes.py и тексту карточки;
+    price        — попадание в ценовые условия запроса (штраф растёт с выходом за границу);
+    name         — доля слов запроса в названии товара (модель, бренд).
+
+score = матрица признаков @ RERANK_WEIGHTS. Лучше упорядоченные кандидаты позволяют
+отдавать в промпт меньше товаров (LLM_CONTEXT_TOP_K) без потери качества.
+"""
+
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.services.lexical_index import tokenize
+
+
+# Вес признаков в итоговом score (similarity обычно 0.3..0.7, поэтому бонусы небольшие)
+RERANK_WEIGHTS = {
+    "similarity": 1.0,
+    "quiz": 0.15,
+    "price": 0.1,
+    "name": 0.2,
+}
+FEATURES = tuple(RERANK_WEIGHTS)
+_WEIGHTS = np.array([RERANK_WEIGHTS[name] for name in FEATURES], dtype=np.float32)
+
+
+# === 1. ПРИЗНАКИ ТОВАРОВ (столбцы по всем кандидатам) ===
+
+def _column(metadatas: List[dict], key: str) -> np.ndarray:
+    """Числовое поле метаданных; нет поля — NaN (сравнения с NaN дают False)."""
+    values = [meta.get(key) for meta in metadatas]
+    return np.array([v if isinstance(v, (int, float)) else np.nan for v in values], dtype=np.float32)
+
+
+class _Candidates:
+    """Признаки всех кандидатов запроса: числа — массивами, текст — списком строк."""
+
+    def __init__(self, metadatas: List[dict]):
+        self.price = _column(metadatas, "price_num")
+        self.weight = _column(metadatas, "weight_kg")
+        self.wheel = _column(metadatas, "wheel_inch")
+        self.age = _column(metadatas, "age_from_months")
+        self.fold = np.array([meta.get("fold_type", "") for meta in metadatas], dtype=object)
+        self.text = [
+            f"{meta.get('name', '')} {meta.get('card', '')}".lower().replace("ё", "е")
+            for meta in metadatas
+        ]
+
+    def has(self, *markers: str) -> np.ndarray:
+        return np.array([any(marker in text for marker in markers) for text in self.text], dtype=bool)
+
+
+# Ответ квиза -> каким товарам он соответствует. Ключи — из QUIZ_TRANSLATIONS
+QUIZ_RULES: Dict[str, Callable[[_Candidates], np.ndarray]] = {
+    "from_birth": lambda c: (c.age == 0) | c.has("с рождения", "люльк"),
+    "stroller": lambda c: (c.age >= 6) | c.has("прогулоч"),
+    "stroller_folds_like_a_cane": lambda c: c.fold == "cane",
+    "The_child's_age_is_from_6_months": lambda c: c.fold == "book",
+    "2in1": lambda c: c.has("2 в 1", "2в1"),
+    "3in1": lambda c: c.has("3 в 1", "3в1", "автокресл", "автолюльк"),
+    "transformer": lambda c: c.has("трансформер"),
+    "car_trips": lambda c: (c.weight <= 9) | c.has("одной рук"),
+    "air_travel": lambda c: (c.weight <= 7) | c.has("самолет", "ручн"),
+    "summer": lambda c: c.has("летн", "вентиляц"),
+    "winter": lambda c: c.has("зимн", "термо"),
+    "ground": lambda c: c.wheel >= 9,
+    "asphalt": lambda c: c.wheel <= 8,
+    "ground and asphalt": lambda c: c.wheel >= 8,
+    "offroad and snow": lambda c: (c.wheel >= 10) | c.has("вездеход"),
+}
+
+
+def _quiz_answers(quiz_json: Optional[dict]) -> List[str]:
+    answers = []
+    for value in (quiz_json or {}).values():
+        for item in (value if isinstance(value, list) else [value]):
+            if isinstance(item, str) and item in QUIZ_RULES:
+                answers.append(item)
+    return answers
+
+
+def _quiz_feature(candidates: _Candidates, quiz_json: Optional[dict], count: int) -> np.ndarray:
+    answers = _quiz_answers(quiz_json)
+    if not answers:
+        return np.zeros(count, dtype=np.float32)
+    matches = np.stack([QUIZ_RULES[answer](candidates) for answer in answers])
+    return matches.mean(axis=0).astype(np.float32)
+
+
+def _price_feature(candidates: _Candidates, constraints: Optional[dict]) -> np.ndarray:
+    """1 — цена в границах условий; дальше за границей — меньше (0 — вдвое дальше границы или цены нет)."""
+    price = candidates.price
+    price_min = (constraints or {}).get("price_min")
+    price_max = (constraints or {}).get("price_max")
+    if price_min is None and price_max is None:
+        return np.zeros(len(price), dtype=np.float32)
+
+    miss = np.zeros(len(price), dtype=np.float32)
+    if price_max is not None:
+        miss = np.maximum(miss, (price - price_max) / price_max)
+    if price_min is not None:
+        miss = np.maximum(miss, (price_min - price) / price_min)
+    fit = np.clip(1.0 - miss, 0.0, 1.0)
+    return np.nan_to_num(fit, nan=0.0).astype(np.float32)
+
+
+def _name_feature(metadatas: List[dict], user_query: str) -> np.ndarray:
+    query_tokens = set(tokenize(user_query))
+    if not query_tokens:
+        return np.zeros(len(metadatas), dtype=np.float32)
+    return np.array(
+        [len(query_tokens.intersection(tokenize(meta.get("name", "")))) / len(query_tokens) for meta in metadatas],
+        dtype=np.float32,
+    )
+
+
+def _similarity_feature(hits: List[Dict]) -> np.ndarray:
+    distances = np.array(
+        [hit["distance"] if hit["distance"] is not None else np.nan for hit in hits], dtype=np.float32
+    )
+    if np.isnan(distances).all():
+        return np.zeros(len(hits), dtype=np.float32)
+    # Товар только из BM25 (без дистанции) — как худший из найденных по вектору
+    return 1.0 - np.nan_to_num(distances, nan=float(np.nanmax(distances)))
+
+
+# === 2. ПЕРЕРАНЖИРОВАНИЕ ===
+
+def feature_matrix(
+        hits: List[Dict],
+        user_query: str = "",
+        quiz_json: Optional[dict] = None,
+        constraints: Optional[dict] = None,
+) -> np.ndarray:
+    """Матрица (кандидаты x FEATURES)."""
+    metadatas = [hit["metadata"] for hit in hits]
+    candidates = _Candidates(metadatas)
+    return np.column_stack([
+        _similarity_feature(hits),
+        _quiz_feature(candidates, quiz_json, len(hits)),
+        _price_feature(candidates, constraints),
+        _name_feature(metadatas, user_query),
+    ])
+
+
+def rerank_hits(
+        hits: List[Dict],
+        user_query: str = "",
+        quiz_json: Optional[dict] = None,
+        constraints: Optional[dict] = None,
+) -> List[Dict]:
+    """Кандидаты по убыванию score (при равенстве — в исходном порядке)."""
+    if len(hits) < 2:
+        return hits
+    scores = feature_matrix(hits, user_query, quiz_json, constraints) @ _WEIGHTS
+    order = np.argsort(-scores, kind="stable")
+    return [hits[i] for i in order]
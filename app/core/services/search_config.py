@@ -0,0 +1,119 @@
+"""
+Настройки векторного поиска.
+
+Общие для бота (search_service) и для скрипта обновления базы (update_vectors.py),
+чтобы оба процесса одинаково открывали коллекцию и искали по одним и тем же правилам.
+"""
+
+import os
+from pathlib import Path
+
+
+# Файл лежит в: app/core/services/search_config.py -> 4 раза .parent = корень проекта
+BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH") or os.path.join(BASE_DIR, "chromadb_storage")
+
+# Коллекция товаров. Метаданные коллекции должны совпадать у всех, кто её открывает
+COLLECTION_NAME = "strollers"
+COLLECTION_METADATA = {"hnsw:space": "cosine"}
+
+# Версии индекса (blue/green, index_version.py): update_vectors.py собирает новую версию рядом с рабочей
+# (коллекции strollers_<версия>*, файлы в index_versions/<версия>/), проверяет её и переключает указатель.
+# Файлы ниже (подборки квиза, реестр шардов, BM25, точный индекс) лежат в папке версии
+INDEX_VERSION_PATH = os.path.join(CHROMA_DB_PATH, "index_version.json")
+INDEX_VERSIONS_PATH = os.path.join(CHROMA_DB_PATH, "index_versions")
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", 2))   # Рабочая + предыдущая (для отката)
+# Проверка сборки перед переключением: товаров не меньше этой доли от рабочей версии
+# и доля товаров, которые находятся по собственному вектору (spot-check запросы)
+INDEX_MIN_ROWS_RATIO = float(os.getenv("INDEX_MIN_ROWS_RATIO", 0.5))
+INDEX_SPOT_CHECKS = 20
+INDEX_SPOT_CHECK_MIN_RECALL = 0.9
+
+# Параметры HNSW (см. hnsw_params.py). Подобранные app/tune_hnsw.py значения лежат в hnsw_params.json
+HNSW_PARAMS_PATH = os.path.join(CHROMA_DB_PATH, "hnsw_params.json")
+HNSW_M = int(os.getenv("HNSW_M", 16))                               # Связей на узел графа
+HNSW_CONSTRUCTION_EF = int(os.getenv("HNSW_CONSTRUCTION_EF", 100))  # Ширина поиска при построении
+HNSW_SEARCH_EF = int(os.getenv("HNSW_SEARCH_EF", 100))              # Ширина поиска при запросе
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Размерность хранимых векторов (усечение + нормировка, см. vector_codec.py). 1536 — полный вектор.
+# ⚠️ После смены значения базу нужно пересобрать: старые векторы другой длины.
+# Таблица pgvector создана под vector(1536) — для SEARCH_BACKEND=pgvector значение не меняем
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 1536))
+
+# Постоянное хранилище эмбеддингов по содержимому: sha1(модель + текст) -> вектор OpenAI (embedding_store.py).
+# Лежит в папке базы (её монтирует docker-compose), но не зависит от коллекций: пересборка базы берёт векторы отсюда
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH") or os.path.join(CHROMA_DB_PATH, "embedding_store.sqlite3")
+
+# Вес свободного текста юзера и ответов квиза в составном векторе запроса.
+# Текст важнее: он уточняет или переопределяет профиль квиза
+QUERY_TEXT_WEIGHT = 0.6
+QUERY_QUIZ_WEIGHT = 0.4
+
+# Загрузка фидов (update_vectors.py): сколько фидов качается и разбирается одновременно
+# и сколько запросов к OpenAI Embeddings в полёте на все фиды сразу (embedding_limiter.py)
+FEED_CONCURRENCY = int(os.getenv("FEED_CONCURRENCY", 4))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+# Процессов для разбора офферов (feed_parser.parse_offer_chunk); 0 — разбор в потоке без пула процессов
+FEED_PARSE_WORKERS = int(os.getenv("FEED_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Сколько товаров отдаём в контекст LLM
+SEARCH_TOP_K = 10
+
+# ID магазинов, по которым ищем для ПЛАТНЫХ пользователей и для PREMIUM_AGGREGATOR
+# 🔥🔥🔥🔥🔥🔥🔥🔥(Замени цифры на реальные ID твоих 5 крупных магазинов в БД)🔥🔥🔥🔥🔥🔥🔥🔥
+TOP_SHOPS_IDS = [2]
+
+# Таблица "профиль квиза -> готовый список товаров" (строится в update_vectors.py)
+QUIZ_SHORTLISTS_FILE = "quiz_shortlists.json"
+
+# Реестр шардов Chroma по фидам: коллекция strollers_<версия>_<url_hash> -> магазины (строится в update_vectors.py)
+SHARD_REGISTRY_FILE = "shard_registry.json"
+SHARD_FANOUT_THREADS = int(os.getenv("SHARD_FANOUT_THREADS", 8))  # Параллельных запросов к шардам
+
+# Валидаторы фидов (ETag, Last-Modified, sha256) для условных запросов при обновлении (feed_validators.py)
+FEED_VALIDATORS_PATH = os.path.join(CHROMA_DB_PATH, "feed_validators.json")
+
+# Лексический BM25-индекс по документам товаров (строится в update_vectors.py)
+LEXICAL_INDEX_FILE = "lexical_index.json"
+
+# Отдельный поисковый процесс (run_search.py), который один раз держит индекс в памяти.
+# Пусто — бот открывает ChromaDB сам. Примеры: unix:///run/search/search.sock, tcp://search:8765
+SEARCH_SERVICE_URL = os.getenv("SEARCH_SERVICE_URL", "")
+SEARCH_CLIENT_POOL_SIZE = int(os.getenv("SEARCH_CLIENT_POOL_SIZE", 8))   # Соединений на процесс бота
+SEARCH_SERVER_THREADS = int(os.getenv("SEARCH_SERVER_THREADS", 4))       # Потоков запросов в поисковом процессе
+
+# Адаптивная выборка кандидатов (сколько брать из индекса под анти-дубль)
+FETCH_DEFAULT_FILL_RATE = 0.7     # Стартовая доля уникальных товаров среди кандидатов
+FETCH_FILL_RATE_ALPHA = 0.2       # Вес нового замера в скользящем среднем
+FETCH_MAX_WINDOW = 200            # Больше кандидатов за один запрос не берём
+SEARCH_DISTANCE_CUTOFF = 0.8      # Дальше этой косинусной дистанции товары уже нерелевантны
+
+# Жёсткие условия из запроса и квиза (цена, вес, колёса, складывание — product_attributes.py).
+# Если под них нашлось меньше товаров, условия ослабляются по одному
+ATTRIBUTE_FILTER_MIN_HITS = int(os.getenv("ATTRIBUTE_FILTER_MIN_HITS", 3))
+
+# Переранжирование (reranker.py): сколько уникальных кандидатов оцениваем признаками
+# и сколько лучших товаров отдаём в промпт LLM (меньше товаров — короче промпт и быстрее ответ)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 20))
+LLM_CONTEXT_TOP_K = int(os.getenv("LLM_CONTEXT_TOP_K", 6))
+
+# Контекст товаров для LLM: компактные карточки (product_cards.py) в пределах бюджета токенов
+PRODUCT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PRODUCT_CONTEXT_TOKEN_BUDGET", 2500))
+CARD_MAX_PARAMS = 8               # Сколько <param> кладём в карточку
+CARD_DESCRIPTION_CHARS = 300      # Длина описания в карточке
+CHARS_PER_TOKEN = 3               # Оценка длины без токенизатора (русский текст)
+
+# Точный numpy-поиск по шардам фидов (exact_index.py) для небольших каталогов магазинов.
+# SEARCH_BACKEND: auto — точный поиск, если перебирать не больше EXACT_SEARCH_MAX_ROWS строк, иначе Chroma;
+# exact — всегда точный (Chroma только для товаров вне шардов); chroma — только Chroma;
+# pgvector — таблица product_vectors в Postgres (update_vectors.py пишет туда же, что и в Chroma)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto").lower()
+EXACT_INDEX_DIR = "exact_index"
+EXACT_SEARCH_MAX_ROWS = int(os.getenv("EXACT_SEARCH_MAX_ROWS", 20000))
+# Компактные шарды точного поиска (vector_codec.py): полные векторы хранятся как float16 | int8 | none (float32),
+# перебор идёт по префиксу из EXACT_COARSE_DIMS координат (0 — по полному вектору),
+# финальный top-k пересчитывается по полным векторам для EXACT_RESCORE_FACTOR * k кандидатов
+EXACT_QUANTIZATION = os.getenv("EXACT_QUANTIZATION", "float16").lower()
+EXACT_COARSE_DIMS = int(os.getenv("EXACT_COARSE_DIMS", 256))
+EXACT_RESCORE_FACTOR = int(os.getenv("EXACT_RESCORE_FACTOR", 4))
@@ -0,0 +1,136 @@
+"""
+Фильтры векторного поиска (общие для update_vectors.py и search_service).
+
+Принадлежность товара магазинам пишется в метаданные отдельными булевыми
+флагами: {"mag_1": True, "mag_5": True}. Chroma умеет фильтровать по ним нативно
+(where={"mag_5": True}), поэтому HNSW-запрос сразу возвращает только товары
+нужных магазинов — без перебора "с запасом" и фильтрации в Python.
+"""
+
+from typing import Dict, Iterable, List, Optional, Union
+
+
+MagazineIds = Union[int, str, Iterable[Union[int, str]], None]
+
+
+def magazine_flag_key(magazine_id: Union[int, str]) -> str:
+    """Имя поля метаданных для магазина: 5 -> "mag_5"."""
+    return f"mag_{magazine_id}"
+
+
+def normalize_magazine_ids(allowed_magazine_ids: MagazineIds) -> List[str]:
+    """Один ID или список ID -> отсортированный список строк без дублей."""
+    if allowed_magazine_ids is None:
+        return []
+    if isinstance(allowed_magazine_ids, (int, str)):
+        return [str(allowed_magazine_ids)]
+    return sorted({str(x) for x in allowed_magazine_ids})
+
+
+def magazine_flags(magazine_ids: Iterable[Union[int, str]]) -> Dict[str, bool]:
+    """Метаданные для записи товара: {"mag_1": True, "mag_5": True}."""
+    return {magazine_flag_key(mag_id): True for mag_id in magazine_ids}
+
+
+def build_magazine_where(allowed_magazine_ids: MagazineIds) -> Optional[dict]:
+    """
+    where-фильтр Chroma для списка магазинов.
+    None — без ограничений (ищем по всей базе).
+    """
+    ids = normalize_magazine_ids(allowed_magazine_ids)
+    if not ids:
+        return None
+    if len(ids) == 1:
+        return {magazine_flag_key(ids[0]): True}
+    # $or в Chroma требует минимум 2 условия
+    return {"$or": [{magazine_flag_key(mag_id): True} for mag_id in ids]}
+
+
+def combine_where(*filters: Optional[dict]) -> Optional[dict]:
+    """
+    Склеивает фильтры через $and (пустые пропускает):
+    магазины + условия по характеристикам (product_attributes.py).
+    """
+    parts = [f for f in filters if f]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    # $and в Chroma тоже требует минимум 2 условия
+    return {"$and": parts}
+
+
+# === Разбор where-фильтра без Chroma (для точного поиска в exact_index.py) ===
+
+_MAG_PREFIX = "mag_"
+
+_OPERATORS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+}
+
+
+def match_where(meta: dict, where: Optional[dict]) -> bool:
+    """Проверяет метаданные товара по where-фильтру в синтаксисе Chroma."""
+    if not where:
+        return True
+
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(meta, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match_where(meta, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = meta.get(key)
+            for op, arg in condition.items():
+                if not _OPERATORS[op](value, arg):
+                    return False
+        elif meta.get(key) != condition:
+            return False
+
+    return True
+
+
+def required_magazine_ids(where: Optional[dict]) -> Optional[set]:
+    """
+    Магазины, без которых товар точно не пройдёт фильтр:
+    {"mag_5": True} -> {"5"}, {"$or": [{"mag_1": True}, {"mag_5": True}]} -> {"1", "5"}.
+    None — фильтр не ограничивает магазины (или устроен сложнее).
+    """
+    if not where:
+        return None
+
+    if len(where) == 1:
+        key, condition = next(iter(where.items()))
+        if key.startswith(_MAG_PREFIX) and condition is True:
+            return {key[len(_MAG_PREFIX):]}
+        if key == "$or":
+            ids = set()
+            for sub in condition:
+                sub_ids = required_magazine_ids(sub)
+                if sub_ids is None:
+                    return None
+                ids |= sub_ids
+            return ids
+        if key == "$and":
+            for sub in condition:
+                sub_ids = required_magazine_ids(sub)
+                if sub_ids is not None:
+                    return sub_ids
+
+    return None
+
+
+def is_magazine_only_where(where: Optional[dict]) -> bool:
+    """True — фильтр состоит только из флагов магазинов (как у build_magazine_where)."""
+    if not where:
+        return True
+    return where == build_magazine_where(required_magazine_ids(where))
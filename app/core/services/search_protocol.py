@@ -0,0 +1,91 @@
+"""
+Бинарный протокол между ботом и поисковым процессом (run_search.py).
+
+Кадр (в обе стороны):
+
+    [u32 длина кадра][u32 длина JSON][JSON-заголовок][float32-матрица]
+
+- JSON-заголовок — операция и параметры (ids, where, n_results, ответ Chroma без векторов);
+- матрица — векторы запроса или эмбеддинги из ответа, сырые float32 (little-endian)
+  без JSON-сериализации; её форма лежит в заголовке ("matrix_shape": [строк, размерность]).
+
+Все числа в длинах — big-endian.
+"""
+
+import asyncio
+import json
+import struct
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+_U32 = struct.Struct(">I")
+MAX_FRAME_SIZE = 256 * 1024 * 1024  # Защита от мусора в сокете
+
+# Операции
+OP_QUERY = "query"
+OP_GET = "get"
+OP_RELOAD = "reload"
+OP_PING = "ping"
+
+
+class FrameError(ValueError):
+    """Битый кадр: тело прочитано целиком, соединение можно использовать дальше."""
+
+
+class FrameTooLarge(FrameError):
+    """Длина кадра больше MAX_FRAME_SIZE: тело не читалось, поток дальше не выровнен."""
+
+
+def encode_frame(header: dict, matrix: Optional[np.ndarray] = None) -> bytes:
+    if matrix is not None:
+        matrix = np.ascontiguousarray(matrix, dtype="<f4")
+        header = {**header, "matrix_shape": list(matrix.shape)}
+        blob = matrix.tobytes()
+    else:
+        blob = b""
+
+    raw_header = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    body = _U32.pack(len(raw_header)) + raw_header + blob
+    return _U32.pack(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[dict, Optional[np.ndarray]]:
+    """
+    Читает один кадр. asyncio.IncompleteReadError — собеседник закрыл соединение,
+    FrameTooLarge / FrameError — мусор в сокете или битый заголовок/матрица.
+    """
+    (size,) = _U32.unpack(await reader.readexactly(_U32.size))
+    if size > MAX_FRAME_SIZE:
+        raise FrameTooLarge(f"Слишком большой кадр: {size} байт")
+
+    body = await reader.readexactly(size)
+    try:
+        (header_size,) = _U32.unpack_from(body, 0)
+        header = json.loads(body[_U32.size:_U32.size + header_size].decode("utf-8"))
+
+        matrix = None
+        shape = header.pop("matrix_shape", None)
+        if shape is not None:
+            matrix = np.frombuffer(body, dtype="<f4", offset=_U32.size + header_size).reshape(shape)
+    except (struct.error, ValueError, TypeError, AttributeError) as e:
+        raise FrameError(f"Битый кадр ({size} байт): {e}") from e
+
+    return header, matrix
+
+
+async def write_frame(writer: asyncio.StreamWriter, header: dict, matrix: Optional[np.ndarray] = None):
+    writer.write(encode_frame(header, matrix))
+    await writer.drain()
+
+
+async def open_connection(url: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """unix:///run/search/search.sock или tcp://search:8765"""
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return await asyncio.open_unix_connection(parsed.path)
+    if parsed.scheme == "tcp":
+        return await asyncio.open_connection(parsed.hostname, parsed.port)
+    raise ValueError(f"Неизвестная схема адреса поискового сервиса: {url}")
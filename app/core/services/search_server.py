@@ -0,0 +1,117 @@
+"""
+Отдельный поисковый процесс: один раз открывает ChromaDB и обслуживает запросы
+всех реплик ботов (Telegram, VK) по Unix-сокету или TCP (протокол — search_protocol.py).
+
+Плюсы по сравнению с Chroma внутри каждого бота:
+- HNSW-индекс в памяти один раз, а не в каждом процессе;
+- запросы к индексу не конкурируют за GIL с обработкой апдейтов бота;
+- поиск масштабируется отдельно от ботов.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from app.core.services.search_config import SEARCH_SERVICE_URL, SEARCH_SERVER_THREADS
+from app.core.services.search_protocol import (
+    OP_GET, OP_QUERY, OP_RELOAD, OP_PING, FrameError, FrameTooLarge, read_frame, write_frame,
+)
+from app.core.services.vector_backends import create_local_backend
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = "unix:///tmp/prokolyaski_search.sock"
+
+
+class SearchServer:
+    def __init__(self, backend, threads: int = SEARCH_SERVER_THREADS):
+        self._backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="search")
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _dispatch(self, header: dict, matrix):
+        """Выполняет операцию. Возвращает (result, матрица для ответа или None)."""
+        op = header.get("op")
+
+        if op == OP_QUERY:
+            result = await self._run(
+                self._backend.query_sync, matrix.tolist(), int(header["n_results"]), header.get("where")
+            )
+            return result, None
+
+        if op == OP_GET:
+            result = await self._run(
+                self._backend.get_sync, header["ids"], bool(header.get("include_embeddings"))
+            )
+            embeddings = result.pop("embeddings")
+            return result, embeddings
+
+        if op == OP_RELOAD:
+            await self._run(self._backend.reload_sync)
+            return {}, None
+
+        if op == OP_PING:
+            return {}, None
+
+        raise ValueError(f"Неизвестная операция: {op}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    header, matrix = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break  # Клиент закрыл соединение
+                except FrameError as e:
+                    # Клиент получает ответ с ошибкой, а не молча закрытое соединение
+                    logger.warning(f"Битый кадр от клиента: {e}")
+                    await write_frame(writer, {"ok": False, "error": str(e)})
+                    if isinstance(e, FrameTooLarge):
+                        break  # Тело кадра не прочитано — дальше в потоке мусор
+                    continue
+
+                try:
+                    result, result_matrix = await self._dispatch(header, matrix)
+                    await write_frame(writer, {"ok": True, "result": result}, result_matrix)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки запроса {header.get('op')}: {e}")
+                    await write_frame(writer, {"ok": False, "error": str(e)})
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, url: str):
+        parsed = urlparse(url)
+
+        if parsed.scheme == "unix":
+            # Сокет от прошлого запуска мешает bind()
+            if os.path.exists(parsed.path):
+                os.unlink(parsed.path)
+            os.makedirs(os.path.dirname(parsed.path) or ".", exist_ok=True)
+            server = await asyncio.start_unix_server(self.handle_connection, path=parsed.path)
+        elif parsed.scheme == "tcp":
+            server = await asyncio.start_server(self.handle_connection, host=parsed.hostname, port=parsed.port)
+        else:
+            raise ValueError(f"Неизвестная схема адреса: {url}")
+
+        # Прогрев: индекс открывается до первого запроса юзера
+        await self._run(self._backend.open_sync)
+        logger.info(f"🔎 Поисковый сервис слушает {url}")
+
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                self._backend.close()
+                self._executor.shutdown(wait=False)
+
+
+async def run_search_server(url: str = None):
+    await SearchServer(create_local_backend()).serve(url or SEARCH_SERVICE_URL or DEFAULT_URL)
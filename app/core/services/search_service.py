@@ -1,34 +1,43 @@
 import os
 import asyncio
 import re
+import math
 import logging
-import chromadb
+import numpy as np
 
-from typing import List, Dict, Optional, Union
-from pathlib import Path
+from typing import List, Dict, NamedTuple, Optional, Tuple, Union
 from openai import AsyncOpenAI
 
+from app.core.services.embedding_cache import get_cached_embedding, store_embedding
+from app.core.services.embedding_store import embedding_store
+from app.core.services.index_version import current_index_version
+from app.core.services.lexical_index import search_lexical, reciprocal_rank_fusion
+from app.core.services.product_attributes import (
+    extract_constraints, quiz_constraints, relax_constraints, constraints_key, constraint_filters,
+)
+from app.core.services.product_cards import pack_products_context
+from app.core.services.vector_codec import truncate_embedding
+from app.core.services.quiz_shortlist import lookup_shortlist, magazine_set_key
+from app.core.services.reranker import rerank_hits
+from app.core.services.search_config import (
+    EMBEDDING_MODEL, QUERY_TEXT_WEIGHT, QUERY_QUIZ_WEIGHT,
+    FETCH_DEFAULT_FILL_RATE, FETCH_MAX_WINDOW, FETCH_FILL_RATE_ALPHA, SEARCH_DISTANCE_CUTOFF,
+    ATTRIBUTE_FILTER_MIN_HITS, RERANK_CANDIDATES, SEARCH_TOP_K,
+)
+from app.core.services.search_filters import build_magazine_where, combine_where, match_where
+from app.core.services.vector_backends import get_backend
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
 
-# === 1. НАСТРОЙКА ПУТЕЙ И КЛИЕНТОВ ===
-
-# Вычисляем путь к корню проекта.
-# Файл лежит в: app/services/search_service.py
-# .parent -> app/services
-# .parent.parent -> app
-# .parent.parent.parent -> корень проекта (где лежит папка chromadb_storage)
-BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
-CHROMA_DB_PATH = os.path.join(BASE_DIR, "chromadb_storage")
+# === 1. НАСТРОЙКА КЛИЕНТОВ ===
+# Путь к chromadb_storage и имя коллекции — в search_config.py (общие с update_vectors.py)
 
 # Инициализация OpenAI
 openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Инициализация ChromaDB
-# PersistentClient = база на диске (не в оперативной памяти)
-chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-collection = chroma_client.get_or_create_collection(name="strollers")
+# Векторный индекс: ChromaDB в этом процессе или отдельный поисковый сервис (SEARCH_SERVICE_URL).
+# Открывается лениво, при первом запросе — см. vector_backends.py
 
 # === 2. СЛОВАРЬ-ПЕРЕВОДЧИК ===
 QUIZ_TRANSLATIONS = {
@@ -64,20 +73,49 @@ QUIZ_TRANSLATIONS = {
 
 
 async def get_query_embedding(text: str) -> List[float]:
-    """Превращает текст запроса в вектор"""
-    try:
-        response = await openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        logger.error(f"Ошибка создания эмбеддинга: {e}")
-        return []
+    """Превращает текст запроса в вектор (сначала смотрим в кэш: память -> Redis -> OpenAI)"""
+    vectors = await get_query_embeddings([text])
+    return vectors[0]
 
 
-def translate_quiz_to_text(quiz_data: dict) -> str:
-    """Превращает JSON квиза в поисковую строку на русском."""
+async def get_query_embeddings(texts: List[str], persist: bool = False) -> List[List[float]]:
+    """
+    Пакетная версия get_query_embedding: всё, чего нет в кэше и в хранилище эмбеддингов,
+    уходит в OpenAI одним запросом. При ошибке на месте вектора будет [].
+    persist — сохранить новые векторы в хранилище (embedding_store.py). Только для фиксированных фраз
+    (квиз): свободный текст юзеров живёт в Redis с TTL и не должен бесконечно копиться на диске.
+    """
+    vectors: List[Optional[List[float]]] = [
+        await get_cached_embedding(text, EMBEDDING_MODEL) for text in texts
+    ]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+    if missing:
+        for i, vector in zip(missing, embedding_store.get_many([texts[i] for i in missing])):
+            if vector is not None:
+                vectors[i] = vector
+                await store_embedding(texts[i], EMBEDDING_MODEL, vector)
+        missing = [i for i in missing if vectors[i] is None]
+
+    if missing:
+        try:
+            response = await openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=[texts[i] for i in missing]
+            )
+            for i, data in zip(missing, response.data):
+                vectors[i] = data.embedding
+                await store_embedding(texts[i], EMBEDDING_MODEL, data.embedding)
+            if persist:
+                embedding_store.put_many([texts[i] for i in missing], [vectors[i] for i in missing])
+        except Exception as e:
+            logger.error(f"Ошибка создания эмбеддинга: {e}")
+
+    return [vector if vector is not None else [] for vector in vectors]
+
+
+def quiz_to_terms(quiz_data: dict) -> List[str]:
+    """Превращает JSON квиза в список поисковых фраз на русском."""
     search_terms = []
 
     for key, value in quiz_data.items():
@@ -99,127 +137,474 @@ def translate_quiz_to_text(quiz_data: dict) -> str:
         elif key in QUIZ_TRANSLATIONS:
             search_terms.append(QUIZ_TRANSLATIONS[key])
 
-    return " ".join(search_terms)
+    return search_terms
 
 
-async def search_products(
-        user_query: str,
-        quiz_json: Optional[dict] = None,
-        # 🔥 Теперь принимаем: один ID (int), список ID (List[int]) или None
-        allowed_magazine_ids: Union[int, List[int], None] = None,
-        top_k: int = 10
-) -> str:
+def translate_quiz_to_text(quiz_data: dict) -> str:
+    """Превращает JSON квиза в поисковую строку на русском."""
+    return " ".join(quiz_to_terms(quiz_data))
+
+
+# === 3. СОСТАВНОЙ ВЕКТОР ЗАПРОСА ===
+# Фразы QUIZ_TRANSLATIONS — фиксированный набор. Эмбеддим их один раз (одним запросом)
+# и держим в памяти, а для каждого сообщения эмбеддим только свободный текст юзера.
+# Итоговый вектор = нормированная взвешенная сумма "текст" + "квиз".
+
+_quiz_term_vectors: Dict[str, np.ndarray] = {}
+_quiz_terms_lock = asyncio.Lock()
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+async def _get_term_vectors(terms: List[str]) -> List[np.ndarray]:
+    """Векторы фраз квиза из памяти; недостающие дозапрашиваем одним пакетом."""
+    async with _quiz_terms_lock:
+        if not _quiz_term_vectors:
+            # Прогрев: все фразы словаря + то, что спросили сейчас
+            terms_to_load = list(dict.fromkeys([*QUIZ_TRANSLATIONS.values(), *terms]))
+        else:
+            terms_to_load = [term for term in dict.fromkeys(terms) if term not in _quiz_term_vectors]
+
+        if terms_to_load:
+            vectors = await get_query_embeddings(terms_to_load, persist=True)
+            for term, vector in zip(terms_to_load, vectors):
+                if vector:
+                    _quiz_term_vectors[term] = np.asarray(vector, dtype=np.float32)
+
+    return [_quiz_term_vectors[term] for term in terms if term in _quiz_term_vectors]
+
+
+async def compose_query_vectors(queries: List[Tuple[str, Optional[dict]]]) -> List[List[float]]:
     """
-    Главная функция поиска (Адаптировано под ChromaDB + Защита от дублей).
+    Пакетная сборка векторов для списка (текст юзера, квиз).
+    Все тексты, которых нет в кэше, эмбеддятся ОДНИМ запросом в OpenAI.
+    """
+    texts = list(dict.fromkeys(text for text, _ in queries if text and text.strip()))
+    text_vectors = dict(zip(texts, await get_query_embeddings(texts))) if texts else {}
+
+    all_terms = [term for _, quiz_json in queries if quiz_json for term in quiz_to_terms(quiz_json)]
+    if all_terms:
+        await _get_term_vectors(all_terms)
+
+    vectors = []
+    for user_text, quiz_json in queries:
+        quiz_vector = None
+        if quiz_json:
+            term_vectors = await _get_term_vectors(quiz_to_terms(quiz_json))
+            if term_vectors:
+                quiz_vector = _normalize(np.mean(term_vectors, axis=0))
+
+        text_vector = None
+        vector = text_vectors.get(user_text)
+        if vector:
+            text_vector = _normalize(np.asarray(vector, dtype=np.float32))
+
+        vectors.append(_combine_query_parts(text_vector, quiz_vector))
+
+    return vectors
+
+
+def _combine_query_parts(text_vector: Optional[np.ndarray], quiz_vector: Optional[np.ndarray]) -> List[float]:
+    if text_vector is not None and quiz_vector is not None:
+        combined = QUERY_TEXT_WEIGHT * text_vector + QUERY_QUIZ_WEIGHT * quiz_vector
+    elif text_vector is not None:
+        combined = text_vector
+    elif quiz_vector is not None:
+        combined = quiz_vector
+    else:
+        return []
+
+    # Та же размерность, что у векторов в базе (EMBEDDING_DIMENSIONS), с нормировкой
+    return truncate_embedding(combined)
+
+
+async def compose_query_vector(user_text: str, quiz_json: Optional[dict] = None) -> List[float]:
     """
+    Вектор запроса = QUERY_TEXT_WEIGHT * вектор(текст юзера) + QUERY_QUIZ_WEIGHT * среднее(векторы фраз квиза).
+    Запрос только по квизу после прогрева вообще не ходит в OpenAI.
+    Пустой список — не удалось получить ни одной части.
+    """
+    vectors = await compose_query_vectors([(user_text, quiz_json)])
+    return vectors[0]
 
-    # 1. Формируем "Идеальный поисковый запрос"
-    full_search_text = user_query
-    if quiz_json:
-        translated_quiz = translate_quiz_to_text(quiz_json)
-        full_search_text = f"{full_search_text} {translated_quiz}"
 
-    logger.info(f"🔎 Ищем в ChromaDB по фразе: '{full_search_text}' (IDs: {allowed_magazine_ids})")
+def clean_product_name(name: str) -> str:
+    """Нормализация для анти-дубля: убираем спецсимволы, пробелы, приводим к нижнему регистру"""
+    return re.sub(r'[^\w\s]', '', name).lower().strip()
 
-    # 2. Получаем вектор
-    vector = await get_query_embedding(full_search_text)
-    if not vector:
-        return ""
+
+def select_unique_hits(
+        ids: List[str],
+        metadatas: List[dict],
+        distances: List[float],
+        top_k: int
+) -> List[Dict]:
+    """
+    Идёт по кандидатам в порядке близости и оставляет top_k товаров
+    с уникальными названиями (один и тот же товар часто есть в нескольких фидах).
+    """
+    hits = []
+    # 🔥 Множество для запоминания уже найденных названий (анти-дубль)
+    seen_names = set()
+
+    for product_id, meta, dist in zip(ids, metadatas, distances):
+        if len(hits) >= top_k:
+            break
+
+        clean_name = clean_product_name(meta.get('name', 'Без названия'))
+        if clean_name in seen_names:
+            continue  # Пропускаем, если такое название уже было
+
+        seen_names.add(clean_name)  # Запоминаем
+        hits.append({"id": product_id, "metadata": meta, "distance": dist})
+
+    return hits
+
+
+def format_products_context(hits: List[Dict]) -> str:
+    """Собирает блок товаров для системного промпта (карточки в пределах бюджета токенов)"""
+    return pack_products_context(hits)
+
+
+async def _get_shortlist_hits(
+        quiz_json: dict,
+        allowed_magazine_ids: Union[int, List[int], None],
+        top_k: int
+) -> Optional[List[Dict]]:
+    """
+    Быстрый путь авто-запроса: готовая подборка из таблицы update_vectors.py.
+    None — подборки нет, нужно искать обычным путём.
+    """
+    # Берём всю сохранённую подборку (SEARCH_TOP_K): переранжирование выберет из неё лучшие top_k
+    shortlist = lookup_shortlist(quiz_json, allowed_magazine_ids, max(top_k, SEARCH_TOP_K)) \
+        or lookup_shortlist(quiz_json, allowed_magazine_ids, top_k)
+    if not shortlist:
+        return None
 
     try:
-        # 3. Запрос в базу ChromaDB
-        # 🔥 Берем в 4 раза больше, так как будем фильтровать дубли и чужие магазины
-        fetch_multiplier = 4
-        fetch_k = int(top_k * fetch_multiplier)
-
-        # 🔥🔥🔥 Мы говорим Python: "Выполни эту тяжелую функцию в отдельном потоке,
-        # а мы пока подождем (await), но других юзеров блокировать не будем".
-        def run_query():
-            return collection.query(
-                query_embeddings=[vector],
-                n_results=fetch_k
-            )
+        ids = [product_id for product_id, _ in shortlist]
+        found = await get_backend().get(ids)
+    except Exception as e:
+        logger.error(f"Ошибка чтения готовой подборки из ChromaDB: {e}")
+        return None
 
-        results = await asyncio.to_thread(run_query)
-        # 🔥🔥🔥 КОНЕЦ 🔥🔥🔥
-
-        # Chroma возвращает структуру: {'ids': [[]], 'metadatas': [[]], 'distances': [[]]}
-        # Проверяем, есть ли результаты
-        if not results['ids'] or not results['ids'][0]:
-            return ""
-
-        # 4. Обработка результатов и фильтрация
-        context_text = ""
-        found_count = 0
-
-        # 🔥 Множество для запоминания уже найденных названий (анти-дубль)
-        seen_names = set()
-
-        # Данные первого (и единственного) запроса
-        metadatas_list = results['metadatas'][0]
-        distances_list = results['distances'][0]  # Чем меньше, тем лучше
-
-        # --- ПОДГОТОВКА СПИСКА РАЗРЕШЕННЫХ ID ---
-        target_ids_set = set()
-        if allowed_magazine_ids is not None:
-            if isinstance(allowed_magazine_ids, int):
-                target_ids_set.add(str(allowed_magazine_ids))
-            else:
-                # Если передан список [1, 5], превращаем в set строчек {"1", "5"}
-                target_ids_set = set(str(x) for x in allowed_magazine_ids)
-
-        for i, meta in enumerate(metadatas_list):
-            if found_count >= top_k:
-                break
-
-            # --- 🔥 НОВАЯ ФИЛЬТРАЦИЯ (Один или Список) ---
-            # В update_vectors мы сохраняли "magazine_ids_str": "1,2,5"
-            if target_ids_set:
-                owners_str = meta.get("magazine_ids_str", "")
-                owners_list = owners_str.split(",")
-
-                # Проверяем пересечение: есть ли хоть один наш ID среди владельцев?
-                # Если пересечения нет (множество пустое) -> пропускаем
-                if not (set(owners_list) & target_ids_set):
-                    continue
-
-            # Получаем данные
-            name = meta.get('name', 'Без названия')
-
-            # --- 🔥 ЗАЩИТА ОТ ДУБЛЕЙ ---
-            # Нормализация: убираем спецсимволы, пробелы, приводим к нижнему регистру
-            clean_name = re.sub(r'[^\w\s]', '', name).lower().strip()
-
-            if clean_name in seen_names:
-                continue  # Пропускаем, если такое название уже было
-
-            seen_names.add(clean_name)  # Запоминаем
-
-            # --- СБОРКА ОТВЕТА ---
-            price = meta.get('price', 'Цена не указана')
-            url = meta.get('url', '#')
-            # Обрезаем описание
-            desc = meta.get('description', '')[:3000]
-
-            # 🔥 ВОССТАНОВЛЕНА РЕЛЕВАНТНОСТЬ 🔥
-            # В Chroma чем меньше distance, тем лучше (0 = копия).
-            # Превращаем в % схожести: (1 - distance) * 100
-            dist = distances_list[i]
-            # Защита от отрицательных чисел (если векторы странные), хотя обычно distance <= 1
-            similarity = max(0.0, 1.0 - dist)
-            relevance_percent = int(similarity * 100)
-
-            context_text += (
-                f"- <b>{name}</b>\n"
-                f"  Цена: {price} руб.\n"
-                f"  Ссылка: {url}\n"
-                f"  Описание: {desc}...\n"
-                f"  <i>(Релевантность: {relevance_percent}%)</i>\n\n"
+    # get() не гарантирует порядок — восстанавливаем порядок подборки
+    meta_by_id = dict(zip(found['ids'], found['metadatas']))
+    hits = [
+        {"id": product_id, "metadata": meta_by_id[product_id], "distance": dist}
+        for product_id, dist in shortlist
+        if product_id in meta_by_id
+    ]
+    # Если часть товаров уже удалили из базы — подборка неполная, ищем заново
+    if len(hits) < len(shortlist):
+        return None
+
+    hits = rerank_hits(hits, quiz_json=quiz_json, constraints=quiz_constraints(quiz_json))[:top_k]
+    logger.info(f"⚡ Готовая подборка квиза (IDs: {allowed_magazine_ids}): {len(hits)} товаров")
+    return hits
+
+
+async def _fetch_candidates(ids: List[str], with_embeddings: bool) -> Dict[str, tuple]:
+    """Метаданные (и при необходимости векторы) товаров по ID: id -> (metadata, embedding | None)."""
+    found = await get_backend().get(ids, include_embeddings=with_embeddings)
+
+    embeddings = found['embeddings']
+    if embeddings is None:
+        embeddings = [None] * len(found['ids'])
+
+    return {
+        product_id: (meta, embedding)
+        for product_id, meta, embedding in zip(found['ids'], found['metadatas'], embeddings)
+    }
+
+
+def _cosine_distance(vector: List[float], embedding) -> Optional[float]:
+    """Косинусная дистанция как в Chroma (hnsw:space = cosine); None — считать не из чего."""
+    if not vector or embedding is None:
+        return None
+    query = _normalize(np.asarray(vector, dtype=np.float32))
+    doc = _normalize(np.asarray(embedding, dtype=np.float32))
+    return float(1.0 - query @ doc)
+
+
+# === 4. АДАПТИВНЫЙ РАЗМЕР ВЫБОРКИ ===
+# Сколько кандидатов брать из индекса, чтобы после анти-дубля осталось top_k товаров,
+# зависит от магазина: у одних фид чистый, у других одна модель повторяется в 5 цветах.
+# Поэтому для каждого набора магазинов запоминаем долю уникальных товаров среди кандидатов
+# (скользящее среднее) и начинаем с окна, которого обычно хватает. Не хватило — удваиваем.
+
+_fill_rates: Dict[str, float] = {}  # ключ набора магазинов -> доля уникальных товаров
+_fill_rates_version: Optional[str] = None
+
+
+def _version_fill_rates() -> Dict[str, float]:
+    """Доли считаются по товарам конкретной версии индекса: переключилась версия — учимся заново."""
+    global _fill_rates_version
+
+    version = current_index_version()
+    if version != _fill_rates_version:
+        _fill_rates.clear()
+        _fill_rates_version = version
+    return _fill_rates
+
+
+def _initial_window(set_key: str, top_k: int) -> int:
+    rate = _version_fill_rates().get(set_key, FETCH_DEFAULT_FILL_RATE)
+    # +10% запаса, чтобы в среднем хватало одного раунда
+    window = math.ceil(top_k / max(rate, 0.05) * 1.1)
+    return max(top_k, min(window, FETCH_MAX_WINDOW))
+
+
+def _record_fill_rate(set_key: str, rate: float):
+    fill_rates = _version_fill_rates()
+    previous = fill_rates.get(set_key)
+    if previous is None:
+        fill_rates[set_key] = rate
+    else:
+        fill_rates[set_key] = (1 - FETCH_FILL_RATE_ALPHA) * previous + FETCH_FILL_RATE_ALPHA * rate
+
+
+def _count_unique_names(metadatas: List[dict]) -> int:
+    return len({clean_product_name(meta.get('name', 'Без названия')) for meta in metadatas})
+
+
+async def _query_adaptive(
+        vectors: List[List[float]],
+        where: Optional[dict],
+        set_key: str,
+        top_k: int
+) -> List[Tuple[List[str], List[dict], List[float]]]:
+    """
+    Итеративное углубление: берём небольшое окно кандидатов и увеличиваем его вдвое
+    только для тех запросов, которым после анти-дубля не хватило товаров.
+    Запрос дальше не углубляется, если:
+    - индекс исчерпан (вернулось меньше, чем просили);
+    - последний кандидат уже дальше SEARCH_DISTANCE_CUTOFF (дальше будут только хуже);
+    - окно дошло до FETCH_MAX_WINDOW.
+    """
+    window = _initial_window(set_key, top_k)
+    rows: List[Optional[tuple]] = [None] * len(vectors)
+    todo = list(range(len(vectors)))
+
+    while todo:
+        # 🔥 Локальная Chroma выполняет запрос в отдельном потоке, удалённая — в своём процессе,
+        # других юзеров мы не блокируем
+        results = await get_backend().query([vectors[j] for j in todo], n_results=window, where=where)
+
+        next_todo = []
+        for row, j in enumerate(todo):
+            ids, metadatas, distances = results['ids'][row], results['metadatas'][row], results['distances'][row]
+            rows[j] = (ids, metadatas, distances)
+
+            exhausted = len(ids) < window
+            too_far = bool(distances) and distances[-1] >= SEARCH_DISTANCE_CUTOFF
+            if (_count_unique_names(metadatas) < top_k and not exhausted
+                    and not too_far and window < FETCH_MAX_WINDOW):
+                next_todo.append(j)
+
+        todo = next_todo
+        if todo:
+            window = min(window * 2, FETCH_MAX_WINDOW)
+            logger.debug(f"🔁 Мало товаров после анти-дубля ({set_key}), окно -> {window}")
+
+    for ids, metadatas, _ in rows:
+        if ids:
+            _record_fill_rate(set_key, _count_unique_names(metadatas) / len(ids))
+
+    return rows
+
+
+class SearchRequest(NamedTuple):
+    """Один поисковый запрос для search_products_many (те же поля, что у search_products)."""
+    user_query: str
+    quiz_json: Optional[dict] = None
+    allowed_magazine_ids: Union[int, List[int], None] = None
+
+
+async def search_hits_many(requests: List[SearchRequest], top_k: int = 10) -> List[List[Dict]]:
+    """
+    Пакетный поиск: для каждого запроса — список товаров {"id", "metadata", "distance"}.
+
+    Фиксированное число обращений к внешним системам, сколько бы ни было запросов:
+    - все тексты эмбеддятся одним запросом в OpenAI;
+    - в Chroma уходит один query(query_embeddings=[...]) на каждый набор магазинов и условий
+      (where-фильтр у запроса Chroma общий, поэтому запросы группируются по магазинам и условиям)
+      плюс редкие доборы, если после анти-дубля не хватило товаров
+      или под жёсткие условия нашлось слишком мало товаров (повтор с ослабленными условиями);
+    - товары, найденные только по словам, дочитываются одним get() на всю пачку.
+    """
+    results: List[Optional[List[Dict]]] = [None] * len(requests)
+
+    # 0. Авто-запросы (только квиз, без текста) — берем готовые подборки
+    for i, request in enumerate(requests):
+        if request.quiz_json and not request.user_query.strip():
+            results[i] = await _get_shortlist_hits(request.quiz_json, request.allowed_magazine_ids, top_k)
+
+    pending = [i for i, hits in enumerate(results) if hits is None]
+    if not pending:
+        return results
+
+    # 1. Логируем "Идеальные поисковые запросы"
+    for i in pending:
+        request = requests[i]
+        full_search_text = request.user_query
+        if request.quiz_json:
+            full_search_text = f"{full_search_text} {translate_quiz_to_text(request.quiz_json)}"
+        logger.info(f"🔎 Ищем в ChromaDB по фразе: '{full_search_text}' (IDs: {request.allowed_magazine_ids})")
+
+    # 2. Векторы: эмбеддим только тексты юзеров (одним запросом), квиз — из готовых векторов фраз
+    vectors = await compose_query_vectors([(requests[i].user_query, requests[i].quiz_json) for i in pending])
+    vector_by_request = dict(zip(pending, vectors))
+
+    # 🔥 Лексический поиск (BM25) только по тексту юзера: точные названия моделей и брендов.
+    # Работает локально, поэтому выручает и тогда, когда OpenAI недоступен.
+    # Подсчёт BM25 по всему индексу — CPU, поэтому в потоке, как и запросы к Chroma
+    def lexical_search_all() -> Dict[int, List[str]]:
+        return {
+            i: [product_id for product_id, _ in search_lexical(
+                requests[i].user_query, requests[i].allowed_magazine_ids, limit=top_k * 2)]
+            for i in pending
+        }
+
+    lexical_rankings = await asyncio.to_thread(lexical_search_all)
+
+    # 🔥 Жёсткие условия (цена, вес, колёса, складывание) из текста и квиза — фильтр до векторного поиска
+    constraints = {i: extract_constraints(requests[i].user_query, requests[i].quiz_json) for i in pending}
+
+    # 3-5. Поиск; кому под условия нашлось слишком мало товаров — повторяем с ослабленными условиями
+    todo = pending
+    while todo:
+        round_hits = await _search_round(requests, todo, vector_by_request, lexical_rankings, constraints, top_k)
+
+        next_todo = []
+        for i in todo:
+            # Товары, прошедшие более строгие условия, остаются первыми; ослабленный раунд только добивает список
+            merged = (results[i] or []) + round_hits[i]
+            results[i] = select_unique_hits(
+                [h["id"] for h in merged], [h["metadata"] for h in merged], [h["distance"] for h in merged], top_k
             )
-            found_count += 1
+            if constraints[i] and len(results[i]) < min(ATTRIBUTE_FILTER_MIN_HITS, top_k):
+                relaxed = relax_constraints(constraints[i])
+                logger.info(f"🪢 Мало товаров под условия {constraints[i]} -> ослабляем до {relaxed}")
+                constraints[i] = relaxed
+                next_todo.append(i)
+        todo = next_todo
+
+    return results
+
+
+async def _search_round(
+        requests: List[SearchRequest],
+        pending: List[int],
+        vector_by_request: Dict[int, List[float]],
+        lexical_rankings: Dict[int, List[str]],
+        constraints: Dict[int, dict],
+        top_k: int
+) -> Dict[int, List[Dict]]:
+    """
+    Векторный поиск (по группам "магазины + условия") + дочитывание BM25-кандидатов + RRF,
+    затем переранжирование RERANK_CANDIDATES уникальных кандидатов и top_k лучших.
+    """
+    pool_size = max(top_k, RERANK_CANDIDATES)
+    attribute_where = {i: combine_where(*constraint_filters(constraints[i])) for i in pending}
+
+    # 3. Запросы в ChromaDB — по одному на набор магазинов и условий, все векторы группы разом
+    # 🔥 Фильтр по магазинам и характеристикам уходит прямо в Chroma (where по mag_<id>, price_num, ...),
+    # запас кандидатов под удаление дублей подбирается адаптивно (_query_adaptive)
+    groups: Dict[str, List[int]] = {}
+    for i in pending:
+        if vector_by_request[i]:
+            set_key = magazine_set_key(requests[i].allowed_magazine_ids)
+            if constraints[i]:
+                set_key = f"{set_key}|{constraints_key(constraints[i])}"
+            groups.setdefault(set_key, []).append(i)
+
+    candidates: Dict[int, Dict[str, tuple]] = {i: {} for i in pending}  # id -> (metadata, distance)
+    vector_rankings: Dict[int, List[str]] = {i: [] for i in pending}
+
+    for set_key, group in groups.items():
+        first = group[0]
+        where = combine_where(build_magazine_where(requests[first].allowed_magazine_ids), attribute_where[first])
+
+        try:
+            rows = await _query_adaptive([vector_by_request[i] for i in group], where, set_key, pool_size)
+        except Exception as e:
+            logger.error(f"Ошибка поиска в ChromaDB: {e}")
+            continue
+
+        for (ids, metadatas, distances), i in zip(rows, group):
+            vector_rankings[i] = ids
+            for product_id, meta, dist in zip(ids, metadatas, distances):
+                candidates[i][product_id] = (meta, dist)
+
+    # 4. Дочитываем товары, найденные только по словам (одним get на всю пачку)
+    missing_ids = list(dict.fromkeys(
+        product_id
+        for i in pending
+        for product_id in lexical_rankings[i]
+        if product_id not in candidates[i]
+    ))
+    fetched = {}
+    if missing_ids:
+        try:
+            fetched = await _fetch_candidates(missing_ids, with_embeddings=any(vector_by_request.values()))
+        except Exception as e:
+            logger.error(f"Ошибка чтения товаров из ChromaDB: {e}")
+
+    # 5. Смешиваем списки (RRF), убираем дубли
+    hits = {}
+    for i in pending:
+        for product_id in lexical_rankings[i]:
+            if product_id not in candidates[i] and product_id in fetched:
+                meta, embedding = fetched[product_id]
+                # BM25 не знает про условия — проверяем их по метаданным
+                if match_where(meta, attribute_where[i]):
+                    candidates[i][product_id] = (meta, _cosine_distance(vector_by_request[i], embedding))
+
+        fused_ids = [
+            product_id for product_id in reciprocal_rank_fusion([vector_rankings[i], lexical_rankings[i]])
+            if product_id in candidates[i]
+        ]
+        pool = select_unique_hits(
+            fused_ids,
+            [candidates[i][product_id][0] for product_id in fused_ids],
+            [candidates[i][product_id][1] for product_id in fused_ids],
+            pool_size
+        )
+        # 🔥 Один проход NumPy по признакам всех кандидатов (квиз, цена, слова в названии, дистанция)
+        hits[i] = rerank_hits(pool, requests[i].user_query, requests[i].quiz_json, constraints[i])[:top_k]
+
+    return hits
 
-        return context_text
 
+async def search_products_many(requests: List[SearchRequest], top_k: int = 10) -> List[str]:
+    """
+    Пакетная версия search_products: N запросов -> N блоков товаров для промпта.
+    Для прекомпьюта, бенчмарков и массового переранжирования.
+    """
+    try:
+        hits_per_request = await search_hits_many(requests, top_k)
     except Exception as e:
-        logger.error(f"Ошибка поиска в ChromaDB: {e}")
-        return ""
+        logger.error(f"Ошибка пакетного поиска: {e}")
+        return [""] * len(requests)
+
+    return [format_products_context(hits) for hits in hits_per_request]
+
+
+async def search_products(
+        user_query: str,
+        quiz_json: Optional[dict] = None,
+        # 🔥 Теперь принимаем: один ID (int), список ID (List[int]) или None
+        allowed_magazine_ids: Union[int, List[int], None] = None,
+        top_k: int = 10
+) -> str:
+    """
+    Главная функция поиска (Адаптировано под ChromaDB + Защита от дублей).
+    """
+    contexts = await search_products_many(
+        [SearchRequest(user_query, quiz_json, allowed_magazine_ids)], top_k
+    )
+    return contexts[0]
@@ -0,0 +1,464 @@
+"""
+Бэкенды векторного индекса для search_service.
+
+- ChromaBackend — ChromaDB открывается прямо в этом процессе (PersistentClient).
+- ExactBackend — точный numpy-поиск по шардам фидов (exact_index.py) для небольших каталогов;
+  большие выборки (вся база, агрегатор) по-прежнему уходят в ChromaBackend.
+- PgVectorBackend — таблица product_vectors в Postgres (pgvector), общая для реплик на разных хостах.
+- RemoteBackend — тонкий клиент к отдельному поисковому процессу (run_search.py),
+  который один раз держит индекс в памяти и обслуживает все реплики ботов.
+
+Все бэкенды отдают ответы в формате Chroma: {'ids': [[...]], 'metadatas': [[...]], 'distances': [[...]]}.
+Какой бэкенд использовать, решает get_backend() по SEARCH_SERVICE_URL и SEARCH_BACKEND.
+"""
+
+import asyncio
+import contextlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.services.search_config import (
+    CHROMA_DB_PATH, SEARCH_SERVICE_URL, SEARCH_CLIENT_POOL_SIZE,
+    SEARCH_BACKEND, EXACT_SEARCH_MAX_ROWS, SHARD_FANOUT_THREADS,
+)
+from app.core.services.feed_shards import select_shards
+from app.core.services.hnsw_params import collection_metadata
+from app.core.services.index_version import collection_name, current_index_version
+from app.core.services.search_filters import is_magazine_only_where
+from app.core.services.exact_index import ExactIndex
+from app.core.services.pgvector_store import query_vectors, get_vectors
+from app.core.services.search_protocol import (
+    OP_GET, OP_QUERY, OP_RELOAD, OP_PING, open_connection, read_frame, write_frame,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class _ChromaHandle:
+    """Открытая база одной версии индекса: клиент, коллекция, шарды и сколько запросов сейчас по ней идёт."""
+
+    def __init__(self, client, collection, name: str):
+        self.client = client
+        # client._system Chroma каждый раз ищет в общем кэше по пути: после clear_system_cache
+        # это уже система новой базы. Свою систему запоминаем сразу, чтобы остановить именно её
+        self.system = client._system
+        self.collection = collection
+        self.name = name
+        self.shards: Dict[str, object] = {}
+        self.users = 0
+        self.retired = False   # Уже заменена новой — закрывается, когда уйдёт последний запрос
+
+    def stop(self):
+        with contextlib.suppress(Exception):
+            # Сбрасывает буферы на диск, защищает chroma.sqlite3 от порчи
+            self.system.stop()
+
+
+class ChromaBackend:
+    """
+    ChromaDB в текущем процессе. Клиент открывается лениво, при первом запросе.
+    Запросы с фильтром по магазинам идут в шарды фидов (feed_shards.py), остальные — в общую коллекцию.
+    Без явного collection_name открывается коллекция рабочей версии индекса (index_version.py);
+    переключил update_vectors.py версию — следующий запрос переоткрывает базу уже на новой.
+    🔥 Старая база закрывается не сразу: запросы, которые уже идут по ней (потоки to_thread, пул шардов),
+    доходят до конца, и клиент останавливается, когда отпустит последний из них (_ChromaHandle.users).
+    """
+
+    def __init__(self, path: str = CHROMA_DB_PATH, collection_name: Optional[str] = None):
+        self._path = path
+        self._collection_name = collection_name
+        self._handle: Optional[_ChromaHandle] = None
+        self._fanout: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> _ChromaHandle:
+        name = self._collection_name or collection_name(current_index_version())
+        with self._lock:
+            if self._handle is not None and name != self._handle.name:
+                # Новая версия собрана другим процессом — открываем базу заново рядом со старой
+                logger.info(f"🔀 Версия индекса переключена: {self._handle.name} -> {name}")
+                self._retire_locked()
+
+            if self._handle is None:
+                import chromadb  # Тяжёлый импорт — только там, где индекс реально открывается
+
+                # PersistentClient = база на диске (не в оперативной памяти)
+                client = chromadb.PersistentClient(path=self._path)
+                collection = client.get_or_create_collection(name=name, metadata=collection_metadata())
+                self._handle = _ChromaHandle(client, collection, name)
+
+            self._handle.users += 1
+            return self._handle
+
+    def _release(self, handle: _ChromaHandle):
+        with self._lock:
+            handle.users -= 1
+            stop = handle.retired and handle.users == 0
+        if stop:
+            handle.stop()
+
+    @contextlib.contextmanager
+    def _use(self):
+        """Текущая база на время одного запроса: переоткрытие её не закроет, пока запрос не закончится."""
+        handle = self._acquire()
+        try:
+            yield handle
+        finally:
+            self._release(handle)
+
+    def _retire_locked(self):
+        """Текущая база больше не выдаётся новым запросам; закрывается, когда по ней никто не ищет."""
+        from chromadb.api.client import SharedSystemClient
+
+        handle, self._handle = self._handle, None
+        if handle is not None:
+            handle.retired = True
+            if handle.users == 0:
+                handle.stop()
+        # Chroma кэширует клиента по пути — без сброса кэша откроется старое состояние
+        SharedSystemClient.clear_system_cache()
+
+    def _get_shard(self, handle: _ChromaHandle, name: str):
+        """Коллекция-шард фида или None, если её ещё нет (реестр новее базы)."""
+        with self._lock:
+            shard = handle.shards.get(name)
+            if shard is None:
+                try:
+                    shard = handle.client.get_collection(name=name)
+                except Exception:
+                    return None
+                handle.shards[name] = shard
+            return shard
+
+    # --- Синхронные методы (для потоков и поискового сервера) ---
+
+    def open_sync(self):
+        """Открывает индекс заранее (прогрев), чтобы первый запрос юзера не ждал загрузки."""
+        with self._use():
+            pass
+
+    @staticmethod
+    def _query_collection(collection, vectors: List[List[float]], n_results: int, where: Optional[dict]) -> dict:
+        results = collection.query(
+            query_embeddings=[list(map(float, v)) for v in vectors],
+            n_results=n_results,
+            where=where,
+            include=["metadatas", "distances"],
+        )
+        return {
+            "ids": results["ids"],
+            "metadatas": results["metadatas"],
+            "distances": [[float(d) for d in row] for row in results["distances"]],
+        }
+
+    def query_sync(self, vectors: List[List[float]], n_results: int, where: Optional[dict] = None) -> dict:
+        with self._use() as handle:
+            shard_names = select_shards(where)
+            shards = [self._get_shard(handle, name) for name in shard_names or []]
+            if shard_names is None or not all(shards):
+                return self._query_collection(handle.collection, vectors, n_results, where)
+            return self._query_shards(shards, vectors, n_results, where)
+
+    def _query_shards(self, shards: list, vectors: List[List[float]], n_results: int, where: Optional[dict]) -> dict:
+        """Параллельный запрос к шардам и слияние top-k по дистанции."""
+        # В шард попадают только товары его магазинов — фильтр по флагам там уже не нужен
+        shard_where = None if is_magazine_only_where(where) else where
+
+        if self._fanout is None:
+            self._fanout = ThreadPoolExecutor(max_workers=SHARD_FANOUT_THREADS, thread_name_prefix="shard")
+        # 🔥 HNSW-поиск отпускает GIL, так что шарды реально ищутся одновременно
+        parts = list(self._fanout.map(
+            lambda shard: self._query_collection(shard, vectors, n_results, shard_where), shards
+        ))
+
+        merged = {"ids": [], "metadatas": [], "distances": []}
+        for q in range(len(vectors)):
+            candidates = [
+                (dist, product_id, meta)
+                for part in parts
+                for product_id, meta, dist in zip(part["ids"][q], part["metadatas"][q], part["distances"][q])
+            ]
+            candidates.sort(key=lambda item: item[0])
+            candidates = candidates[:n_results]
+            merged["ids"].append([c[1] for c in candidates])
+            merged["metadatas"].append([c[2] for c in candidates])
+            merged["distances"].append([c[0] for c in candidates])
+        return merged
+
+    def get_sync(self, ids: List[str], include_embeddings: bool = False) -> dict:
+        include = ["metadatas", "embeddings"] if include_embeddings else ["metadatas"]
+        with self._use() as handle:
+            found = handle.collection.get(ids=ids, include=include)
+        embeddings = None
+        if include_embeddings and found.get("embeddings") is not None and len(found["ids"]):
+            embeddings = np.asarray(found["embeddings"], dtype=np.float32)
+        return {"ids": found["ids"], "metadatas": found["metadatas"], "embeddings": embeddings}
+
+    def reload_sync(self):
+        """Переоткрывает базу с диска (после того как update_vectors.py записал новые данные)."""
+        with self._lock:
+            self._retire_locked()
+        logger.info("🔁 ChromaDB переоткрыта с диска")
+
+    def close(self):
+        with self._lock:
+            self._retire_locked()
+
+    # --- Асинхронный интерфейс для search_service ---
+
+    async def query(self, vectors: List[List[float]], n_results: int, where: Optional[dict] = None) -> dict:
+        # 🔥 Тяжелый запрос — в отдельном потоке, чтобы не блокировать других юзеров
+        return await asyncio.to_thread(self.query_sync, vectors, n_results, where)
+
+    async def get(self, ids: List[str], include_embeddings: bool = False) -> dict:
+        return await asyncio.to_thread(self.get_sync, ids, include_embeddings)
+
+    async def reload(self):
+        await asyncio.to_thread(self.reload_sync)
+
+    async def aclose(self):
+        self.close()
+
+
+class ExactBackend:
+    """
+    Точный поиск по шардам фидов (exact_index.py).
+    Запросы, которым нужно перебрать больше max_rows строк, и товары, которых нет в шардах,
+    отдаются в fallback (ChromaBackend) — HNSW там выгоднее перебора.
+    """
+
+    def __init__(self, fallback: Optional[ChromaBackend] = None, max_rows: Optional[int] = EXACT_SEARCH_MAX_ROWS):
+        self._index = ExactIndex()
+        self._fallback = fallback
+        self._max_rows = max_rows
+        self._lock = threading.Lock()
+
+    def _use_exact(self, where: Optional[dict]) -> bool:
+        with self._lock:
+            if not self._index.refresh():
+                return False
+            if self._fallback is None or self._max_rows is None:
+                return True
+            return self._index.candidate_rows(where) <= self._max_rows
+
+    def _require_fallback(self) -> ChromaBackend:
+        if self._fallback is None:
+            raise RuntimeError("Точный индекс пуст, а резервный бэкенд не задан")
+        return self._fallback
+
+    # --- Синхронные методы (для потоков и поискового сервера) ---
+
+    def open_sync(self):
+        with self._lock:
+            self._index.refresh()
+        if self._fallback is not None:
+            self._fallback.open_sync()
+
+    def query_sync(self, vectors: List[List[float]], n_results: int, where: Optional[dict] = None) -> dict:
+        if self._use_exact(where):
+            return self._index.query(vectors, n_results, where)
+        return self._require_fallback().query_sync(vectors, n_results, where)
+
+    def get_sync(self, ids: List[str], include_embeddings: bool = False) -> dict:
+        with self._lock:
+            exact = self._index.refresh() and self._index.has_ids(ids)
+        if exact or self._fallback is None:
+            return self._index.get(ids, include_embeddings)
+        return self._fallback.get_sync(ids, include_embeddings)
+
+    def reload_sync(self):
+        with self._lock:
+            self._index.reset()
+        if self._fallback is not None:
+            self._fallback.reload_sync()
+
+    def close(self):
+        with self._lock:
+            self._index.reset()
+        if self._fallback is not None:
+            self._fallback.close()
+
+    # --- Асинхронный интерфейс для search_service ---
+
+    async def query(self, vectors: List[List[float]], n_results: int, where: Optional[dict] = None) -> dict:
+        return await asyncio.to_thread(self.query_sync, vectors, n_results, where)
+
+    async def get(self, ids: List[str], include_embeddings: bool = False) -> dict:
+        return await asyncio.to_thread(self.get_sync, ids, include_embeddings)
+
+    async def reload(self):
+        await asyncio.to_thread(self.reload_sync)
+
+    async def aclose(self):
+        self.close()
+
+
+class PgVectorBackend:
+    """
+    Поиск в Postgres (pgvector_store.py) через общий пул app.core.db.config.engine.
+    Фильтр по магазинам и сортировка по дистанции — одним SQL-запросом.
+    """
+
+    def __init__(self, engine=None):
+        self._engine = engine
+
+    def _get_engine(self):
+        if self._engine is None:
+            # Импорт здесь: config создаёт движок по DB_URL при импорте
+            from app.core.db.config import engine
+            self._engine = engine
+        return self._engine
+
+    async def query(self, vectors: List[List[float]], n_results: int, where: Optional[dict] = None) -> dict:
+        async with self._get_engine().connect() as conn:
+            return await query_vectors(conn, vectors, n_results, where)
+
+    async def get(self, ids: List[str], include_embeddings: bool = False) -> dict:
+        async with self._get_engine().connect() as conn:
+            return await get_vectors(conn, ids, include_embeddings)
+
+    async def reload(self):
+        pass  # Postgres всегда отдаёт актуальные данные
+
+    async def aclose(self):
+        pass  # Пул общий с ботом, его закрывает сам бот
+
+
+class RemoteBackend:
+    """
+    Клиент поискового процесса с пулом соединений.
+    Соединения открываются по требованию (не больше pool_size) и переиспользуются.
+    """
+
+    def __init__(self, url: str, pool_size: int = SEARCH_CLIENT_POOL_SIZE):
+        self._url = url
+        self._pool_size = pool_size
+        self._idle: List[tuple] = []
+        self._opened = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    async def _acquire(self) -> tuple:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+
+        async with self._cond:
+            while not self._idle and self._opened >= self._pool_size:
+                await self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._opened += 1
+
+        try:
+            return await open_connection(self._url)
+        except Exception:
+            async with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    async def _release(self, conn: Optional[tuple]):
+        async with self._cond:
+            if conn is None:
+                self._opened -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    async def _call(self, header: dict, matrix: Optional[np.ndarray] = None):
+        # Одна повторная попытка: соединение из пула могло умереть (рестарт поискового процесса)
+        for attempt in range(2):
+            conn = await self._acquire()
+            reader, writer = conn
+            try:
+                await write_frame(writer, header, matrix)
+                response, response_matrix = await read_frame(reader)
+            except (ConnectionError, asyncio.IncompleteReadError, OSError) as e:
+                writer.close()
+                await self._release(None)
+                if attempt == 1:
+                    raise ConnectionError(f"Поисковый сервис недоступен ({self._url}): {e}") from e
+                continue
+            except BaseException:
+                # Битый ответ, таймаут, отмена: в каком месте кадра остановилось соединение — неизвестно.
+                # Закрываем его и освобождаем место в пуле, иначе после pool_size сбоев _acquire ждёт вечно
+                writer.close()
+                await self._release(None)
+                raise
+
+            await self._release(conn)
+            if not response.get("ok"):
+                raise RuntimeError(f"Ошибка поискового сервиса: {response.get('error')}")
+            return response.get("result", {}), response_matrix
+
+    async def query(self, vectors: List[List[float]], n_results: int, where: Optional[dict] = None) -> dict:
+        result, _ = await self._call(
+            {"op": OP_QUERY, "n_results": n_results, "where": where},
+            np.asarray(vectors, dtype=np.float32),
+        )
+        return result
+
+    async def get(self, ids: List[str], include_embeddings: bool = False) -> dict:
+        result, matrix = await self._call({"op": OP_GET, "ids": ids, "include_embeddings": include_embeddings})
+        result["embeddings"] = matrix
+        return result
+
+    async def reload(self):
+        await self._call({"op": OP_RELOAD})
+
+    async def ping(self) -> bool:
+        with contextlib.suppress(Exception):
+            await self._call({"op": OP_PING})
+            return True
+        return False
+
+    async def aclose(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+            self._opened -= 1
+
+
+_backend = None
+
+
+def create_local_backend():
+    """
+    Индекс в этом процессе (бот без поискового сервиса или сам поисковый сервис).
+    SEARCH_BACKEND: chroma — только Chroma; exact — только точный индекс;
+    auto — точный индекс для небольших выборок, Chroma для остальных.
+    """
+    if SEARCH_BACKEND == "chroma":
+        return ChromaBackend()
+    if SEARCH_BACKEND == "pgvector":
+        raise ValueError("SEARCH_BACKEND=pgvector: поиск идёт в Postgres, локальный индекс не используется")
+    if SEARCH_BACKEND == "exact":
+        return ExactBackend(fallback=ChromaBackend(), max_rows=None)
+    return ExactBackend(fallback=ChromaBackend())
+
+
+def get_backend():
+    """Бэкенд поиска для этого процесса (создаётся один раз)."""
+    global _backend
+    if _backend is None:
+        if SEARCH_BACKEND == "pgvector":
+            # Индекс в общей базе — отдельный поисковый процесс не нужен
+            _backend = PgVectorBackend()
+        elif SEARCH_SERVICE_URL:
+            logger.info(f"🔌 Поиск через отдельный сервис: {SEARCH_SERVICE_URL}")
+            _backend = RemoteBackend(SEARCH_SERVICE_URL)
+        else:
+            _backend = create_local_backend()
+    return _backend
+
+
+async def close_backend():
+    """Вызывается при остановке бота."""
+    global _backend
+    if _backend is not None:
+        await _backend.aclose()
+        _backend = None
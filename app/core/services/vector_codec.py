@@ -0,0 +1,86 @@
+"""
+Компактное хранение векторов товаров.
+
+1. Усечение размерности. Модели text-embedding-3 обучены так, что начало вектора (первые N координат)
+   само по себе хороший эмбеддинг — достаточно отрезать хвост и заново нормировать.
+   EMBEDDING_DIMENSIONS одинаково применяется при загрузке фидов и к векторам запросов.
+
+2. Квантованное хранение шардов точного поиска (exact_index.py): float16 или int8 (масштаб на строку).
+   Перебор идёт по короткому префиксу вектора (EXACT_COARSE_DIMS координат, float32 — быстрый BLAS),
+   а top-k кандидатов пересчитывается по полному вектору: из файла (mmap) читаются только их строки.
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.services.search_config import EMBEDDING_DIMENSIONS
+
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+# Сколько строк за раз переводим в float32 при переборе квантованной матрицы (ограничивает пик памяти)
+SCORE_CHUNK_ROWS = 8192
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def truncate_matrix(matrix, dims: int = EMBEDDING_DIMENSIONS) -> np.ndarray:
+    """Первые dims координат каждой строки + нормировка."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dims and matrix.shape[-1] > dims:
+        matrix = matrix[..., :dims]
+    return normalize_rows(matrix)
+
+
+def truncate_embedding(vector: Sequence[float], dims: int = EMBEDDING_DIMENSIONS) -> List[float]:
+    """Один вектор: усечение + нормировка. Пустой вектор остаётся пустым."""
+    if vector is None or len(vector) == 0:
+        return []
+    return truncate_matrix(vector, dims).tolist()
+
+
+def truncate_embeddings(vectors: List[Sequence[float]], dims: int = EMBEDDING_DIMENSIONS) -> List[List[float]]:
+    if not vectors:
+        return []
+    return truncate_matrix(vectors, dims).tolist()
+
+
+def quantize(matrix: np.ndarray, mode: str) -> Dict[str, np.ndarray]:
+    """
+    Квантованная копия нормированной матрицы:
+    none -> {"codes": float32}; float16 -> {"codes": float16}; int8 -> {"codes": int8, "scale": float32 на строку}.
+    """
+    if mode == "none":
+        return {"codes": np.asarray(matrix, dtype=np.float32)}
+    if mode == "float16":
+        return {"codes": matrix.astype(np.float16)}
+    if mode == "int8":
+        scale = np.abs(matrix).max(axis=1) / 127.0
+        scale = np.where(scale == 0, 1.0, scale).astype(np.float32)
+        codes = np.clip(np.rint(matrix / scale[:, None]), -127, 127).astype(np.int8)
+        return {"codes": codes, "scale": scale}
+    raise ValueError(f"Неизвестный режим квантования: {mode}")
+
+
+def dequantize_rows(codes: np.ndarray, scale: Optional[np.ndarray], rows) -> np.ndarray:
+    """float32-векторы выбранных строк (из mmap читаются только они)."""
+    vectors = np.asarray(codes[rows], dtype=np.float32)
+    if scale is not None:
+        vectors *= np.asarray(scale[rows], dtype=np.float32)[..., None]
+    return vectors
+
+
+def score_quantized(codes: np.ndarray, scale: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+    """Скалярные произведения (строк x запросов) по квантованной матрице, по частям (без префикса)."""
+    if codes.dtype == np.float32:
+        return np.asarray(codes @ queries.T)
+    scores = np.empty((codes.shape[0], queries.shape[0]), dtype=np.float32)
+    for start in range(0, codes.shape[0], SCORE_CHUNK_ROWS):
+        chunk = np.asarray(codes[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+        scores[start:start + len(chunk)] = chunk @ queries.T
+    if scale is not None:
+        scores *= np.asarray(scale)[:, None]
+    return scores
@@ -25,7 +25,7 @@ from app.platforms.telegram.handlers import menu_cmds_router
 from app.web.webhooks import yookassa_webhook_handler
 from app.core.redis_client import redis_client as redis
 from app.core.services.service_worker import run_service_notifications
-from app.core.services.search_service import chroma_client
+from app.core.services.vector_backends import close_backend as close_search_backend
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -90,9 +90,10 @@ async def graceful_shutdown(worker_task: asyncio.Task, runner: web.AppRunner):
 async def on_shutdown(dispatcher: Dispatcher):
     logger.info("⏹️ Завершение работы бота...")
 
-    # 1. Закрываем ChromaDB — сбрасывает буферы на диск, защищает chroma.sqlite3 от порчи
+    # 1. Закрываем ChromaDB (или соединения с поисковым сервисом) — сбрасывает буферы на диск,
+    # защищает chroma.sqlite3 от порчи
     try:
-        chroma_client._system.stop()
+        await close_search_backend()
         logger.info("✅ ChromaDB остановлен корректно")
     except Exception as e:
         logger.warning(f"⚠️ Ошибка при остановке ChromaDB: {e}")
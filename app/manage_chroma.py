@@ -1,4 +1,5 @@
 import os
+import sys
 import chromadb
 from pathlib import Path
 
@@ -8,20 +9,34 @@ from pathlib import Path
 # 3. .parent   -> папка PROkolyaski (КОРЕНЬ, где лежит chromadb_storage)
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-CHROMA_DB_PATH = os.path.join(BASE_DIR, "chromadb_storage")
+sys.path.append(str(BASE_DIR))
+from app.core.services.search_config import CHROMA_DB_PATH, SEARCH_BACKEND
+from app.core.services.hnsw_params import collection_metadata
+from app.core.services.feed_validators import forget_feed_validators, save_feed_validators
+from app.core.services.feed_shards import shard_collection_name
+from app.core.services.index_version import (
+    collection_name, current_index_version, load_index_pointer, save_index_pointer, remove_orphan_segment_dirs,
+)
 
 # Проверка (чтобы ты видел в консоли, куда он смотрит)
 print(f"📁 Ищу базу по пути: {CHROMA_DB_PATH}")
 
 # Инициализация клиента
 chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-collection = chroma_client.get_or_create_collection(name="strollers")
+# Рабочая версия индекса (update_vectors.py собирает новую рядом и переключает указатель index_version.json)
+live_version = current_index_version()
+# Те же метаданные, что у update_vectors.py (иначе новая коллекция создастся с метрикой L2)
+collection = chroma_client.get_or_create_collection(
+    name=collection_name(live_version), metadata=collection_metadata()
+)
 
 
 def show_stats():
     """Показывает сколько всего товаров в базе"""
     count = collection.count()
-    print(f"\n📊 Всего товаров в векторной базе: {count}")
+    pointer = load_index_pointer()
+    print(f"\n🧱 Версия индекса: {live_version or 'без версии'} (история: {pointer.get('history', [])})")
+    print(f"📊 Всего товаров в векторной базе: {count}")
     if count > 0:
         # Показываем пример метаданных первого товара, чтобы убедиться, что source_url пишется
         peek = collection.peek(limit=1)
@@ -58,15 +73,61 @@ def delete_by_feed_url():
     if confirm == "yes":
         collection.delete(where={"source_url": url})
         print(f"✅ Успешно удалено {count} записей.")
+
+        # Шард фида (коллекция strollers_<версия>_<url_hash>, см. app/core/services/feed_shards.py)
+        shard_name = shard_collection_name(url, live_version)
+        try:
+            chroma_client.delete_collection(name=shard_name)
+            remove_orphan_segment_dirs()
+            print(f"✅ Шард {shard_name} удалён.")
+        except Exception:
+            pass
+
+        # Иначе update_vectors.py получит 304 на тот же фид и не загрузит его заново
+        forget_feed_validators(url)
     else:
         print("🚫 Операция отменена.")
 
 
+def rollback_version():
+    """
+    Возвращает предыдущую версию индекса (например, после неудачного обновления фидов).
+    Боты переключаются на неё сами, без перезапуска (указатель index_version.json).
+    """
+    history = load_index_pointer().get("history", [])
+    if len(history) < 2:
+        print("⚠️ Предыдущей версии нет — откатываться некуда.")
+        return
+
+    current, previous = history[0], history[1]
+    try:
+        rows = chroma_client.get_collection(name=collection_name(previous)).count()
+    except Exception:
+        print(f"❌ Коллекция версии {previous or 'без версии'} не найдена.")
+        return
+
+    confirm = input(
+        f"Откатить индекс {current} -> {previous or 'без версии'} ({rows} товаров)? (yes/no): "
+    ).lower()
+    if confirm != "yes":
+        print("🚫 Операция отменена.")
+        return
+
+    save_index_pointer(previous, [previous, current], rolled_back_from=current)
+    # Валидаторы описывают откаченную версию: следующий цикл должен скачать все фиды заново
+    save_feed_validators({})
+    print(f"✅ Рабочая версия индекса: {previous or 'без версии'}. Следующий цикл update_vectors.py удалит {current}.")
+    if SEARCH_BACKEND == "pgvector":
+        # У таблицы product_vectors нет версий: она остаётся с товарами откаченной версии
+        print("⚠️ pgvector не откатывается: product_vectors обновит следующий цикл update_vectors.py.")
+
+
 def menu():
     while True:
         print("\n=== 🦖 CHROMA DB ADMIN ===")
         print("1. 📊 Статистика базы")
         print("2. 🗑 Удалить YML файл (Уход уникального магазина)")
+        print("3. ⏪ Откатить индекс на предыдущую версию")
         print("0. Выход")
 
         choice = input("Ваш выбор: ")
@@ -75,6 +136,8 @@ def menu():
             show_stats()
         elif choice == "2":
             delete_by_feed_url()
+        elif choice == "3":
+            rollback_version()
         elif choice == "0":
             break
         else:
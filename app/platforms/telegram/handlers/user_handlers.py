@@ -31,6 +31,7 @@ from app.core.openai_assistant.responses_client import ask_responses_api
 from app.core.openai_assistant.prompts_config import get_system_prompt, get_marketing_footer
 from app.core.services.pay_config import PAYMENTS
 from app.core.services.search_service import search_products
+from app.core.services.search_config import TOP_SHOPS_IDS, LLM_CONTEXT_TOP_K
 from app.core.services.user_service import get_user_cached, update_user_requests, update_user_flags, try_reserve_request, refund_request
 from app.core.redis_client import redis_client
 
@@ -54,10 +55,6 @@ class AIChat(StatesGroup):
     info_mode = State()     # Режим вопросов (работает Google Search / Общие знания)
 
 
-# ID магазинов, по которым ищем для ПЛАТНЫХ пользователей
-# 🔥🔥🔥🔥🔥🔥🔥🔥(Замени цифры на реальные ID твоих 5 крупных магазинов в БД)🔥🔥🔥🔥🔥🔥🔥🔥
-TOP_SHOPS_IDS = [2]
-
 
 # #Технический хендлер для определения id гифки
 # @for_user_router.message()
@@ -347,14 +344,14 @@ async def _run_auto_request_task(
                         user_query="",
                         quiz_json=quiz_json_obj,
                         allowed_magazine_ids=current_magazine.id,
-                        top_k=10
+                        top_k=LLM_CONTEXT_TOP_K
                     )
                 elif feed_url == "PREMIUM_AGGREGATOR":
                     products_context = await search_products(
                         user_query="",
                         quiz_json=quiz_json_obj,
                         allowed_magazine_ids=TOP_SHOPS_IDS,
-                        top_k=10
+                        top_k=LLM_CONTEXT_TOP_K
                     )
                 else:
                     final_shop_url = current_magazine.url_website
@@ -364,7 +361,7 @@ async def _run_auto_request_task(
                     user_query="",
                     quiz_json=quiz_json_obj,
                     allowed_magazine_ids=TOP_SHOPS_IDS,
-                    top_k=10
+                    top_k=LLM_CONTEXT_TOP_K
                 )
 
             # --- ГЕНЕРАЦИЯ ОТВЕТА (долгая операция) ---
@@ -561,14 +558,14 @@ async def _run_ai_message_task(
                             user_query=user_text,
                             quiz_json=quiz_json_obj,
                             allowed_magazine_ids=current_magazine.id,
-                            top_k=10
+                            top_k=LLM_CONTEXT_TOP_K
                         )
                     elif feed_url == "PREMIUM_AGGREGATOR":
                         products_context = await search_products(
                             user_query=user_text,
                             quiz_json=quiz_json_obj,
                             allowed_magazine_ids=TOP_SHOPS_IDS,
-                            top_k=10
+                            top_k=LLM_CONTEXT_TOP_K
                         )
                     else:
                         final_shop_url = current_magazine.url_website
@@ -577,7 +574,7 @@ async def _run_ai_message_task(
                         user_query=user_text,
                         quiz_json=quiz_json_obj,
                         allowed_magazine_ids=TOP_SHOPS_IDS,
-                        top_k=10
+                        top_k=LLM_CONTEXT_TOP_K
                     )
 
             # --- ГЕНЕРАЦИЯ (долгая операция) ---
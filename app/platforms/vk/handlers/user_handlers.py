@@ -30,6 +30,7 @@ from app.core.openai_assistant.responses_client import ask_responses_api
 from app.core.openai_assistant.prompts_config import get_system_prompt, get_marketing_footer
 from app.core.services.pay_config import PAYMENTS
 from app.core.services.search_service import search_products
+from app.core.services.search_config import TOP_SHOPS_IDS, LLM_CONTEXT_TOP_K
 from app.core.services.user_service import (
     get_user_cached,
     update_user_requests,
@@ -67,10 +68,6 @@ VK_AI_VIDEO = os.getenv("VK_AI_VIDEO", "")
 VK_STATYA_PAY = os.getenv("VK_STATYA_PAY")
 
 
-# ID магазинов для ПЛАТНЫХ пользователей (тот же список что в TG)
-TOP_SHOPS_IDS = [2]
-
-
 
 async def _get_state(vk_id: int, key: str) -> str | None:
     """Получает состояние: сначала Redis, fallback на память."""
@@ -599,8 +596,12 @@ async def _handle_ai_message(text, vk_id, peer_id, user, session, vk_api, ai_mod
     )
 
 
-async def _run_ai_task(vk_api, peer_id, vk_id, user_text, is_catalog, user, sm):
-    """Фоновая задача AI-ответа."""
+async def _run_ai_task(vk_api, peer_id, vk_id, user_text, is_catalog, user, sm, is_auto_request=False):
+    """Фоновая задача AI-ответа.
+
+    is_auto_request — кнопка «Подобрать коляску»: ищем только по квизу (пустой запрос),
+    чтобы search_products взял готовую подборку из quiz_shortlists.json.
+    """
     try:
         async with sm() as session:
             user_cached = await get_user_cached(session, vk_id, platform="vk")
@@ -636,22 +637,23 @@ async def _run_ai_task(vk_api, peer_id, vk_id, user_text, is_catalog, user, sm):
             final_shop_url = None
 
             if is_catalog:
+                search_query = "" if is_auto_request else user_text
                 if current_magazine:
                     feed_url = current_magazine.feed_url
                     if feed_url and "http" in feed_url:
                         products_context = await search_products(
-                            user_query=user_text, quiz_json=quiz_json_obj,
-                            allowed_magazine_ids=current_magazine.id, top_k=10)
+                            user_query=search_query, quiz_json=quiz_json_obj,
+                            allowed_magazine_ids=current_magazine.id, top_k=LLM_CONTEXT_TOP_K)
                     elif feed_url == "PREMIUM_AGGREGATOR":
                         products_context = await search_products(
-                            user_query=user_text, quiz_json=quiz_json_obj,
-                            allowed_magazine_ids=TOP_SHOPS_IDS, top_k=10)
+                            user_query=search_query, quiz_json=quiz_json_obj,
+                            allowed_magazine_ids=TOP_SHOPS_IDS, top_k=LLM_CONTEXT_TOP_K)
                     else:
                         final_shop_url = current_magazine.url_website
                 else:
                     products_context = await search_products(
-                        user_query=user_text, quiz_json=quiz_json_obj,
-                        allowed_magazine_ids=TOP_SHOPS_IDS, top_k=10)
+                        user_query=search_query, quiz_json=quiz_json_obj,
+                        allowed_magazine_ids=TOP_SHOPS_IDS, top_k=LLM_CONTEXT_TOP_K)
 
             # Генерация ответа
             mode_key = "catalog_mode" if is_catalog else "info_mode"
@@ -705,7 +707,8 @@ async def _handle_first_auto_request(vk_id, peer_id, user, session, vk_api, sm):
     await _send(vk_api, peer_id, "🔍 Анализирую ваши ответы из квиза и ищу лучшее решение...")
 
     asyncio.create_task(
-        _run_ai_task(vk_api, peer_id, vk_id, "Подбери мне подходящую коляску", True, user, sm)
+        _run_ai_task(vk_api, peer_id, vk_id, "Подбери мне подходящую коляску", True, user, sm,
+                     is_auto_request=True)
     )
 
 
@@ -0,0 +1,253 @@
+"""
+Подбор параметров HNSW для коллекции товаров: полнота (recall@10) против задержки (p50/p99).
+
+Что делает:
+1. Берёт фиксированный набор запросов (tuning_queries.npy рядом с базой). При первом запуске
+   или с --record набор записывается: профили квиза (как авто-запрос «Подобрать коляску»)
+   + свои запросы из --queries (JSONL: {"text": "...", "quiz": {...}}).
+2. Считает точный ответ перебором (numpy) — это эталон.
+3. Для каждой комбинации M / construction_ef строит временный индекс во временной папке
+   и прогоняет запросы при разных search_ef.
+4. Печатает таблицу и записывает выбранную настройку в hnsw_params.json:
+   самую быструю (по p99) из тех, у кого recall@10 не ниже --target-recall.
+
+search_ef записывается в рабочую коллекцию и во все шарды фидов её версии (feed_shards.py),
+действует после переоткрытия базы; M и construction_ef — при пересоздании коллекций.
+
+Запуск:
+  python app/tune_hnsw.py
+  python app/tune_hnsw.py --record --queries my_queries.jsonl --target-recall 0.97
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(dotenv_path=BASE_DIR / ".env")
+sys.path.append(str(BASE_DIR))
+
+import chromadb
+from chromadb.api.client import SharedSystemClient
+
+from app.core.services.search_config import CHROMA_DB_PATH, COLLECTION_METADATA
+from app.core.services.index_version import collection_name, current_index_version
+from app.core.services.hnsw_params import collection_metadata, load_hnsw_params, save_hnsw_params, apply_search_ef
+from app.core.services.feed_shards import load_shard_registry_file
+from app.core.services.quiz_shortlist import iter_quiz_profiles
+
+
+TUNING_QUERIES_PATH = os.path.join(CHROMA_DB_PATH, "tuning_queries.npy")
+TOP_K = 10
+
+GRID_M = [8, 16, 32]
+GRID_CONSTRUCTION_EF = [64, 128, 256]
+GRID_SEARCH_EF = [16, 32, 64, 128, 256]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def load_corpus(collection, page_size: int = 5000):
+    """Все векторы рабочей коллекции (ids + матрица)."""
+    ids, vectors = [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+    if not ids:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    return ids, np.vstack(vectors)
+
+
+async def record_queries(queries_file: str = None) -> np.ndarray:
+    """Фиксированный набор запросов: профили квиза + свои запросы из JSONL."""
+    from app.core.services.search_service import compose_query_vectors
+
+    parts = [("", profile) for profile in iter_quiz_profiles()]
+    if queries_file:
+        with open(queries_file, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    parts.append((item.get("text", ""), item.get("quiz")))
+
+    vectors = await compose_query_vectors(parts)
+    vectors = [v for v in vectors if v]
+    if not vectors:
+        raise RuntimeError("Не удалось получить эмбеддинги запросов (проверьте OPENAI_API_KEY)")
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    np.save(TUNING_QUERIES_PATH, matrix)
+    print(f"📝 Записано запросов: {len(matrix)} -> {TUNING_QUERIES_PATH}")
+    return matrix
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> list:
+    """Эталон: точный top-k по косинусу."""
+    scores = _normalize(queries) @ _normalize(corpus).T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def measure(collection, ids: list, queries: np.ndarray, truth: list, k: int) -> dict:
+    """recall@k и задержка одиночных запросов (как у бота: один вектор за раз)."""
+    position = {product_id: i for i, product_id in enumerate(ids)}
+    # Прогрев: первые запросы тянут страницы индекса в память
+    for query in queries[:5]:
+        collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len({position[x] for x in result["ids"][0]} & expected)
+
+    return {
+        "recall_at_10": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def _reopen(client, path: str, name: str):
+    """
+    Открывает коллекцию заново с диска: загруженный индекс держит старый search_ef,
+    новая конфигурация подхватывается только при повторном открытии.
+    """
+    with contextlib.suppress(Exception):
+        client._system.stop()
+    SharedSystemClient.clear_system_cache()
+    client = chromadb.PersistentClient(path=path)
+    return client, client.get_collection(name=name)
+
+
+def run_grid(ids: list, corpus: np.ndarray, queries: np.ndarray, truth: list, k: int) -> list:
+    rows = []
+
+    for m, construction_ef in itertools.product(GRID_M, GRID_CONSTRUCTION_EF):
+        with tempfile.TemporaryDirectory(prefix="tune_hnsw_") as path:
+            name = f"tune_m{m}_ef{construction_ef}"
+            params = {"M": m, "construction_ef": construction_ef, "search_ef": GRID_SEARCH_EF[0]}
+            client = chromadb.PersistentClient(path=path)
+            collection = client.create_collection(name=name, metadata=collection_metadata(params))
+
+            started = time.perf_counter()
+            for i in range(0, len(ids), 5000):
+                collection.add(ids=ids[i:i + 5000], embeddings=corpus[i:i + 5000].tolist())
+            build_s = time.perf_counter() - started
+
+            for search_ef in GRID_SEARCH_EF:
+                apply_search_ef(collection, search_ef)
+                client, collection = _reopen(client, path, name)
+
+                row = {"M": m, "construction_ef": construction_ef, "search_ef": search_ef, "build_s": round(build_s, 2)}
+                row.update(measure(collection, ids, queries, truth, k))
+                rows.append(row)
+                print(
+                    f"M={m:<3} construction_ef={construction_ef:<4} search_ef={search_ef:<4} "
+                    f"recall@10={row['recall_at_10']:.3f}  p50={row['p50_ms']:.2f}ms  p99={row['p99_ms']:.2f}ms"
+                )
+
+            with contextlib.suppress(Exception):
+                client._system.stop()
+            SharedSystemClient.clear_system_cache()
+
+    return rows
+
+
+def apply_to_shards(chroma_client, names, search_ef: int) -> list:
+    """search_ef в шарды фидов рабочей версии: бот ищет в них, когда шарды есть. -> шарды, где не вышло."""
+    failed = []
+    for name in names:
+        try:
+            apply_search_ef(chroma_client.get_collection(name=name), search_ef)
+        except Exception as e:
+            print(f"⚠️ Шард {name}: search_ef не применён ({e})")
+            failed.append(name)
+    return failed
+
+
+def choose(rows: list, target_recall: float) -> dict:
+    """Самая быстрая (p99, затем p50) настройка с достаточной полнотой; иначе — самая полная."""
+    good = [row for row in rows if row["recall_at_10"] >= target_recall]
+    if good:
+        return min(good, key=lambda row: (row["p99_ms"], row["p50_ms"]))
+    return max(rows, key=lambda row: (row["recall_at_10"], -row["p99_ms"]))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Подбор параметров HNSW для коллекции товаров")
+    parser.add_argument("--record", action="store_true", help="заново записать набор запросов")
+    parser.add_argument("--queries", help="JSONL со своими запросами: {\"text\": ..., \"quiz\": {...}}")
+    parser.add_argument("--target-recall", type=float, default=0.95, help="минимальный recall@10 (0..1)")
+    parser.add_argument("--dry-run", action="store_true", help="только отчёт, без записи hnsw_params.json")
+    args = parser.parse_args()
+
+    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+    # Рабочая версия индекса (index_version.py)
+    collection = chroma_client.get_or_create_collection(
+        name=collection_name(current_index_version()), metadata=collection_metadata()
+    )
+
+    ids, corpus = load_corpus(collection)
+    if len(ids) < TOP_K:
+        print("⚠️ В базе слишком мало товаров для тюнинга")
+        return
+
+    if args.record or args.queries or not os.path.exists(TUNING_QUERIES_PATH):
+        queries = await record_queries(args.queries)
+    else:
+        queries = np.load(TUNING_QUERIES_PATH)
+
+    print(f"📊 Товаров: {len(ids)}, запросов: {len(queries)}, метрика: {COLLECTION_METADATA['hnsw:space']}")
+    print(f"⚙️ Текущие параметры: {load_hnsw_params()}\n")
+
+    truth = exact_top_k(corpus, queries, TOP_K)
+    rows = run_grid(ids, corpus, queries, truth, TOP_K)
+    best = choose(rows, args.target_recall)
+
+    print(
+        f"\n✅ Выбрано: M={best['M']}, construction_ef={best['construction_ef']}, search_ef={best['search_ef']} "
+        f"(recall@10={best['recall_at_10']:.3f}, p50={best['p50_ms']:.2f}ms, p99={best['p99_ms']:.2f}ms)"
+    )
+    if args.dry_run:
+        return
+
+    save_hnsw_params(best, report={
+        "recall_at_10": best["recall_at_10"],
+        "p50_ms": best["p50_ms"],
+        "p99_ms": best["p99_ms"],
+        "corpus_size": len(ids),
+        "queries": len(queries),
+    })
+    apply_search_ef(collection, best["search_ef"])
+    shards = load_shard_registry_file()
+    failed = apply_to_shards(chroma_client, shards, best["search_ef"])
+    print(f"💾 Записано в hnsw_params.json. search_ef применён к рабочей коллекции и шардам фидов "
+          f"({len(shards) - len(failed)} из {len(shards)})")
+    if failed:
+        print("   Шарды, где не вышло, получат его при следующей сборке индекса (update_vectors.py).")
+    print("   (бот и поисковый сервис подхватят его после перезагрузки базы);")
+    print("   M и construction_ef вступят в силу для вновь созданных коллекций (шардов и пересборки базы).")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,14 @@
 ﻿import asyncio
 import os
 import logging
-import xml.etree.ElementTree as ET
 import hashlib
-from typing import List, Dict
+import json
+import random
+import time
+from typing import Awaitable, List, Dict, Optional, Tuple
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor
 
 import aiohttp
 import chromadb
@@ -32,6 +35,39 @@ import sys
 
 sys.path.append(str(BASE_DIR))
 from app.core.db.models import Magazine
+from app.core.services.search_config import (
+    CHROMA_DB_PATH, EMBEDDING_MODEL, SEARCH_TOP_K, TOP_SHOPS_IDS,
+    SEARCH_SERVICE_URL, SEARCH_BACKEND, ATTRIBUTE_FILTER_MIN_HITS, FEED_CONCURRENCY, EMBEDDING_CONCURRENCY,
+    FEED_PARSE_WORKERS,
+    INDEX_KEEP_VERSIONS, INDEX_MIN_ROWS_RATIO, INDEX_SPOT_CHECKS, INDEX_SPOT_CHECK_MIN_RECALL,
+)
+from app.core.services.search_filters import (
+    magazine_flags, magazine_flag_key, build_magazine_where, combine_where,
+)
+from app.core.services.quiz_shortlist import iter_quiz_profiles, profile_key, magazine_set_key, save_shortlists
+from app.core.services.search_service import compose_query_vectors, select_unique_hits
+from app.core.services.lexical_index import build_lexical_index, save_lexical_index
+from app.core.services.feed_parser import FeedStream, FEED_QUEUE_BATCHES, probe_feed
+from app.core.services.feed_diff import FeedDiff
+from app.core.services.feed_categories import CategoryFilter
+from app.core.services.feed_validators import feed_state, load_feed_validators, save_feed_validators
+from app.core.services.embedding_limiter import EmbeddingLimiter
+from app.core.services.embedding_store import embedding_store
+from app.core.services.product_attributes import quiz_constraints, relax_constraints, constraint_filters
+from app.core.services.exact_index import (
+    save_exact_shard, load_exact_manifest, save_exact_manifest, link_exact_shard,
+)
+from app.core.services.pgvector_store import upsert_rows, load_feed_ids, apply_vector_changes, count_vectors
+from app.core.services.hnsw_params import collection_metadata, apply_search_ef
+from app.core.services.vector_codec import truncate_embeddings
+from app.core.services.feed_shards import (
+    feed_url_hash, shard_collection_name, save_shard_registry,
+)
+from app.core.services.index_version import (
+    new_index_version, collection_name, collection_version, current_index_version,
+    load_index_pointer, save_index_pointer, remove_version_files, list_version_dirs, remove_orphan_segment_dirs,
+)
+from app.core.services.vector_backends import get_backend
 
 # === НАСТРОЙКИ ===
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -39,164 +75,939 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# Повторы на 429/сбоях делает EmbeddingLimiter (общая пауза на все фиды), встроенные повторы клиента выключены
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
 
 # === 🔥 НАСТРОЙКА CHROMA DB ===
-# Указываем путь к папке, где будут лежать файлы базы
-CHROMA_DB_PATH = os.path.join(BASE_DIR, "chromadb_storage")
+# Путь к папке базы (chromadb_storage) и имя коллекции — в search_config.py
 
 # Создаем клиент (PersistentClient сохраняет данные на диск)
 chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
 
-# Создаем коллекцию (аналог Index в Pinecone)
-# metadata={"hnsw:space": "cosine"} говорит базе использовать косинусное сходство (как в Pinecone)
-collection = chroma_client.get_or_create_collection(name="strollers", metadata={"hnsw:space": "cosine"})
+# 🔥 Blue/green (index_version.py): каждый цикл пишет новую версию индекса рядом с рабочей,
+# боты до переключения указателя ищут по рабочей. Коллекции открывает open_index_build():
+# collection      — собираемая версия (все записи идут сюда),
+# live_collection — рабочая версия (только чтение: старые векторы и состояние фидов), None — её ещё нет
+# build_excluded  — товаров рабочей версии, убранных правилами категорий (validate_build не считает это сбоем)
+# pg_upserts / pg_deletes — отложенные записи в pgvector (у него нет версий): применяются одной транзакцией
+#                   после publish_build (sync_pgvector), отвергнутая validate_build сборка таблицу не трогает
+build_version: Optional[str] = None
+live_version: Optional[str] = None
+collection = None
+live_collection = None
+build_excluded = 0
+pg_upserts: Dict[str, Tuple[List[str], set]] = {}   # {feed_url: (магазины фида, ID товаров)}
+pg_deletes: set = set()
 
+CARRY_OVER_BATCH = 1000   # Строк за один upsert при переносе фида из рабочей версии
+
+
+def open_index_build(version: Optional[str] = None):
+    """Начинает сборку новой версии индекса рядом с рабочей."""
+    global build_version, live_version, collection, live_collection, build_excluded
+
+    live_version = current_index_version()
+    build_excluded = 0
+    pg_upserts.clear()
+    pg_deletes.clear()
+    build_version = version or new_index_version()
+    while build_version == live_version:
+        # Прошлая сборка была в эту же секунду — у версии должно быть новое имя
+        time.sleep(1)
+        build_version = new_index_version()
 
-async def download_feed(session: aiohttp.ClientSession, url: str) -> str:
     try:
-        async with session.get(url, timeout=60) as response:
-            if response.status == 200:
-                return await response.text()
+        live_collection = chroma_client.get_collection(name=collection_name(live_version))
+    except Exception:
+        live_collection = None
+
+    # "hnsw:space": "cosine" говорит базе использовать косинусное сходство (как в Pinecone),
+    # M / construction_ef / search_ef — из .env или hnsw_params.json (app/tune_hnsw.py)
+    collection = chroma_client.get_or_create_collection(
+        name=collection_name(build_version), metadata=collection_metadata()
+    )
+    logger.info(f"🧱 Сборка версии индекса {build_version} (рабочая: {live_version or 'без версии'})")
+
+
+def open_build_shard(feed_url: str):
+    """🔥 Шард фида в собираемой версии: отдельная маленькая коллекция только с его товарами (см. feed_shards.py)."""
+    shard = chroma_client.get_or_create_collection(
+        name=shard_collection_name(feed_url, build_version), metadata=collection_metadata()
+    )
+    apply_search_ef(shard)
+    return shard
+
+
+async def get_embeddings_batch(texts: List[str], limiter: Optional[EmbeddingLimiter] = None) -> List[List[float]]:
+    """
+    Векторы текстов: сначала хранилище по содержимому (embedding_store.py), в OpenAI — только новые тексты,
+    одинаковые тексты пачки — одной строкой запроса. При ошибке OpenAI — [] (пачка не загружается).
+    """
+    vectors = embedding_store.get_many(texts)
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+
+    if missing:
+        async def request():
+            return await openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=missing
+            )
+
+        try:
+            response = await (limiter.call(request) if limiter else request())
+        except Exception as e:
+            logger.error(f"Ошибка OpenAI Embeddings: {e}")
+            return []
+
+        fresh = [data.embedding for data in response.data]
+        embedding_store.put_many(missing, fresh)
+        by_text = dict(zip(missing, fresh))
+        vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+
+    # Усечение до EMBEDDING_DIMENSIONS + нормировка (при 1536 векторы не меняются)
+    return truncate_embeddings(vectors)
+
+
+async def embed_products(
+        to_embed: List[Dict],
+        to_reuse: List[Dict],
+        limiter: Optional[EmbeddingLimiter] = None
+) -> Tuple[List[Dict], List[List[float]]]:
+    """
+    Векторы для пачки: у товаров с прежним текстом берём вектор из рабочей версии, остальные — в OpenAI.
+    Товары, для которых вектор получить не удалось, в ответ не попадают.
+    """
+    to_embed = list(to_embed)
+    products, embeddings = [], []
+
+    if to_reuse and live_collection is None:
+        to_embed.extend(to_reuse)
+    elif to_reuse:
+        found = live_collection.get(ids=[p["vector_id"] for p in to_reuse], include=["embeddings"])
+        by_id = dict(zip(found['ids'], found['embeddings']))
+        for product in to_reuse:
+            vector = by_id.get(product["vector_id"])
+            if vector is None:
+                to_embed.append(product)
             else:
-                logger.error(f"Ошибка скачивания фида {url}: Status {response.status}")
-                return None
-    except Exception as e:
-        logger.error(f"Ошибка соединения с {url}: {e}")
-        return None
+                products.append(product)
+                embeddings.append([float(x) for x in vector])
 
+    if to_embed:
+        vectors = await get_embeddings_batch([p["text"] for p in to_embed], limiter)
+        if vectors:
+            products.extend(to_embed)
+            embeddings.extend(vectors)
+
+    return products, embeddings
+
+
+async def store_batch(
+        batch: List[Dict],
+        embeddings: List[List[float]],
+        feed_url: str,
+        mag_ids: List[str],
+        shard,
+        pg_engine=None,
+        pg_ids: Optional[set] = None
+) -> int:
+    """
+    Upsert пачки товаров (с готовыми векторами) в собираемую версию: общая коллекция и шард фида.
+    pg_engine — ещё и в pgvector (после publish_build, см. sync_pgvector); pg_ids — только эти товары
+    (неизменённые там уже лежат).
+    """
+    if not batch: return 0
+
+    # Превращаем список ID в строку "1,2,5"
+    mag_ids_str = ",".join(mag_ids)
+
+    # === 🔥 ИЗМЕНЕНИЯ ПОД CHROMADB ===
+    ids_batch = []
+    embeddings_batch = []
+    metadatas_batch = []
+    documents_batch = []
+
+    for j, product in enumerate(batch):
+        vector_id = product["vector_id"]
+
+        meta = product["metadata"]
+
+        # 🔥 ВАЖНОЕ ДОБАВЛЕНИЕ: Сохраняем ссылку-источник
+        # Это нужно для manage_chroma.py, чтобы удалять фиды целиком
+        meta["source_url"] = feed_url
+
+        # Добавляем ID магазинов (для фильтрации "свой-чужой")
+        # magazine_ids_str — для людей и manage_chroma.py,
+        # флаги mag_<id> — для нативного where-фильтра Chroma в search_service
+        meta["magazine_ids_str"] = mag_ids_str
+        meta.update(magazine_flags(mag_ids))
+
+        ids_batch.append(vector_id)
+        embeddings_batch.append(embeddings[j])
+        metadatas_batch.append(meta)
+        documents_batch.append(product["text"])
+
+    def write_chroma():
+        # Upsert в Chroma
+        collection.upsert(
+            ids=ids_batch,
+            embeddings=embeddings_batch,
+            metadatas=metadatas_batch,
+            documents=documents_batch
+        )
+        # В шард — без documents: текст нужен только BM25-индексу, он строится по общей коллекции
+        shard.upsert(ids=ids_batch, embeddings=embeddings_batch, metadatas=metadatas_batch)
 
-def parse_offers_from_xml(xml_content: str) -> List[Dict]:
-    products = []
     try:
-        root = ET.fromstring(xml_content)
-        for offer in root.findall(".//offer"):
-            available = offer.get("available")
-            if available == "false":
-                continue
-
-            name = offer.findtext("name") or offer.findtext("model")
-            # Важно: используем raw_description, чтобы не было ошибки имени переменной
-            raw_description = offer.findtext("description") or ""
-            url = offer.findtext("url")
-            price = offer.findtext("price")
-            vendor = offer.findtext("vendor") or ""
-
-            # --- Сбор характеристик из тегов <param> ---
-            params_list = []
-            for param in offer.findall("param"):
-                p_name = param.get("name")
-                p_value = param.text
-                if p_name and p_value:
-                    params_list.append(f"{p_name}: {p_value}")
-
-            # Собираем строку характеристик
-            params_str = "; ".join(params_list)
-
-            # Формируем "Умное описание" для AI
-            # Сначала факты (параметры), потом лирика (описание)
-            full_description = f"Характеристики: {params_str}. Описание: {raw_description}"
-            # --- КОНЕЦ БЛОКА ---
-
-            # Текст для Вектора
-            full_text_for_search = f"{name} {vendor} {params_str} {raw_description} Цена: {price}".strip()
-
-            if name and url:
-                products.append({
-                    "id": offer.get("id"),
-                    "text": full_text_for_search,
-                    "metadata": {
-                        "name": name,
-                        "url": url,
-                        "price": price,
-                        # Обрезаем описание до 3000 символов (твой новый лимит)
-                        "description": full_description[:3000]
-                    }
-                })
+        # В потоке: запись в SQLite Chroma не останавливает скачивание фидов и ответы OpenAI
+        await asyncio.to_thread(write_chroma)
     except Exception as e:
-        logger.error(f"Ошибка парсинга XML: {e}")
+        logger.error(f"Ошибка ChromaDB Upsert: {e}")
+        return 0
+
+    if pg_engine is not None:
+        stage_pg_upsert(feed_url, mag_ids, [i for i in ids_batch if pg_ids is None or i in pg_ids])
+
+    return len(ids_batch)
 
-    return products
 
+def stage_pg_upsert(feed_url: str, mag_ids: List[str], ids: List[str]):
+    """Товары для pgvector: векторы и метаданные sync_pgvector возьмёт из опубликованной версии Chroma."""
+    if ids:
+        pg_upserts.setdefault(feed_url, (mag_ids, set()))[1].update(ids)
 
-async def get_embeddings_batch(texts: List[str]) -> List[List[float]]:
+
+async def load_feed_diff(feed_url: str, pg_engine=None) -> FeedDiff:
+    """Что уже лежит в рабочей версии по фиду: хэши товаров из шарда + ID из общей коллекции и pgvector."""
     try:
-        response = await openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=texts
-        )
-        return [data.embedding for data in response.data]
+        shard = chroma_client.get_collection(name=shard_collection_name(feed_url, live_version))
+        stored = shard.get(include=["metadatas"])
+    except Exception:
+        stored = {"ids": [], "metadatas": []}
+
+    global_ids = set()
+    if live_collection is not None:
+        global_ids = set(live_collection.get(where={"source_url": feed_url}, include=[])['ids'])
+    pg_ids = await load_feed_ids(pg_engine, feed_url) if pg_engine is not None else None
+
+    # Пропускать можно только товары, которые есть во всех хранилищах
+    present = global_ids if pg_ids is None else global_ids & pg_ids
+    known = [(i, m) for i, m in zip(stored['ids'], stored['metadatas']) if i in present]
+    return FeedDiff.from_metadatas(
+        [i for i, _ in known], [m for _, m in known],
+        stored_ids={*stored['ids'], *global_ids, *(pg_ids or ())},
+    )
+
+
+def shard_rows(feed_url: str) -> int:
+    """Товаров фида в рабочей версии."""
+    try:
+        return chroma_client.get_collection(name=shard_collection_name(feed_url, live_version)).count()
+    except Exception:
+        return 0
+
+
+def reuse_exact_shard(url_hash: str, mag_ids: List[str]) -> Optional[dict]:
+    """Шард точного поиска рабочей версии (если он про те же магазины) — ссылками в собираемую версию."""
+    previous = load_exact_manifest(live_version).get(url_hash)
+    if previous and previous.get("magazine_ids") == mag_ids and link_exact_shard(url_hash, live_version, build_version):
+        return previous
+    return None
+
+
+def delete_vanished(ids: List[str], pg_engine=None):
+    """
+    Пропавшие из фида товары: в новую версию Chroma они не копируются,
+    из pgvector (он без версий) удаляются вместе с публикацией версии (sync_pgvector).
+    """
+    if pg_engine is not None:
+        pg_deletes.update(ids)
+
+
+async def sync_pgvector(pg_engine) -> int:
+    """
+    Отложенные записи сборки -> pgvector одной транзакцией, когда версия уже опубликована.
+    Векторы, метаданные и тексты читаются из неё страницами (в памяти цикла они не копятся).
+    Сбой — в таблице остаётся прежний каталог целиком; недостающее доберёт следующий цикл
+    (сверка при переносе фида, index_is_current).
+    """
+    if pg_engine is None or not (pg_upserts or pg_deletes):
+        return 0
+
+    async def pages():
+        for feed_url, (mag_ids, ids) in pg_upserts.items():
+            ids = sorted(ids)
+            for i in range(0, len(ids), CARRY_OVER_BATCH):
+                found = await asyncio.to_thread(
+                    collection.get, ids=ids[i:i + CARRY_OVER_BATCH], include=["embeddings", "metadatas", "documents"]
+                )
+                yield upsert_rows(
+                    found['ids'], found['embeddings'], found['metadatas'], found['documents'], mag_ids, feed_url
+                )
+
+    upserted = {i for _, ids in pg_upserts.values() for i in ids}
+    written = await apply_vector_changes(pg_engine, pg_deletes - upserted, pages())
+    logger.info(f"🐘 pgvector: записано {written} товаров, удалено {len(pg_deletes - upserted)}")
+    return written
+
+
+def live_feed_rows(feed_url: str, exclude: set) -> Tuple[List[Dict], List[List[float]]]:
+    """Товары фида из рабочей версии, которых ещё нет в собираемой (и нет в exclude)."""
+    if live_collection is None:
+        return [], []
+
+    found = live_collection.get(where={"source_url": feed_url}, include=["embeddings", "metadatas", "documents"])
+    built = set(collection.get(where={"source_url": feed_url}, include=[])['ids'])
+    flag_prefix = magazine_flag_key("")
+
+    products, embeddings = [], []
+    for vector_id, vector, meta, document in zip(
+            found['ids'], found['embeddings'], found['metadatas'], found['documents']
+    ):
+        if vector_id in built or vector_id in exclude:
+            continue
+        # Флаги магазинов проставит store_batch заново: состав магазинов фида мог поменяться
+        meta = {key: value for key, value in meta.items() if not key.startswith(flag_prefix)}
+        products.append({"vector_id": vector_id, "metadata": meta, "text": document or ""})
+        embeddings.append([float(x) for x in vector])
+    return products, embeddings
+
+
+async def carry_over_feed(
+        feed_url: str, mag_ids: List[str], writer: "UpsertWriter", exclude=(), pg_engine=None
+) -> int:
+    """
+    Переносит товары фида из рабочей версии в собираемую как есть (без OpenAI).
+    Нужно, когда фид не изменился (304 / тот же sha256) или не загрузился целиком:
+    иначе в новой версии от магазина остались бы только записанные в этот раз товары.
+    pg_engine — перенесённых товаров, которых нет в pgvector, туда дописываем (reconcile_pg_feed).
+    """
+    products, embeddings = await asyncio.to_thread(live_feed_rows, feed_url, set(exclude))
+    if not products:
+        return 0
+    if pg_engine is not None:
+        await reconcile_pg_feed(feed_url, mag_ids, [p["vector_id"] for p in products], pg_engine)
+
+    shard = open_build_shard(feed_url)
+    stored = 0
+    for i in range(0, len(products), CARRY_OVER_BATCH):
+        stored += await writer.submit(store_batch(
+            products[i:i + CARRY_OVER_BATCH], embeddings[i:i + CARRY_OVER_BATCH], feed_url, mag_ids, shard
+        ))
+    logger.info(f"📋 Перенесено из рабочей версии: {stored} товаров ({feed_url})")
+    return stored
+
+
+async def reconcile_pg_feed(feed_url: str, mag_ids: List[str], ids: List[str], pg_engine):
+    """
+    Сверка pgvector с переносимыми товарами: таблица могла отстать от Chroma
+    (SEARCH_BACKEND=pgvector включили на работающей базе, прошлая синхронизация упала).
+    Без этого неизменённый фид не попал бы в pgvector, пока не поменяется его тело.
+    """
+    try:
+        pg_ids = await load_feed_ids(pg_engine, feed_url)
     except Exception as e:
-        logger.error(f"Ошибка OpenAI Embeddings: {e}")
-        return []
+        logger.error(f"Ошибка чтения pgvector ({feed_url}): {e}")
+        return
+    missing = [i for i in ids if i not in pg_ids]
+    if missing:
+        stage_pg_upsert(feed_url, mag_ids, missing)
+        logger.info(f"🐘 В pgvector нет {len(missing)} товаров фида {feed_url} — допишем из рабочей версии")
+
 
+class UpsertWriter:
+    """
+    Единственный писатель в Chroma и pgvector на весь цикл загрузки.
+
+    Фиды и пачки эмбеддятся параллельно, а записи (store_batch, удаление пропавших товаров)
+    идут через одну очередь по одной: SQLite под Chroma всё равно пишет последовательно,
+    а так параллельные фиды не дерутся за блокировку базы.
+
+        async with UpsertWriter() as writer:
+            loaded = await writer.submit(store_batch(...))
+    """
+
+    def __init__(self, max_pending: int = FEED_QUEUE_BATCHES):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self.writes = 0
+        self.rows = 0
+        self.busy_s = 0.0
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._queue.put(None)
+        await self._task
+
+    async def submit(self, write: Awaitable):
+        """Поставить запись в очередь и дождаться её результата (ошибка записи уходит вызывающему)."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((write, future))
+        return await future
+
+    async def _run(self):
+        while (job := await self._queue.get()) is not None:
+            write, future = job
+            started = time.perf_counter()
+            try:
+                result = await write
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if isinstance(result, int):
+                    self.rows += result   # store_batch -> записано строк
+                if not future.done():
+                    future.set_result(result)
+            self.writes += 1
+            self.busy_s += time.perf_counter() - started
+
+
+class StageStats:
+    """
+    Пропускная способность стадий загрузки: сколько единиц обработала стадия и сколько секунд на это ушло.
+    Стадии идут внахлёст, поэтому у каждой своё время (сумма по фидам/пачкам), а не общее время цикла:
+    download — ожидание сети, parse — CPU воркеров, embed — эмбеддинг пачек (с ожиданием лимита), write — запись.
+    """
+
+    UNITS = {"download": "MB", "parse": "товаров", "embed": "товаров", "write": "строк"}
+
+    def __init__(self):
+        self.units: Dict[str, float] = defaultdict(float)
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+    def add(self, stage: str, units: float, seconds: float):
+        if not units and not seconds:
+            return   # Фид не скачивался / не разбирался (304) — стадия не работала
+        self.units[stage] += units
+        self.seconds[stage] += seconds
+
+    def as_dict(self) -> Dict[str, dict]:
+        return {
+            stage: {
+                "units": round(self.units[stage], 1),
+                "seconds": round(self.seconds[stage], 2),
+                "per_s": round(self.units[stage] / self.seconds[stage], 1) if self.seconds[stage] else None,
+            }
+            for stage in self.UNITS if stage in self.units
+        }
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{stage} {row['per_s']} {self.UNITS[stage]}/s ({row['seconds']}s)"
+            for stage, row in self.as_dict().items()
+        )
+
+
+async def process_feed_group(
+        session: aiohttp.ClientSession,
+        feed_url: str,
+        magazines: List[Magazine],
+        pg_engine=None,
+        writer: Optional[UpsertWriter] = None,
+        limiter: Optional[EmbeddingLimiter] = None,
+        feed_validators: Optional[Dict[str, dict]] = None,
+        parse_pool: Optional[Executor] = None,
+        stats: Optional[StageStats] = None
+):
+    """
+    Потоковая загрузка фида в собираемую версию индекса (open_index_build):
+    скачивание + разбор (FeedStream, офферы разбираются в parse_pool) и эмбеддинг + upsert
+    работают параллельно, между ними очередь из FEED_QUEUE_BATCHES пачек по 100 товаров.
+    В эмбеддинге одновременно до EMBEDDING_CONCURRENCY пачек фида (общий лимит — limiter),
+    готовые пачки пишет writer (один на все фиды, см. ingest_feeds).
+    🔥 Инкрементально (FeedDiff): эмбеддятся только новые и изменённые товары,
+    остальные берут вектор из рабочей версии. Пропавшие из фида в новую версию не попадают,
+    а если фид не загрузился целиком — недостающие товары переносятся из рабочей версии (carry_over_feed).
+    🔥 Условный запрос (feed_validators — {feed_url: валидаторы}, обновляется на месте):
+    на 304 или тот же sha256 фид не разбирается, товары и шард точного поиска переносятся как есть
+    (в pgvector дописываются товары, которых там нет — reconcile_pg_feed).
+    🔥 Категории (feed_categories.py): офферы из веток, не нужных ни одному магазину группы
+    (Magazine.category_rules или классификатор колясок), не разбираются и уходят из индекса.
+    pg_engine — если задан, изменённые товары дублируются в Postgres (SEARCH_BACKEND=pgvector)
+    после публикации версии (sync_pgvector)
+    """
+    global build_excluded
+
+    if writer is None:
+        async with UpsertWriter() as writer:
+            return await process_feed_group(
+                session, feed_url, magazines, pg_engine, writer, limiter, feed_validators, parse_pool, stats
+            )
+    limiter = limiter or EmbeddingLimiter(EMBEDDING_CONCURRENCY)
+    stats = stats or StageStats()
 
-async def process_feed_group(session: aiohttp.ClientSession, feed_url: str, magazines: List[Magazine]):
     mag_names = [m.name for m in magazines]
     # Сохраняем ID как строки (Chroma лучше работает со строками в метаданных)
     mag_ids = [str(m.id) for m in magazines]
-
-    # Превращаем список ID в строку "1,2,5"
-    mag_ids_str = ",".join(mag_ids)
+    url_hash = feed_url_hash(feed_url)
+    category_filter = CategoryFilter.for_magazines(magazines)
+    state = feed_state(mag_ids, category_filter.key())
 
     logger.info(f"🔄 Обработка группы магазинов: {mag_names}")
 
-    xml_content = await download_feed(session, feed_url)
-    if not xml_content: return
+    # Валидаторы убираем до конца успешной загрузки: после сбоя следующий цикл не должен пропустить фид
+    validators = feed_validators.pop(feed_url, None) if feed_validators is not None else None
+    if validators and (validators.get("state") != state or not shard_rows(feed_url)):
+        # Поменялись магазины фида / их категории / модель эмбеддингов или шард удалён — грузим фид целиком
+        validators = None
+
+    stream = FeedStream(
+        session, feed_url, validators=validators, parse_pool=parse_pool, category_filter=category_filter
+    )
+    diff = None   # Состояние фида в базе читаем с первой пачкой: на 304 оно не нужно
+    # Ограниченная очередь: если эмбеддинг не успевает, чтение фида ждёт (память не растёт)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=FEED_QUEUE_BATCHES)
+
+    async def produce():
+        try:
+            async for batch in stream.batches():
+                await queue.put(batch)
+        finally:
+            await queue.put(None)
+
+    # Пачек фида в эмбеддинге/записи одновременно: память ограничена и при параллельных фидах
+    in_flight = asyncio.Semaphore(limiter.concurrency)
+    loaded = planned = 0
+
+    async def embed_and_store(to_embed, to_reuse, unchanged, shard):
+        nonlocal loaded
+        try:
+            started = time.perf_counter()
+            products, embeddings = await embed_products(to_embed, [*to_reuse, *unchanged], limiter)
+            stats.add("embed", len(products), time.perf_counter() - started)
+            # В pgvector (он без версий) неизменённые товары уже лежат
+            pg_ids = {p["vector_id"] for p in (*to_embed, *to_reuse)}
+            stored = await writer.submit(
+                store_batch(products, embeddings, feed_url, mag_ids, shard, pg_engine, pg_ids)
+            )
+            loaded += stored
+            logger.info(f"✅ Группа {mag_names}: загружено {loaded} товаров...")
+        finally:
+            in_flight.release()
+
+    producer = asyncio.create_task(produce())
+    tasks = []
+    shard = None
+    try:
+        while (batch := await queue.get()) is not None:
+            if diff is None:
+                diff = await load_feed_diff(feed_url, pg_engine)
+
+            ids = [f"feed_{url_hash}_{product['id']}" for product in batch]
+            to_embed, to_reuse, unchanged = diff.plan(ids, batch, mag_ids)
+            planned += len(to_embed) + len(to_reuse) + len(unchanged)
+
+            if shard is None:
+                shard = open_build_shard(feed_url)
+
+            await in_flight.acquire()
+            tasks.append(asyncio.create_task(embed_and_store(to_embed, to_reuse, unchanged, shard)))
+
+        # Ошибка одной пачки не роняет фид (как раньше: пачка просто не загружена)
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка загрузки пачки фида {feed_url}: {result}")
+    finally:
+        for task in [producer, *tasks]:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(producer, *tasks, return_exceptions=True)
+        stats.add("download", stream.bytes / 2 ** 20, stream.download_s)
+        stats.add("parse", stream.offers, stream.parse_s)
+
+    if stream.not_modified:
+        await carry_over_feed(feed_url, mag_ids, writer, pg_engine=pg_engine)
+        feed_validators[feed_url] = {**stream.new_validators, "state": state}
+        logger.info(f"⏭ Группа {mag_names}: фид не изменился, товары перенесены из рабочей версии")
+        return reuse_exact_shard(url_hash, mag_ids) or export_exact_shard(feed_url, mag_ids)
+
+    if diff is None and stream.complete and stream.excluded:
+        # Все офферы фида вне категорий магазинов: его товары уходят из индекса
+        diff = await load_feed_diff(feed_url, pg_engine)
+
+    excluded = {f"feed_{url_hash}_{offer_id}" for offer_id in stream.excluded}
+    logger.info(
+        f"📦 В фиде найдено товаров: {stream.offers} ({stream.bytes / 2 ** 20:.1f}MB"
+        f"{', ' + stream.encoding if stream.encoding else ''}), {diff.stats if diff else {}}"
+        f"{f', вне категорий: {len(excluded)}' if excluded else ''}"
+    )
+    if diff is None:
+        # Фид не скачался (или пуст) — магазин остаётся с товарами рабочей версии
+        await carry_over_feed(feed_url, mag_ids, writer, pg_engine=pg_engine)
+        return None
+
+    build_excluded += len(excluded & diff.stored_ids)
+
+    vanished = diff.vanished() if stream.complete else []
+    if vanished:
+        delete_vanished(vanished, pg_engine)
+        logger.info(f"🗑 Группа {mag_names}: удалено пропавших из фида товаров: {len(vanished)}")
+    if not stream.complete:
+        logger.warning(f"⚠️ Фид {feed_url} загружен не полностью — недостающие товары берём из рабочей версии")
+    if not stream.complete or loaded < planned:
+        await carry_over_feed(feed_url, mag_ids, writer, exclude=[*vanished, *excluded], pg_engine=pg_engine)
+
+    logger.info(f"🎉 Группа {mag_names} полностью обновлена!")
+
+    # Валидаторы — только если фид дошёл целиком и все пачки записаны
+    if feed_validators is not None and stream.complete and loaded == planned:
+        feed_validators[feed_url] = {**stream.new_validators, "state": state}
+
+    # Ничего не поменялось — шард точного поиска рабочей версии актуален
+    if not diff.has_changes:
+        previous = reuse_exact_shard(url_hash, mag_ids)
+        if previous:
+            return previous
+
+    return export_exact_shard(feed_url, mag_ids)
+
+
+async def ingest_feeds(
+        session: aiohttp.ClientSession,
+        feed_groups: Dict[str, List[Magazine]],
+        pg_engine=None,
+        validators: Optional[Dict[str, dict]] = None,
+        stats: Optional[StageStats] = None
+) -> Dict[str, Optional[dict]]:
+    """
+    Все фиды цикла в собираемую версию индекса: одновременно качаются и разбираются до FEED_CONCURRENCY фидов,
+    офферы разбираются в общем пуле из FEED_PARSE_WORKERS процессов (event loop не блокируется),
+    запросы к OpenAI идут через общий EmbeddingLimiter, запись — через один UpsertWriter.
+    Сетевые ожидания (скачивание фидов, ответы OpenAI) и разбор идут внахлёст, а не складываются.
+    validators — валидаторы фидов (feed_validators.py), обновляются на месте;
+    сохраняет их вызывающий, когда новая версия стала рабочей.
+    stats — сюда складывается пропускная способность стадий (StageStats).
+    Возвращает {feed_url: запись манифеста точного поиска или None}.
+    """
+    if collection is None:
+        open_index_build()
+
+    feed_slots = asyncio.Semaphore(FEED_CONCURRENCY)
+    limiter = EmbeddingLimiter(EMBEDDING_CONCURRENCY)
+    validators = {} if validators is None else validators
+    stats = stats or StageStats()
+    # Процессы стартуют при первом задании и живут до конца цикла (общие для всех фидов)
+    parse_pool = ProcessPoolExecutor(max_workers=FEED_PARSE_WORKERS) if FEED_PARSE_WORKERS > 0 else None
+    started = time.perf_counter()
+
+    async def run_feed(feed_url, mags_in_group):
+        async with feed_slots:
+            try:
+                return await process_feed_group(
+                    session, feed_url, mags_in_group, pg_engine, writer, limiter, validators, parse_pool, stats
+                )
+            except Exception as e:
+                # Один упавший фид не должен останавливать остальные — его товары берём из рабочей версии
+                logger.error(f"Ошибка загрузки фида {feed_url}: {e}")
+                try:
+                    await carry_over_feed(feed_url, [str(m.id) for m in mags_in_group], writer, pg_engine=pg_engine)
+                except Exception as carry_error:
+                    logger.error(f"Ошибка переноса фида {feed_url} из рабочей версии: {carry_error}")
+                return None
+
+    try:
+        async with UpsertWriter() as writer:
+            entries = await asyncio.gather(*(run_feed(url, mags) for url, mags in feed_groups.items()))
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown(cancel_futures=True)
+    stats.add("write", writer.rows, writer.busy_s)
+
+    logger.info(
+        f"⏱ Фидов: {len(feed_groups)} за {time.perf_counter() - started:.1f}s, "
+        f"OpenAI: {limiter.stats}, запись: {writer.writes} операций"
+    )
+    logger.info(f"📈 Стадии: {stats}")
+    return dict(zip(feed_groups, entries))
+
+
+def save_build_manifest(entries: Dict[str, Optional[dict]]):
+    """Манифест точного поиска версии: фид, который в этот раз не скачался, остаётся со старым шардом."""
+    previous_shards = load_exact_manifest(live_version)
+    exact_shards = {}
+    for feed_url, entry in entries.items():
+        shard_key = feed_url_hash(feed_url)
+        if entry:
+            exact_shards[shard_key] = entry
+        elif shard_key in previous_shards and link_exact_shard(shard_key, live_version, build_version):
+            exact_shards[shard_key] = previous_shards[shard_key]
+    save_exact_manifest(exact_shards, build_version)
+
+
+def build_shard_registry(feed_groups: Dict[str, List[Magazine]]) -> Dict[str, dict]:
+    """Реестр "коллекция-шард -> магазины" собираемой версии (только шарды, которые реально есть в базе)."""
+    existing = {c.name if hasattr(c, "name") else c for c in chroma_client.list_collections()}
+    registry = {}
+    for feed_url, mags_in_group in feed_groups.items():
+        name = shard_collection_name(feed_url, build_version)
+        if name in existing:
+            registry[name] = {
+                "source_url": feed_url,
+                "magazine_ids": [str(m.id) for m in mags_in_group],
+                "rows": chroma_client.get_collection(name=name).count(),
+            }
+    save_shard_registry(registry, build_version)
+    logger.info(f"🧩 Реестр шардов: {len(registry)} фидов")
+    return registry
+
+
+def export_exact_shard(feed_url: str, mag_ids: List[str]):
+    """
+    Выгружает товары фида из Chroma в шард точного поиска (exact_index.py):
+    матрица векторов .npy + ids/метаданные. Возвращает запись для манифеста или None.
+    """
+    try:
+        found = collection.get(where={"source_url": feed_url}, include=["embeddings", "metadatas"])
+        if not found['ids']:
+            return None
+        entry = save_exact_shard(
+            feed_url_hash(feed_url), feed_url, mag_ids,
+            found['ids'], found['embeddings'], found['metadatas'], version=build_version
+        )
+        logger.info(f"🎯 Шард точного поиска: {entry['rows']} товаров ({feed_url})")
+        return entry
+    except Exception as e:
+        logger.error(f"Ошибка выгрузки шарда точного поиска {feed_url}: {e}")
+        return None
 
-    products = parse_offers_from_xml(xml_content)
-    logger.info(f"📦 В фиде найдено товаров: {len(products)}")
 
-    if not products: return
 
-    batch_size = 100
-    for i in range(0, len(products), batch_size):
-        batch = products[i: i + batch_size]
-        texts_to_embed = [p["text"] for p in batch]
-        embeddings = await get_embeddings_batch(texts_to_embed)
+def rebuild_lexical_index(page_size: int = 5000):
+    """
+    BM25-индекс по всем документам коллекции (после обновления всех фидов),
+    чтобы search_service находил точные названия моделей без OpenAI.
+    """
+    ids, documents, metadatas = [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page['ids']:
+            break
+        ids.extend(page['ids'])
+        documents.extend(page['documents'])
+        metadatas.extend(page['metadatas'])
+        offset += len(page['ids'])
 
-        if not embeddings: continue
+    save_lexical_index(build_lexical_index(ids, documents, metadatas), build_version)
+    logger.info(f"🔤 Лексический индекс (BM25) построен: {len(ids)} документов")
 
-        # === 🔥 ИЗМЕНЕНИЯ ПОД CHROMADB ===
-        ids_batch = []
-        embeddings_batch = []
-        metadatas_batch = []
-        documents_batch = []
 
-        url_hash = hashlib.md5(feed_url.encode()).hexdigest()[:10]
+async def build_quiz_shortlists(magazine_sets: Dict[str, List[str]]):
+    """
+    Готовые подборки для авто-запроса «Подобрать коляску».
+    Для каждого набора магазинов и каждой достижимой комбинации ответов квиза
+    считаем top-k так же, как search_products, и сохраняем в quiz_shortlists.json.
+    """
+    profiles = list(iter_quiz_profiles())
+    # Вектор такой же, как в search_products при пустом user_query:
+    # фразы квиза эмбеддятся один раз (одним запросом), профили собираются из них локально
+    embeddings = await compose_query_vectors([("", profile) for profile in profiles])
+    if not all(embeddings):
+        logger.error("⚠️ Подборки квиза не построены: нет эмбеддингов")
+        return
 
-        for j, product in enumerate(batch):
-            vector_id = f"feed_{url_hash}_{product['id']}"
+    # Профили с одинаковыми жёсткими условиями (подтип коляски -> fold_type) ищем одним запросом
+    profile_groups: Dict[str, List[int]] = {}
+    for i, profile in enumerate(profiles):
+        profile_groups.setdefault(json.dumps(quiz_constraints(profile), sort_keys=True), []).append(i)
 
-            meta = product["metadata"]
+    sets = {}
+    for set_key, mag_ids in magazine_sets.items():
+        shortlists = {}
+        try:
+            for constraints_json, group in profile_groups.items():
+                constraints = json.loads(constraints_json)
+                todo = group
+                found = {}
+                # Как в search_products: под условия мало товаров — ослабляем их
+                while todo:
+                    where = combine_where(build_magazine_where(mag_ids), *constraint_filters(constraints))
+                    # В потоке, как и в search_service: запрос к Chroma не держит event loop
+                    results = await asyncio.to_thread(
+                        collection.query,
+                        query_embeddings=[embeddings[i] for i in todo],
+                        n_results=SEARCH_TOP_K * 2,
+                        where=where
+                    )
 
-            # 🔥 ВАЖНОЕ ДОБАВЛЕНИЕ: Сохраняем ссылку-источник
-            # Это нужно для manage_chroma.py, чтобы удалять фиды целиком
-            meta["source_url"] = feed_url
+                    next_todo = []
+                    for row, i in enumerate(todo):
+                        # Товары под более строгие условия остаются первыми, ослабленный запрос добивает список
+                        strict = found.get(i, ([], [], []))
+                        hits = select_unique_hits(
+                            strict[0] + results['ids'][row],
+                            strict[1] + results['metadatas'][row],
+                            strict[2] + results['distances'][row],
+                            SEARCH_TOP_K
+                        )
+                        found[i] = ([h["id"] for h in hits], [h["metadata"] for h in hits], [h["distance"] for h in hits])
+                        if constraints and len(hits) < ATTRIBUTE_FILTER_MIN_HITS:
+                            next_todo.append(i)
+                        elif hits:
+                            shortlists[profile_key(profiles[i])] = [[h["id"], round(h["distance"], 4)] for h in hits]
 
-            # Добавляем ID магазинов (для фильтрации "свой-чужой")
-            meta["magazine_ids_str"] = mag_ids_str
+                    todo = next_todo
+                    constraints = relax_constraints(constraints)
+        except Exception as e:
+            logger.error(f"Ошибка построения подборок для магазинов {set_key}: {e}")
+            continue
 
-            ids_batch.append(vector_id)
-            embeddings_batch.append(embeddings[j])
-            metadatas_batch.append(meta)
-            documents_batch.append(product["text"])
+        sets[set_key] = shortlists
 
+    save_shortlists(sets, SEARCH_TOP_K, build_version)
+    logger.info(f"⚡ Подборки квиза: {len(profiles)} профилей x {len(sets)} наборов магазинов")
+
+
+def validate_build(registry: Dict[str, dict]) -> bool:
+    """
+    Проверка собранной версии перед переключением:
+    - товаров не меньше INDEX_MIN_ROWS_RATIO от рабочей версии (массовый сбой фидов не обнулит поиск),
+      не считая товаров, убранных правилами категорий (build_excluded);
+    - все шарды из реестра на месте и не пустые;
+    - выборочно INDEX_SPOT_CHECKS товаров: поиск по собственному вектору находит сам товар.
+    """
+    rows = collection.count()
+    live_rows = live_collection.count() if live_collection is not None else 0
+    if not rows or rows < (live_rows - build_excluded) * INDEX_MIN_ROWS_RATIO:
+        logger.error(
+            f"❌ Версия {build_version}: {rows} товаров против {live_rows} в рабочей (вне категорий: {build_excluded})"
+        )
+        return False
+
+    for name, info in registry.items():
         try:
-            # Upsert в Chroma
-            collection.upsert(
-                ids=ids_batch,
-                embeddings=embeddings_batch,
-                metadatas=metadatas_batch,
-                documents=documents_batch
-            )
-            logger.info(f"✅ Группа {mag_names}: загружено {len(ids_batch)} товаров...")
+            shard_count = chroma_client.get_collection(name=name).count()
+        except Exception:
+            shard_count = 0
+        if not shard_count:
+            logger.error(f"❌ Версия {build_version}: шард {name} ({info['source_url']}) пуст или не найден")
+            return False
+
+    ids = collection.get(include=[])['ids']
+    sample = random.sample(ids, min(INDEX_SPOT_CHECKS, len(ids)))
+    found = collection.get(ids=sample, include=["embeddings"])
+    results = collection.query(query_embeddings=found['embeddings'], n_results=10, include=[])
+    recall = sum(
+        product_id in hits for product_id, hits in zip(found['ids'], results['ids'])
+    ) / max(len(found['ids']), 1)
+    if recall < INDEX_SPOT_CHECK_MIN_RECALL:
+        logger.error(f"❌ Версия {build_version}: товар находится по своему вектору в {recall:.0%} проверок")
+        return False
+
+    logger.info(f"✅ Версия {build_version} проверена: {rows} товаров, {len(registry)} шардов, self-recall {recall:.0%}")
+    return True
+
+
+def drop_index_version(version: str):
+    """Коллекции (вместе с папками их сегментов на диске) и файлы версии индекса."""
+    for name in [c.name if hasattr(c, "name") else c for c in chroma_client.list_collections()]:
+        if collection_version(name) == version:
+            chroma_client.delete_collection(name=name)
+    remove_orphan_segment_dirs()
+    remove_version_files(version)
+
+
+def publish_build(**info) -> List[str]:
+    """
+    Атомарно делает собранную версию рабочей и удаляет версии старше INDEX_KEEP_VERSIONS
+    (предыдущая остаётся: по ней ещё могут идти запросы, и на неё можно откатиться — manage_chroma.py).
+    """
+    history = load_index_pointer().get("history") or ([live_version] if live_collection is not None else [])
+    history = [build_version, *(v for v in history if v != build_version)][:INDEX_KEEP_VERSIONS]
+    save_index_pointer(build_version, history, **info)
+    logger.info(f"🔀 Рабочая версия индекса: {build_version} (была {live_version or 'без версии'})")
+
+    # Всё, что не в истории: старые версии и брошенные сборки (упавший посреди цикла update_vectors.py)
+    stale = {collection_version(c.name if hasattr(c, "name") else c) for c in chroma_client.list_collections()}
+    stale |= set(list_version_dirs())
+    for version in stale - {None, *history}:
+        try:
+            drop_index_version(version)
+            logger.info(f"🗑 Удалена версия индекса {version or 'без версии'}")
         except Exception as e:
-            logger.error(f"Ошибка ChromaDB Upsert: {e}")
+            logger.error(f"Не удалось удалить версию индекса {version or 'без версии'}: {e}")
+    return history
 
-    logger.info(f"🎉 Группа {mag_names} полностью обновлена!")
 
+async def index_is_current(
+        session: aiohttp.ClientSession,
+        feed_groups: Dict[str, List[Magazine]],
+        validators: Dict[str, dict],
+        pg_engine=None
+) -> bool:
+    """
+    Рабочая версия уже соответствует фидам: тот же набор фидов, те же магазины, правила категорий
+    и модель эмбеддингов (state в валидаторах) и ни один фид не изменился (304 / тот же sha256).
+    Тогда новая версия не собирается: иначе каждый цикл копировал бы весь индекс (carry_over_feed) ради тех же данных.
+    pg_engine (SEARCH_BACKEND=pgvector) — ещё и в product_vectors столько же строк этих фидов, сколько в рабочей версии:
+    иначе таблицу, отставшую от Chroma, не дописал бы ни один цикл.
+    validators обновляются на месте (новый ETag при том же теле фида).
+    """
+    if not feed_groups or set(validators) != set(feed_groups):
+        return False
+    try:
+        live = chroma_client.get_collection(name=collection_name(current_index_version()))
+    except Exception:
+        return False
 
+    for feed_url, magazines in feed_groups.items():
+        state = feed_state([str(m.id) for m in magazines], CategoryFilter.for_magazines(magazines).key())
+        if validators[feed_url].get("state") != state:
+            return False
+
+    if pg_engine is not None:
+        try:
+            pg_rows = await count_vectors(pg_engine, feed_groups)
+        except Exception as e:
+            logger.error(f"Ошибка чтения pgvector: {e}")
+            return False
+        live_rows = await asyncio.to_thread(live.count)
+        if pg_rows != live_rows:
+            logger.info(f"🐘 В pgvector {pg_rows} товаров против {live_rows} в рабочей версии — собираем новую версию")
+            return False
+
+    feed_slots = asyncio.Semaphore(FEED_CONCURRENCY)
+
+    async def probe(feed_url):
+        async with feed_slots:
+            return feed_url, await probe_feed(session, feed_url, validators[feed_url])
+
+    tasks = [asyncio.create_task(probe(feed_url)) for feed_url in feed_groups]
+    fresh = {}
+    try:
+        # Первый изменившийся фид решает: остальные можно не докачивать
+        for next_done in asyncio.as_completed(tasks):
+            feed_url, new_validators = await next_done
+            if new_validators is None:
+                logger.info(f"🔄 Фид {feed_url} изменился — собираем новую версию индекса")
+                return False
+            fresh[feed_url] = new_validators
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    validators.update(fresh)
+    return True
+
+
+async def build_index(
+        session: aiohttp.ClientSession,
+        feed_groups: Dict[str, List[Magazine]],
+        pg_engine=None,
+        validators: Optional[Dict[str, dict]] = None
+) -> Dict[str, dict]:
+    """Новая версия индекса: фиды + точный поиск + реестр шардов + BM25. Возвращает реестр шардов."""
+    open_index_build()
+    entries = await ingest_feeds(session, feed_groups, pg_engine, validators)
+    save_build_manifest(entries)
+    registry = build_shard_registry(feed_groups)
+    rebuild_lexical_index()
+    return registry
 
 
 async def run_update_cycle():
@@ -229,9 +1040,53 @@ async def run_update_cycle():
                 # Сюда отлетят пустые поля, где работает поиск по Яндекс Картинкам
                 logger.info(f"⏭ Магазин {mag.name} пропущен (поле feed_url полностью пустое)")
 
+        # SEARCH_BACKEND=pgvector: боты ищут в Postgres (таблица product_vectors)
+        pg_engine = engine if SEARCH_BACKEND == "pgvector" else None
+
+        # Валидаторы фидов сохраняются, только если новая версия стала рабочей
+        validators = load_feed_validators()
         async with aiohttp.ClientSession() as http_session:
-            for feed_url, mags_in_group in feed_groups.items():
-                await process_feed_group(http_session, feed_url, mags_in_group)
+            if await index_is_current(http_session, feed_groups, validators, pg_engine):
+                save_feed_validators(validators)
+                await engine.dispose()
+                logger.info(
+                    f"⏭ Ни один фид не изменился — рабочая версия {current_index_version() or 'без версии'} остаётся"
+                )
+                return
+            registry = await build_index(http_session, feed_groups, pg_engine, validators)
+
+        # Наборы магазинов, по которым ищет авто-запрос:
+        # каждый магазин со своим фидом + TOP_SHOPS_IDS (PREMIUM_AGGREGATOR и юзеры без магазина)
+        magazine_sets = {magazine_set_key(TOP_SHOPS_IDS): [str(x) for x in TOP_SHOPS_IDS]}
+        for mags_in_group in feed_groups.values():
+            for mag in mags_in_group:
+                magazine_sets[magazine_set_key(mag.id)] = [str(mag.id)]
+
+        await build_quiz_shortlists(magazine_sets)
+
+    if not validate_build(registry):
+        # Боты продолжают искать по рабочей версии; в следующий цикл фиды скачаются заново.
+        # Отложенные записи pgvector выбрасываются вместе с версией — таблица остаётся прежней
+        drop_index_version(build_version)
+        await engine.dispose()
+        logger.error(f"🛑 Версия {build_version} не прошла проверку и удалена, рабочая версия не менялась")
+        return
+
+    publish_build(rows=collection.count(), feeds=len(feed_groups))
+    try:
+        await sync_pgvector(pg_engine)
+    except Exception as e:
+        logger.error(f"Ошибка синхронизации pgvector (в таблице остался прежний каталог): {e}")
+    # Фиды, которых больше нет у магазинов, из файла валидаторов выпадают
+    save_feed_validators({url: v for url, v in validators.items() if url in feed_groups})
+
+    # Поисковый сервис переключится на новую версию сам, перечитываем базу сразу
+    if SEARCH_SERVICE_URL:
+        try:
+            await get_backend().reload()
+            logger.info("🔁 Поисковый сервис перечитал базу")
+        except Exception as e:
+            logger.error(f"Не удалось перезагрузить поисковый сервис: {e}")
 
     await engine.dispose()
     logger.info("🏁 Обновление базы ChromaDB завершено.")
@@ -0,0 +1,61 @@
+"""
+Точка входа: поисковый сервис (ChromaDB в отдельном процессе).
+
+Один процесс держит индекс товаров в памяти и отвечает на запросы ботов
+по Unix-сокету или TCP. Боты подключаются к нему, если задан SEARCH_SERVICE_URL.
+
+Запуск:
+  python run_search.py
+
+Docker Compose:
+  command: python run_search.py
+
+Необходимые переменные .env:
+  SEARCH_SERVICE_URL (например unix:///run/search/search.sock)
+"""
+
+import asyncio
+import os
+import sys
+import signal
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import find_dotenv, load_dotenv
+load_dotenv(find_dotenv())
+
+from app.core.services.search_server import run_search_server
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+
+
+async def main():
+    server_task = asyncio.create_task(run_search_server())
+
+    if os.name != "nt":
+        # SIGTERM (docker stop) -> корректно закрываем ChromaDB
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, server_task.cancel)
+
+    try:
+        await server_task
+    except asyncio.CancelledError:
+        pass
+    logger.info("✅ Search service: shutdown complete")
+
+
+if __name__ == "__main__":
+    try:
+        if os.name == "nt":
+            asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
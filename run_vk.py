@@ -32,6 +32,7 @@ from app.core.redis_client import redis_client as redis
 from app.platforms.vk.bot import create_vk_api, VK_GROUP_ID
 from app.platforms.vk.callback import vk_callback_handler
 from app.web.webhooks import yookassa_webhook_handler
+from app.core.services.vector_backends import close_backend as close_search_backend
 
 
 logger = logging.getLogger(__name__)
@@ -109,6 +110,10 @@ async def main():
 async def _shutdown(runner):
     logger.info("🔄 VK Bot: shutting down...")
     await runner.cleanup()
+    try:
+        await close_search_backend()
+    except Exception:
+        pass
     try:
         await engine.dispose()
     except Exception:
@@ -0,0 +1,18 @@
+"""
+Общая настройка тестов: корень проекта в sys.path (как в скриптах app/*.py)
+и временная папка базы вместо chromadb_storage — тесты не трогают рабочий индекс.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+# До импорта app.*: search_config читает путь к базе при импорте
+os.environ["CHROMA_DB_PATH"] = tempfile.mkdtemp(prefix="chroma_test_")
+# update_vectors.py без них не импортируется; к базе и OpenAI тесты не обращаются
+os.environ.setdefault("DB_URL", "sqlite:///" + os.path.join(os.environ["CHROMA_DB_PATH"], "test.db"))
+os.environ.setdefault("OPENAI_API_KEY", "test")
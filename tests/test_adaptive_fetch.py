@@ -0,0 +1,101 @@
+"""Адаптивное окно кандидатов: удвоение до top_k уникальных товаров, доля уникальных по набору магазинов."""
+
+import asyncio
+import math
+
+import pytest
+
+from app.core.services import search_service
+from app.core.services.search_config import (
+    FETCH_DEFAULT_FILL_RATE, FETCH_FILL_RATE_ALPHA, FETCH_MAX_WINDOW, SEARCH_DISTANCE_CUTOFF,
+)
+
+
+class FakeBackend:
+    """Индекс из готового ранжированного списка: запрос отдаёт первые n_results кандидатов."""
+
+    def __init__(self, names, distance_step=0.001):
+        self.rows = [(f"p{i}", {"name": name}, i * distance_step) for i, name in enumerate(names)]
+        self.windows = []
+
+    async def query(self, vectors, n_results, where=None):
+        self.windows.append(n_results)
+        rows = self.rows[:n_results]
+        return {
+            name: [[row[k] for row in rows] for _ in vectors]
+            for k, name in enumerate(("ids", "metadatas", "distances"))
+        }
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    def install(names, **kwargs):
+        fake = FakeBackend(names, **kwargs)
+        monkeypatch.setattr(search_service, "get_backend", lambda: fake)
+        return fake
+
+    monkeypatch.setattr(search_service, "_fill_rates", {})
+    return install
+
+
+def query(set_key="shop", top_k=10, vectors=1):
+    return asyncio.run(search_service._query_adaptive([[1.0]] * vectors, None, set_key, top_k))
+
+
+def test_initial_window_uses_default_fill_rate():
+    window = search_service._initial_window("new_shop", 10)
+    assert window == math.ceil(10 / FETCH_DEFAULT_FILL_RATE * 1.1)
+    assert search_service._initial_window("new_shop", 1000) == 1000   # Не меньше top_k
+
+
+def test_window_doubles_until_enough_unique(backend):
+    # Каждая модель повторяется в 5 цветах: на 10 уникальных нужно 50 кандидатов
+    fake = backend([f"Модель {i // 5}" for i in range(FETCH_MAX_WINDOW * 2)])
+    ((ids, metadatas, _),) = query()
+
+    first = math.ceil(10 / FETCH_DEFAULT_FILL_RATE * 1.1)
+    assert fake.windows == [first, first * 2, first * 4]
+    assert search_service._count_unique_names(metadatas) >= 10
+
+
+def test_learned_fill_rate_shrinks_rounds(backend):
+    fake = backend([f"Модель {i // 5}" for i in range(FETCH_MAX_WINDOW * 2)])
+    query()
+    rate = search_service._fill_rates["shop"]
+    assert rate == pytest.approx(0.2, abs=0.01)
+
+    fake.windows.clear()
+    query()
+    assert len(fake.windows) == 1 and fake.windows[0] == math.ceil(10 / rate * 1.1)
+    # Скользящее среднее: новый замер с весом FETCH_FILL_RATE_ALPHA
+    assert search_service._fill_rates["shop"] == pytest.approx(rate, abs=0.01)
+    assert "other_shop" not in search_service._fill_rates
+
+
+def test_stops_when_index_exhausted(backend):
+    fake = backend(["Одна модель"] * 20)
+    ((ids, _, _),) = query()
+    # Второе окно вернуло меньше, чем просили: дальше углубляться некуда
+    first = math.ceil(10 / FETCH_DEFAULT_FILL_RATE * 1.1)
+    assert fake.windows == [first, first * 2] and len(ids) == 20
+
+
+def test_stops_when_candidates_too_far(backend):
+    step = SEARCH_DISTANCE_CUTOFF / 10
+    fake = backend(["Одна модель"] * 1000, distance_step=step)
+    query()
+    assert len(fake.windows) == 1
+
+
+def test_window_is_capped(backend):
+    fake = backend(["Одна модель"] * (FETCH_MAX_WINDOW * 4))
+    query()
+    assert fake.windows[-1] == FETCH_MAX_WINDOW
+    assert all(b == min(a * 2, FETCH_MAX_WINDOW) for a, b in zip(fake.windows, fake.windows[1:]))
+
+
+def test_record_fill_rate_moving_average():
+    search_service._fill_rates.clear()
+    search_service._record_fill_rate("s", 1.0)
+    search_service._record_fill_rate("s", 0.5)
+    assert search_service._fill_rates["s"] == pytest.approx(1.0 - FETCH_FILL_RATE_ALPHA * 0.5)
@@ -0,0 +1,81 @@
+"""Кэш эмбеддингов запросов: ключ по точному тексту, LRU в памяти и Redis."""
+
+import asyncio
+import base64
+
+import pytest
+
+from app.core.services import embedding_cache
+from app.core.services.embedding_cache import cache_key, get_cached_embedding, store_embedding
+
+
+class FakeRedis:
+    """Redis в памяти с интерфейсом SafeRedis (get / set с ex)."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttl[key] = ex
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(embedding_cache, "redis_client", fake)
+    monkeypatch.setattr(embedding_cache, "_lru", embedding_cache.OrderedDict())
+    return fake
+
+
+def test_key_is_exact_text_and_model():
+    assert cache_key("коляска", "m") == cache_key("коляска", "m")
+    # Эмбеддится текст как есть — регистр и пробелы дают другой вектор и другой ключ
+    assert cache_key("Коляска", "m") != cache_key("коляска", "m")
+    assert cache_key("коляска ", "m") != cache_key("коляска", "m")
+    assert cache_key("коляска", "m1") != cache_key("коляска", "m2")
+    assert cache_key("коляска", "m").startswith("emb:m:")
+    assert cache_key(None, "m") == cache_key("", "m")
+
+
+def test_redis_roundtrip_is_float32(redis):
+    vector = [0.1, -2.5, 3.0, 1e-3]
+    asyncio.run(store_embedding("коляска", "m", vector))
+
+    (key,) = redis.data
+    assert redis.ttl[key] == embedding_cache.REDIS_TTL
+    assert len(base64.b64decode(redis.data[key])) == 4 * len(vector)   # float32-байты, а не JSON
+
+    embedding_cache._lru.clear()   # Другой процесс: в его памяти вектора нет
+    cached = asyncio.run(get_cached_embedding("коляска", "m"))
+    assert cached == pytest.approx(vector, rel=1e-6)
+    assert key in embedding_cache._lru   # Поднят в память
+
+
+def test_miss_and_broken_value(redis):
+    assert asyncio.run(get_cached_embedding("коляска", "m")) is None
+
+    redis.data[cache_key("коляска", "m")] = "не base64!"
+    assert asyncio.run(get_cached_embedding("коляска", "m")) is None
+
+
+def test_empty_vector_is_not_stored(redis):
+    asyncio.run(store_embedding("коляска", "m", []))
+    assert redis.data == {} and not embedding_cache._lru
+
+
+def test_lru_evicts_oldest(redis, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "LRU_MAX_SIZE", 2)
+
+    async def scenario():
+        for text in ("a", "b"):
+            await store_embedding(text, "m", [1.0])
+        await get_cached_embedding("a", "m")   # «a» свежее «b»
+        await store_embedding("c", "m", [1.0])
+
+    asyncio.run(scenario())
+    assert list(embedding_cache._lru) == [cache_key("a", "m"), cache_key("c", "m")]
@@ -0,0 +1,125 @@
+"""Общий ограничитель запросов к OpenAI Embeddings: предел параллельности, повторы и общая пауза после 429."""
+
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from app.core.services.embedding_limiter import EmbeddingLimiter, retry_after_seconds
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+
+
+def rate_limited(headers=None, code=None):
+    response = httpx.Response(429, headers=headers or {}, request=REQUEST)
+    return openai.RateLimitError("rate limited", response=response, body={"code": code} if code else None)
+
+
+def test_concurrency_is_bounded_across_callers():
+    limiter = EmbeddingLimiter(concurrency=2)
+    in_flight, peak = 0, 0
+
+    async def request():
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return "ok"
+
+    async def run():
+        return await asyncio.gather(*(limiter.call(request) for _ in range(7)))
+
+    assert asyncio.run(run()) == ["ok"] * 7
+    assert peak == 2
+    assert limiter.stats == {"requests": 7, "retries": 0, "rate_limited": 0}
+
+
+def test_concurrency_is_at_least_one():
+    assert EmbeddingLimiter(concurrency=0).concurrency == 1
+
+
+def test_retry_after_header_wins():
+    assert retry_after_seconds(rate_limited({"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(rate_limited({"retry-after": "3"})) == 3
+    assert retry_after_seconds(rate_limited({"retry-after": "10000"})) == 60.0
+    assert retry_after_seconds(rate_limited({"retry-after": "soon"})) is None
+    assert retry_after_seconds(ValueError()) is None
+
+    limiter = EmbeddingLimiter(concurrency=1, base_delay=100)
+    assert limiter.backoff(0, rate_limited({"retry-after-ms": "20"})) == 0.02
+
+
+def test_backoff_grows_and_is_capped():
+    limiter = EmbeddingLimiter(concurrency=1, base_delay=1.0, max_delay=5.0)
+    error = openai.APIConnectionError(request=REQUEST)
+    assert 0.5 <= limiter.backoff(0, error) <= 1.0
+    assert 2.0 <= limiter.backoff(2, error) <= 4.0
+    assert 2.5 <= limiter.backoff(10, error) <= 5.0
+
+
+def test_rate_limit_pauses_all_callers():
+    limiter = EmbeddingLimiter(concurrency=3)
+    sent = []
+    failed = False
+
+    async def first():
+        nonlocal failed
+        sent.append(("first", time.monotonic()))
+        if not failed:
+            failed = True
+            raise rate_limited({"retry-after-ms": "100"})
+        return "first"
+
+    async def second():
+        sent.append(("second", time.monotonic()))
+        return "second"
+
+    async def run():
+        started = time.monotonic()
+        task = asyncio.create_task(limiter.call(first))
+        await asyncio.sleep(0.02)   # 429 уже получен, пауза идёт
+        result = await asyncio.gather(task, limiter.call(second))
+        return started, result
+
+    started, result = asyncio.run(run())
+    assert result == ["first", "second"]
+    # Второй запрос не ушёл, пока не кончилась общая пауза после 429
+    assert dict(sent)["second"] - started >= 0.09
+    assert limiter.stats == {"requests": 3, "retries": 1, "rate_limited": 1}
+
+
+def test_gives_up_after_max_retries():
+    limiter = EmbeddingLimiter(concurrency=1, max_retries=2, base_delay=0.001)
+    calls = 0
+
+    async def request():
+        nonlocal calls
+        calls += 1
+        raise openai.APIConnectionError(request=REQUEST)
+
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(limiter.call(request))
+    assert calls == 3
+    assert limiter.stats == {"requests": 3, "retries": 2, "rate_limited": 0}
+
+
+@pytest.mark.parametrize("error", [
+    rate_limited(code="insufficient_quota"),
+    openai.BadRequestError("bad", response=httpx.Response(400, request=REQUEST), body=None),
+])
+def test_pointless_errors_are_not_retried(error):
+    limiter = EmbeddingLimiter(concurrency=1, base_delay=0.001)
+    calls = 0
+
+    async def request():
+        nonlocal calls
+        calls += 1
+        raise error
+
+    with pytest.raises(type(error)):
+        asyncio.run(limiter.call(request))
+    assert calls == 1
+    assert limiter.stats["retries"] == 0
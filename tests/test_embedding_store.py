@@ -0,0 +1,83 @@
+"""Хранилище эмбеддингов по содержимому: ключ — модель + текст, общий для фидов и процессов."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import update_vectors as uv
+from app.core.services.embedding_store import SQLITE_MAX_PARAMS, EmbeddingStore, store_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path / "store" / "embedding_store.sqlite3"))
+
+
+def test_key_is_content_and_model():
+    assert store_key("Коляска Yoya", "m") == store_key("Коляска Yoya", "m")
+    assert store_key("Коляска Yoya", "m") != store_key("Коляска Yoya ", "m")
+    assert store_key("Коляска Yoya", "m1") != store_key("Коляска Yoya", "m2")
+    assert len(store_key("", "m")) == 20   # sha1 — 20 байт на ключ
+
+
+def test_same_text_from_another_feed_hits(store):
+    store.put_many(["Коляска Yoya", "Коляска Anex"], [[0.5, -1.0], [2.0, 0.25]], model="m")
+
+    # Тот же текст в другом фиде и в другом процессе (новое соединение к тому же файлу)
+    other = EmbeddingStore(store.path)
+    assert other.get_many(["Коляска Anex", "Коляска Cybex", "Коляска Yoya"], model="m") == [
+        [2.0, 0.25], None, [0.5, -1.0],
+    ]
+    assert other.get_many(["Коляска Yoya"], model="other-model") == [None]
+    assert other.count() == 2
+
+
+def test_vectors_are_float32_and_replaced(store):
+    store.put_many(["a"], [[0.1]], model="m")
+    store.put_many(["a"], [[0.3]], model="m")
+
+    (vector,) = store.get_many(["a"], model="m")
+    assert vector == pytest.approx([0.3], rel=1e-6) and vector != [0.3]
+    assert store.count() == 1
+
+
+def test_empty_vectors_are_skipped(store):
+    store.put_many(["a", "b"], [[], None], model="m")
+    assert store.count() == 0
+
+
+def test_many_keys_are_chunked(store):
+    texts = [f"товар {i}" for i in range(SQLITE_MAX_PARAMS * 2 + 7)]
+    store.put_many(texts, [[float(i)] for i in range(len(texts))], model="m")
+
+    found = store.get_many(texts, model="m")
+    assert [v[0] for v in found] == [float(i) for i in range(len(texts))]
+
+
+def test_broken_store_is_a_miss(tmp_path):
+    broken = EmbeddingStore(str(tmp_path))   # Папка вместо файла базы
+    broken.put_many(["a"], [[1.0]], model="m")
+    assert broken.get_many(["a"], model="m") == [None]
+    assert broken.count() == 0
+
+
+def test_batch_sends_only_new_texts_once(store, monkeypatch):
+    store.put_many(["Коляска Yoya"], [[1.0, 0.0]])
+    sent = []
+
+    async def create(model, input):
+        sent.append(list(input))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.0, 1.0]) for _ in input])
+
+    monkeypatch.setattr(uv, "embedding_store", store)
+    monkeypatch.setattr(uv, "openai_client", SimpleNamespace(embeddings=SimpleNamespace(create=create)))
+    monkeypatch.setattr(uv, "truncate_embeddings", lambda vectors: vectors)
+
+    texts = ["Коляска Anex", "Коляска Yoya", "Коляска Anex"]
+    assert asyncio.run(uv.get_embeddings_batch(texts)) == [[0.0, 1.0], [1.0, 0.0], [0.0, 1.0]]
+    assert sent == [["Коляска Anex"]]
+
+    # Повторная пачка (другой фид с теми же товарами) в OpenAI не идёт
+    assert asyncio.run(uv.get_embeddings_batch(texts[:2])) == [[0.0, 1.0], [1.0, 0.0]]
+    assert len(sent) == 1
@@ -0,0 +1,128 @@
+"""Точный поиск: совпадает с перебором в лоб, where-фильтры как в Chroma."""
+
+import os
+
+import numpy as np
+import pytest
+
+from app.core.services.exact_index import ExactIndex, save_exact_manifest, save_exact_shard
+from app.core.services.index_version import new_index_version, remove_version_files, save_index_pointer
+from app.core.services.search_config import INDEX_VERSION_PATH
+from app.core.services.search_filters import build_magazine_where, combine_where, match_where
+
+
+DIM = 64
+SHARDS = {"feed_a": ["1"], "feed_b": ["2", "3"]}
+
+
+def build(quantization: str, coarse_dims: int):
+    """Два шарда со случайными векторами в новой рабочей версии -> (векторы, id, метаданные)."""
+    rng = np.random.default_rng(7)
+    version = new_index_version()
+    manifest, vectors, ids, metadatas = {}, [], [], []
+    for shard_key, mag_ids in SHARDS.items():
+        matrix = rng.standard_normal((300, DIM)).astype(np.float32)
+        shard_ids = [f"{shard_key}:{row}" for row in range(len(matrix))]
+        shard_metas = [
+            {"price_num": float(rng.integers(5, 60) * 1000), **{f"mag_{mag_id}": True for mag_id in mag_ids}}
+            for _ in shard_ids
+        ]
+        manifest[shard_key] = save_exact_shard(
+            shard_key, f"https://{shard_key}", mag_ids, shard_ids, matrix, shard_metas,
+            quantization=quantization, coarse_dims=coarse_dims, version=version,
+        )
+        vectors.append(matrix)
+        ids += shard_ids
+        metadatas += shard_metas
+    save_exact_manifest(manifest, version=version)
+    save_index_pointer(version, [version])
+    return version, np.vstack(vectors), ids, metadatas
+
+
+@pytest.fixture
+def exact_index(request):
+    version, *data = build(*request.param)
+    index = ExactIndex()
+    assert index.refresh()
+    yield (index, *data)
+    remove_version_files(version)
+    os.remove(INDEX_VERSION_PATH)
+
+
+def brute_force(vectors, ids, metadatas, query, n_results, where=None):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normed @ (query / np.linalg.norm(query))
+    rows = [row for row in np.argsort(-scores) if match_where(metadatas[row], where)][:n_results]
+    return [ids[row] for row in rows], [1.0 - float(scores[row]) for row in rows]
+
+
+WHERES = [
+    None,
+    build_magazine_where(["1"]),
+    build_magazine_where(["2"]),
+    combine_where(build_magazine_where(["1", "3"]), {"price_num": {"$lte": 20000.0}}),
+    {"price_num": {"$gte": 50000.0}},
+]
+
+
+@pytest.mark.parametrize("exact_index", [("none", 0)], indirect=True)
+@pytest.mark.parametrize("where", WHERES)
+def test_unquantized_matches_brute_force(exact_index, where):
+    index, vectors, ids, metadatas = exact_index
+    queries = np.random.default_rng(1).standard_normal((3, DIM)).astype(np.float32)
+
+    result = index.query(queries.tolist(), 10, where)
+
+    for q, query in enumerate(queries):
+        expected_ids, expected_distances = brute_force(vectors, ids, metadatas, query, 10, where)
+        assert result["ids"][q] == expected_ids
+        assert result["distances"][q] == pytest.approx(expected_distances, abs=1e-5)
+        assert all(match_where(meta, where) for meta in result["metadatas"][q])
+
+
+@pytest.mark.parametrize("exact_index", [("float16", 16), ("int8", 16), ("int8", 0)], indirect=True)
+def test_quantized_finds_nearest_and_respects_filter(exact_index):
+    index, vectors, ids, metadatas = exact_index
+    noise = np.random.default_rng(2).standard_normal((5, DIM)).astype(np.float32) * 0.05
+    rows = [0, 150, 299, 300, 599]
+    where = build_magazine_where(["2"])
+
+    result = index.query((vectors[rows] + noise).tolist(), 5)
+    assert [found[0] for found in result["ids"]] == [ids[row] for row in rows]
+    assert all(found[0] < 0.01 for found in result["distances"])
+
+    # Строки шарда feed_a под фильтром магазина 2 не попадают
+    result = index.query((vectors[rows] + noise).tolist(), 5, where)
+    assert [found[0] == ids[row] for found, row in zip(result["ids"], rows)] == [False, False, False, True, True]
+    assert all(match_where(meta, where) for found in result["metadatas"] for meta in found)
+
+
+@pytest.mark.parametrize("exact_index", [("none", 0)], indirect=True)
+def test_get_and_empty_selection(exact_index):
+    index, vectors, ids, _ = exact_index
+
+    found = index.get([ids[5], "missing", ids[400]], include_embeddings=True)
+    assert found["ids"] == [ids[5], ids[400]]
+    normed = vectors[[5, 400]] / np.linalg.norm(vectors[[5, 400]], axis=1, keepdims=True)
+    assert np.allclose(found["embeddings"], normed, atol=1e-6)
+
+    assert index.query([[1.0] * DIM], 3, build_magazine_where(["404"])) == {
+        "ids": [[]], "metadatas": [[]], "distances": [[]],
+    }
+
+
+@pytest.mark.parametrize("where, matches", [
+    (None, True),
+    ({"mag_1": True}, True),
+    ({"mag_2": True}, False),
+    ({"$or": [{"mag_2": True}, {"mag_1": True}]}, True),
+    ({"$and": [{"mag_1": True}, {"price_num": {"$lt": 10000.0}}]}, False),
+    ({"price_num": {"$gte": 10000.0, "$lte": 20000.0}}, True),
+    ({"fold_type": {"$in": ["cane", "book"]}}, True),
+    ({"fold_type": {"$nin": ["cane"]}}, False),
+    ({"weight_kg": {"$lte": 7.0}}, False),   # Нет поля — сравнение не выполнено
+    ({"weight_kg": {"$ne": 7.0}}, True),
+])
+def test_match_where(where, matches):
+    meta = {"mag_1": True, "price_num": 15000.0, "fold_type": "cane"}
+    assert match_where(meta, where) is matches
@@ -0,0 +1,182 @@
+"""Фильтр категорий фида: правила магазина, классификатор по умолчанию, блок <categories> в потоке."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.services.feed_categories import (
+    DEFAULT_RULES, CategoryFilter, CategoryRules, CategoryTree, category_kind, product_kind,
+)
+from app.core.services.feed_parser import OfferChunker, parse_offer_chunk, parse_offers_from_xml
+
+
+CATEGORIES = (
+    "<categories>"
+    '<category id="1">Детские коляски</category>'
+    '<category id="2" parentId="1">Прогулочные коляски</category>'
+    '<category id="3" parentId="1">Аксессуары для колясок</category>'
+    '<category id="4">Аксессуары</category>'
+    '<category id="5" parentId="4">Коляски-трости</category>'
+    '<category id="6">Игрушки</category>'
+    '<category id="7" parentId="6">Коляски для кукол</category>'
+    '<category id="8" parentId="1">Коляски 3 в 1</category>'
+    "</categories>"
+)
+
+TREE = CategoryTree({
+    "1": ("Детские коляски", None),
+    "2": ("Прогулочные коляски", "1"),
+    "3": ("Аксессуары для колясок", "1"),
+    "4": ("Аксессуары", None),
+    "5": ("Коляски-трости", "4"),
+    "6": ("Игрушки", None),
+    "7": ("Коляски для кукол", "6"),
+    "8": ("Коляски 3 в 1", "1"),
+})
+
+
+def kept(rules: CategoryRules) -> set:
+    return {category_id for category_id in TREE.categories if rules.keeps(TREE.path(category_id))}
+
+
+def offer(offer_id: int, category_id: str, name: str = "Коляска Yoya") -> str:
+    return (
+        f'<offer id="{offer_id}"><url>https://shop.example/{offer_id}</url><price>1000</price>'
+        f"<categoryId>{category_id}</categoryId><name>{name}</name></offer>"
+    )
+
+
+def feed(offers: str) -> bytes:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><yml_catalog><shop>'
+        f"{CATEGORIES}<offers>{offers}</offers></shop></yml_catalog>"
+    ).encode("utf-8")
+
+
+def test_default_rules_keep_only_strollers():
+    # Аксессуары под «Колясками» и коляски для кукол — нет; коляски под «Аксессуарами» — да
+    assert kept(DEFAULT_RULES) == {"1", "2", "5", "8"}
+
+
+@pytest.mark.parametrize("name, keeps", [
+    ("Коляски 3 в 1 с автокреслом", True),
+    ("Коляски с сумкой", True),
+    ("Коляски с люлькой-конвертом", True),
+    ("Детские коляски и автокресла", True),
+    ("Конверты в коляску", False),
+    ("Сумки для колясок", False),
+    ("Автокресла", False),
+    ("Коляски для кукол", False),
+    ("Игрушечные коляски", False),
+])
+def test_default_rules_look_at_head_word(name, keeps):
+    assert DEFAULT_RULES.keeps([("1", name)]) is keeps
+
+
+def test_exclude_wins_on_each_level_from_leaf_to_root():
+    rules = CategoryRules(include=["коляск"], exclude=["аксессуар"])
+    assert rules.keeps(TREE.path("5"))       # Лист «Коляски-трости» решает раньше корня «Аксессуары»
+    assert not rules.keeps(TREE.path("3"))   # На одном уровне exclude важнее include
+    assert not rules.keeps([])               # Ничего не совпало, include не пуст
+
+
+def test_rules_match_category_id():
+    assert kept(CategoryRules(include=["6"])) == {"6", "7"}
+    assert kept(CategoryRules(exclude=["1"])) == {"4", "5", "6", "7"}
+
+
+def test_rules_from_config():
+    assert CategoryRules.from_config(None) is DEFAULT_RULES
+    assert kept(CategoryRules.from_config({})) == set(TREE.categories)
+    assert not CategoryRules.from_config({}).is_default
+
+
+def test_filter_is_union_of_magazines():
+    magazines = [
+        SimpleNamespace(category_rules={"include": ["игрушк"]}),
+        SimpleNamespace(category_rules=None),
+    ]
+    table = CategoryFilter.for_magazines(magazines).bind(TREE)
+
+    assert {category_id for category_id, info in table.items() if info is None} == {"3", "4"}
+    assert table["8"] == {
+        "category": "Коляски 3 в 1",
+        "category_path": "Детские коляски / Коляски 3 в 1",
+        "category_kind": "modular",
+    }
+
+
+def test_filter_key_ignores_magazine_order():
+    a, b = CategoryRules(include=["коляск"]), CategoryRules(exclude=["кукол"])
+    assert CategoryFilter([a, b]).key() == CategoryFilter([b, a]).key()
+    assert CategoryFilter([a]).key() != CategoryFilter([a, b]).key()
+
+
+def test_default_rules_fallback_without_strollers():
+    tree = CategoryTree({"1": ("Товары", None), "2": ("Разное", "1")})
+    table = CategoryFilter([DEFAULT_RULES]).bind(tree)
+    assert all(info is not None for info in table.values())
+
+    # Явные правила магазина не подстраховываются
+    table = CategoryFilter([CategoryRules(include=["коляск"])]).bind(tree)
+    assert all(info is None for info in table.values())
+
+
+def test_tree_path_survives_parent_cycle():
+    tree = CategoryTree({"1": ("А", "2"), "2": ("Б", "1")})
+    assert [category_id for category_id, _ in tree.path("1")] == ["2", "1"]
+    assert tree.path("404") == []
+
+
+@pytest.mark.parametrize("names, kind", [
+    (["Коляски", "Коляски 2 в 1"], "modular"),
+    (["Коляски", "Прогулочные"], "walk"),
+    (["Коляски для двойни", "Прогулочные"], "walk"),
+    (["Коляски"], "stroller"),
+    (["Игрушки"], None),
+])
+def test_category_kind(names, kind):
+    assert category_kind([(str(i), name) for i, name in enumerate(names)]) == kind
+
+
+def test_product_kind_refines_generic_category():
+    assert product_kind("stroller", "Коляска-трость Yoya") == "walk"
+    assert product_kind("stroller", "Коляска Yoya") == "stroller"
+    assert product_kind("cradle", "Коляска-трость Yoya") == "cradle"
+    assert product_kind(None, "Коляска Yoya") == "stroller"
+    assert product_kind(None, "Конверт") is None
+
+
+def test_whole_feed_with_category_filter():
+    data = feed(offer(1, "2") + offer(2, "3", "Дождевик") + offer(3, "7") + offer(4, "404"))
+    products = {p["id"]: p["metadata"] for p in parse_offers_from_xml(data, CategoryFilter([DEFAULT_RULES]))}
+
+    assert set(products) == {"1", "4"}   # Категория вне дерева не фильтруется
+    assert products["1"]["category_path"] == "Детские коляски / Прогулочные коляски"
+    assert products["1"]["category_kind"] == "walk"
+
+
+@pytest.mark.parametrize("size", [1, 5, 9, 33, 10 ** 6])
+def test_chunker_cuts_categories_block_across_chunks(size):
+    data = feed(offer(1, "2") + offer(2, "3") + offer(3, "5"))
+    chunker = OfferChunker()
+    offers = []
+    for i in range(0, len(data), size):
+        offers.extend(chunker.feed(data[i:i + size]))
+    chunker.close()
+
+    assert chunker.categories == CATEGORIES.encode("utf-8")
+    table = CategoryFilter([DEFAULT_RULES]).bind(CategoryTree.from_xml(chunker.categories, chunker.encoding))
+
+    products, excluded, _ = parse_offer_chunk(b"".join(offers), chunker.encoding, table)
+    assert [p["id"] for p in products] == ["1", "3"]
+    assert excluded == ["2"]
+
+
+def test_chunker_without_categories_block():
+    chunker = OfferChunker()
+    offers = chunker.feed(b'<?xml version="1.0"?><yml_catalog><shop><offers>' + offer(1, "2").encode() + b"</offers>")
+    chunker.close()
+
+    assert chunker.categories == b""
+    assert len(offers) == 1
@@ -0,0 +1,99 @@
+"""FeedDiff: что эмбеддить заново, что взять из рабочей версии и что удалить."""
+
+import copy
+
+from app.core.services.feed_diff import FeedDiff
+
+
+MAGS = ["1", "2"]
+
+
+def product(offer_id: str, text: str = "Коляска Yoya", price: str = "10000") -> dict:
+    return {"id": offer_id, "text": text, "metadata": {"name": text, "price": price}}
+
+
+def stored_diff(products: list, mag_ids=MAGS, stored_ids=()) -> FeedDiff:
+    """Состояние базы после загрузки products (метаданные с хэшами — как их пишет update_vectors)."""
+    loaded = FeedDiff({}, ())
+    batch = copy.deepcopy(products)
+    loaded.plan([p["id"] for p in batch], batch, mag_ids)
+    return FeedDiff.from_metadatas([p["id"] for p in batch], [p["metadata"] for p in batch], stored_ids)
+
+
+def plan(diff: FeedDiff, products: list, mag_ids=MAGS):
+    batch = copy.deepcopy(products)
+    return diff.plan([p["id"] for p in batch], batch, mag_ids)
+
+
+def ids(products: list) -> list:
+    return [p["vector_id"] for p in products]
+
+
+def test_empty_base_embeds_everything():
+    diff = FeedDiff({}, ())
+    to_embed, to_reuse, unchanged = plan(diff, [product("a"), product("b")])
+
+    assert ids(to_embed) == ["a", "b"]
+    assert not to_reuse and not unchanged
+    assert diff.stats["new"] == 2
+    assert diff.has_changes
+
+
+def test_same_feed_is_unchanged():
+    feed = [product("a"), product("b")]
+    diff = stored_diff(feed)
+    to_embed, to_reuse, unchanged = plan(diff, feed)
+
+    assert ids(unchanged) == ["a", "b"]
+    assert not to_embed and not to_reuse
+    assert not diff.has_changes
+
+
+def test_price_change_reuses_vector():
+    diff = stored_diff([product("a")])
+    to_embed, to_reuse, unchanged = plan(diff, [product("a", price="9000")])
+
+    assert ids(to_reuse) == ["a"]
+    assert not to_embed and not unchanged
+    assert diff.stats["metadata_only"] == 1
+
+
+def test_text_change_needs_embedding():
+    diff = stored_diff([product("a")])
+    to_embed, _, _ = plan(diff, [product("a", text="Коляска Yoya Plus")])
+
+    assert ids(to_embed) == ["a"]
+    assert diff.stats["changed"] == 1
+
+
+def test_magazine_change_reuses_vector():
+    """Магазины фида входят в content_hash, но не в текст: вектор прежний, метаданные новые."""
+    diff = stored_diff([product("a")], mag_ids=["1"])
+    to_embed, to_reuse, _ = plan(diff, [product("a")], mag_ids=["1", "2"])
+
+    assert ids(to_reuse) == ["a"] and not to_embed
+
+
+def test_plan_stamps_hashes():
+    diff = FeedDiff({}, ())
+    (planned,), _, _ = plan(diff, [product("a")])
+
+    assert planned["vector_id"] == "a"
+    assert planned["metadata"]["content_hash"] and planned["metadata"]["text_hash"]
+
+
+def test_vanished_are_stored_but_not_seen():
+    diff = stored_diff([product("a"), product("b")], stored_ids=["c"])
+    plan(diff, [product("a")])
+
+    assert diff.vanished() == ["b", "c"]
+    assert diff.has_changes
+
+
+def test_product_missing_from_some_store_is_embedded():
+    """Товар только в stored_ids (нет в known — не во всех хранилищах) пропускать нельзя."""
+    diff = FeedDiff.from_metadatas([], [], stored_ids=["a"])
+    to_embed, _, _ = plan(diff, [product("a")])
+
+    assert ids(to_embed) == ["a"]
+    assert diff.vanished() == []
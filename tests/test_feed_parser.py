@@ -0,0 +1,133 @@
+"""Потоковый разбор YML-фида: результат не зависит от того, как поток порезан на куски."""
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from app.core.services.feed_parser import OfferChunker, OfferStreamParser, parse_offer_chunk, parse_offers_from_xml
+
+
+def offer(offer_id: int, name: str = None, available: str = "true") -> str:
+    name = name or f"Коляска {offer_id}"
+    return (
+        f'<offer id="{offer_id}" available="{available}">'
+        f"<url>https://shop.example/{offer_id}</url><price>{10000 + offer_id}</price>"
+        f"<name>{name}</name><vendor>Yoya</vendor><description>Лёгкая &amp; складная</description>"
+        f'<param name="Вес коляски">6,5 кг</param><param name="Механизм складывания">трость</param>'
+        "</offer>"
+    )
+
+
+def feed(offers: str, encoding: str = "UTF-8") -> str:
+    return (
+        f'<?xml version="1.0" encoding="{encoding}"?><yml_catalog><shop>'
+        f"<offers>{offers}</offers></shop></yml_catalog>"
+    )
+
+
+def parse_chunked(data: bytes, size: int) -> list:
+    parser = OfferStreamParser()
+    products = []
+    for i in range(0, len(data), size):
+        products.extend(parser.feed(data[i:i + size]))
+    products.extend(parser.close())
+    return products
+
+
+def test_parse_offer_fields():
+    (product,) = parse_offers_from_xml(feed(offer(1)))
+
+    assert product["id"] == "1"
+    assert product["text"].startswith("Коляска 1 Yoya Вес коляски: 6,5 кг")
+    meta = product["metadata"]
+    assert meta["url"] == "https://shop.example/1"
+    assert meta["price_num"] == 10001.0
+    assert meta["weight_kg"] == 6.5
+    assert meta["fold_type"] == "cane"
+
+
+def test_skips_unavailable_and_nameless_offers():
+    offers = offer(1) + offer(2, available="false") + '<offer id="3"><url>u</url></offer>'
+    assert [p["id"] for p in parse_offers_from_xml(feed(offers))] == ["1"]
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 10 ** 6])
+def test_chunking_does_not_change_result(size):
+    data = feed("".join(offer(i) for i in range(20))).encode("utf-8")
+    assert parse_chunked(data, size) == parse_offers_from_xml(data)
+
+
+def test_declared_encoding_is_respected():
+    data = feed(offer(1, name="Коляска Ёжик"), encoding="windows-1251").encode("cp1251")
+    (product,) = parse_offers_from_xml(data)
+    assert product["metadata"]["name"] == "Коляска Ёжик"
+
+
+def test_broken_xml_returns_nothing():
+    assert parse_offers_from_xml(feed(offer(1))[:-40]) == []
+
+
+# === OfferChunker + parse_offer_chunk (разбор в пуле процессов) ===
+
+def chunk_offers(data: bytes, size: int) -> tuple:
+    """Поток кусками по size байт -> (целые <offer>, чанкер после close())."""
+    chunker = OfferChunker()
+    offers = []
+    for i in range(0, len(data), size):
+        offers.extend(chunker.feed(data[i:i + size]))
+    chunker.close()
+    return offers, chunker
+
+
+@pytest.mark.parametrize("size", [1, 5, 9, 33, 10 ** 6])
+def test_chunker_cuts_whole_offers_across_boundaries(size):
+    data = feed("".join(offer(i) for i in range(15))).encode("utf-8")
+    offers, chunker = chunk_offers(data, size)
+
+    assert len(offers) == 15
+    assert all(o.startswith(b"<offer ") and o.endswith(b"</offer>") for o in offers)
+    products, excluded, _ = parse_offer_chunk(b"".join(offers), chunker.encoding)
+    assert products == parse_offers_from_xml(data)
+    assert excluded == []
+
+
+def test_chunker_does_not_take_offers_tag_for_offer():
+    data = feed(offer(1)).encode("utf-8")
+    offers, _ = chunk_offers(data, 3)
+    assert len(offers) == 1 and offers[0].startswith(b'<offer id="1"')
+
+
+def test_chunker_detects_encoding():
+    data = feed(offer(1, name="Коляска Ёжик"), encoding="windows-1251").encode("cp1251")
+    offers, chunker = chunk_offers(data, 16)
+
+    assert chunker.encoding == "windows-1251"
+    (product,), _, _ = parse_offer_chunk(b"".join(offers), chunker.encoding)
+    assert product["metadata"]["name"] == "Коляска Ёжик"
+
+
+def test_chunker_truncated_feed_keeps_whole_offers_but_fails():
+    data = feed(offer(1) + offer(2)).encode("utf-8")
+    cut = data.index(b'<offer id="2"') + 20
+
+    chunker = OfferChunker()
+    offers = chunker.feed(data[:cut])
+    assert len(offers) == 1
+    with pytest.raises(ET.ParseError):
+        chunker.close()
+
+
+def test_chunker_missing_offers_end_fails():
+    data = feed(offer(1)).encode("utf-8")
+    chunker = OfferChunker()
+    chunker.feed(data[:data.index(b"</offers>")])
+    with pytest.raises(ET.ParseError):
+        chunker.close()
+
+
+def test_chunker_feed_without_declaration():
+    data = feed(offer(1)).split("?>", 1)[1].encode("utf-8")
+    offers, chunker = chunk_offers(data, 4)
+
+    assert chunker.encoding == "utf-8"
+    assert len(offers) == 1
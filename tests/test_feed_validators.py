@@ -0,0 +1,117 @@
+"""Условные загрузки фидов: ETag / Last-Modified, sha256 тела и state фида."""
+
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from app.core.services.feed_parser import FeedStream, probe_feed
+from app.core.services.feed_validators import (
+    conditional_headers, feed_state, forget_feed_validators, load_feed_validators, save_feed_validators,
+)
+
+
+FEED = (
+    '<?xml version="1.0" encoding="UTF-8"?><yml_catalog><shop><offers>'
+    + "".join(
+        f'<offer id="{i}"><url>https://shop.example/{i}</url><price>1000</price><name>Коляска {i}</name></offer>'
+        for i in range(5)
+    )
+    + "</offers></shop></yml_catalog>"
+).encode("utf-8")
+
+
+def test_conditional_headers():
+    assert conditional_headers(None) == {}
+    assert conditional_headers({"etag": '"abc"', "last_modified": None, "sha256": "x"}) == {"If-None-Match": '"abc"'}
+    assert conditional_headers({"last_modified": "Mon, 01 Jan 2024 00:00:00 GMT"}) == {
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"
+    }
+
+
+def test_feed_state_tracks_magazines_and_rules():
+    assert feed_state(["2", "1"]) == feed_state(["1", "2"])
+    assert feed_state(["1"]) != feed_state(["1", "2"])
+    assert feed_state(["1"], "rules-a") != feed_state(["1"], "rules-b")
+
+
+def test_save_load_forget_roundtrip():
+    save_feed_validators({"https://a": {"etag": "1"}, "https://b": {"etag": "2"}})
+    forget_feed_validators("https://a")
+    assert load_feed_validators() == {"https://b": {"etag": "2"}}
+
+
+def run_with_server(etag: bool, scenario):
+    """Фид на локальном aiohttp-сервере; etag=False — сервер без валидаторов (только sha256)."""
+    requests = []
+
+    async def handler(request):
+        requests.append(dict(request.headers))
+        if etag and request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=FEED, headers={"ETag": '"v1"'} if etag else {})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/feed.xml", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await scenario(session, f"http://127.0.0.1:{port}/feed.xml")
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main()), requests
+
+
+async def load(session, url, validators=None):
+    stream = FeedStream(session, url, validators=validators)
+    products = [product async for batch in stream.batches() for product in batch]
+    return stream, products
+
+
+def test_etag_gives_304_without_parsing():
+    async def scenario(session, url):
+        first, products = await load(session, url)
+        second, again = await load(session, url, first.new_validators)
+        return first, products, second, again
+
+    (first, products, second, again), requests = run_with_server(True, scenario)
+
+    assert first.complete and not first.not_modified and len(products) == 5
+    assert first.new_validators["etag"] == '"v1"' and first.new_validators["sha256"]
+    assert requests[1]["If-None-Match"] == '"v1"'
+    assert second.not_modified and second.complete and again == []
+    assert second.new_validators == first.new_validators
+
+
+def test_same_body_without_etag_is_not_modified():
+    async def scenario(session, url):
+        first, _ = await load(session, url)
+        second, again = await load(session, url, first.new_validators)
+        changed, fresh = await load(session, url, {**first.new_validators, "sha256": "other"})
+        return second, again, changed, fresh
+
+    (second, again, changed, fresh), _ = run_with_server(False, scenario)
+
+    assert second.not_modified and again == []
+    assert not changed.not_modified and len(fresh) == 5
+
+
+def test_probe_feed():
+    async def scenario(session, url):
+        first, _ = await load(session, url)
+        return (
+            await probe_feed(session, url, first.new_validators),
+            await probe_feed(session, url, {**first.new_validators, "etag": None, "sha256": "other"}),
+            await probe_feed(session, url, None),
+        )
+
+    (same, changed, unknown), _ = run_with_server(True, scenario)
+
+    assert same is not None and same["etag"] == '"v1"'
+    assert changed is None and unknown is None
@@ -0,0 +1,130 @@
+"""Версии индекса: атомарная публикация, откат по указателю и удаление старых версий вместе с их файлами."""
+
+import os
+
+import pytest
+
+import app.update_vectors as uv
+from app.core.services.index_version import (
+    LEGACY_VERSION, artifact_path, collection_name, collection_version, current_index_version,
+    list_version_dirs, load_index_pointer, remove_orphan_segment_dirs, save_index_pointer,
+)
+from app.core.services.search_config import (
+    CHROMA_DB_PATH, INDEX_KEEP_VERSIONS, INDEX_VERSION_PATH, INDEX_VERSIONS_PATH, LEXICAL_INDEX_FILE,
+)
+
+
+V1, V2, V3, V4 = "v20260101000001", "v20260101000002", "v20260101000003", "v20260101000004"
+
+
+@pytest.fixture(autouse=True)
+def clean_versions():
+    yield
+    for version in {*list_version_dirs(), *(collection_version(c.name) for c in uv.chroma_client.list_collections())}:
+        if version is not None:
+            uv.drop_index_version(version)
+    if os.path.exists(INDEX_VERSION_PATH):
+        os.remove(INDEX_VERSION_PATH)
+
+
+def collections():
+    return {c.name for c in uv.chroma_client.list_collections()}
+
+
+def build(version, publish=True):
+    """Сборка версии: коллекция, шард и файл индекса в папке версии."""
+    uv.open_index_build(version)
+    uv.open_build_shard("https://shop.example/feed.xml")
+    path = artifact_path(LEXICAL_INDEX_FILE, version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{}")
+    return uv.publish_build(rows=0) if publish else None
+
+
+def test_collection_version():
+    assert collection_version("strollers") == LEGACY_VERSION
+    assert collection_version("strollers_0123456789") == LEGACY_VERSION
+    assert collection_version(f"strollers_{V1}") == V1
+    assert collection_version(f"strollers_{V1}_0123456789") == V1
+    assert collection_version("strollers_backup") is None
+    assert collection_version("other") is None
+    assert collection_name(LEGACY_VERSION) == "strollers" and collection_name(V1) == f"strollers_{V1}"
+
+
+def test_no_pointer_is_legacy():
+    assert current_index_version() == LEGACY_VERSION
+    assert artifact_path(LEXICAL_INDEX_FILE) == os.path.join(CHROMA_DB_PATH, LEXICAL_INDEX_FILE)
+
+
+def test_publish_switches_pointer_and_keeps_history():
+    assert build(V1) == [V1]
+    assert current_index_version() == V1
+
+    assert build(V2) == [V2, V1]
+    assert current_index_version() == V2
+    assert load_index_pointer()["rows"] == 0
+    assert artifact_path(LEXICAL_INDEX_FILE).startswith(os.path.join(INDEX_VERSIONS_PATH, V2))
+
+
+def test_versions_beyond_history_are_dropped():
+    for version in (V1, V2, V3):
+        history = build(version)
+
+    assert INDEX_KEEP_VERSIONS == 2
+    assert history == [V3, V2]
+    assert {collection_version(name) for name in collections()} == {V3, V2}
+    assert list_version_dirs() == [V2, V3]
+    assert not os.path.exists(artifact_path(LEXICAL_INDEX_FILE, V1))
+
+
+def test_abandoned_build_is_dropped_on_next_publish():
+    build(V1)
+    build(V2, publish=False)   # Цикл упал до публикации: коллекции и файлы остались
+    assert V2 in list_version_dirs()
+
+    assert build(V3) == [V3, V1]
+    assert {collection_version(name) for name in collections()} == {V3, V1}
+    assert list_version_dirs() == [V1, V3]
+
+
+def test_rollback_by_pointer():
+    build(V1)
+    build(V2)
+
+    # manage_chroma.py: предыдущая версия становится рабочей, откаченная — второй в истории
+    save_index_pointer(V1, [V1, V2], rolled_back_from=V2)
+    assert current_index_version() == V1
+    assert artifact_path(LEXICAL_INDEX_FILE).startswith(os.path.join(INDEX_VERSIONS_PATH, V1))
+
+    # Следующая сборка вытесняет откаченную версию
+    assert build(V4) == [V4, V1]
+    assert V2 not in list_version_dirs()
+    assert V2 not in {collection_version(name) for name in collections()}
+
+
+def test_legacy_files_are_a_version():
+    path = artifact_path(LEXICAL_INDEX_FILE, LEGACY_VERSION)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{}")
+    assert list_version_dirs() == [LEGACY_VERSION]
+
+    build(V1)
+    build(V2)
+    assert not os.path.exists(path)
+
+
+def test_orphan_segment_dirs_are_removed():
+    build(V1)
+    orphan = os.path.join(CHROMA_DB_PATH, "01234567-89ab-cdef-0123-456789abcdef")
+    foreign = os.path.join(CHROMA_DB_PATH, "not-a-segment")
+    os.makedirs(orphan)
+    os.makedirs(foreign)
+    live = [name for name in os.listdir(CHROMA_DB_PATH) if name != os.path.basename(orphan) and len(name) == 36]
+
+    try:
+        assert remove_orphan_segment_dirs() == 1
+        assert not os.path.exists(orphan) and os.path.isdir(foreign)
+        assert all(os.path.exists(os.path.join(CHROMA_DB_PATH, name)) for name in live)
+    finally:
+        os.rmdir(foreign)
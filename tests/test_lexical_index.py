@@ -0,0 +1,82 @@
+"""BM25 по документам товаров и смешивание рангов (RRF)."""
+
+import math
+import os
+
+import pytest
+
+from app.core.services import lexical_index
+from app.core.services.index_version import artifact_path
+from app.core.services.lexical_index import (
+    BM25_B, BM25_K1, NAME_BOOST, build_lexical_index, reciprocal_rank_fusion, save_lexical_index, search_lexical,
+    tokenize,
+)
+from app.core.services.search_config import LEXICAL_INDEX_FILE
+
+
+PRODUCTS = [
+    ("p1", "Cybex Balios S Lux", "Прогулочная коляска, лёгкая", "1"),
+    ("p2", "Yoya Plus", "Коляска-трость Yoya, подходит к Cybex", "1,2"),
+    ("p3", "Anex m/type", "Модульная коляска 2в1", "2"),
+    ("p4", "Дождевик", "Дождевик для коляски", "3"),
+]
+
+
+@pytest.fixture
+def index(monkeypatch):
+    built = build_lexical_index(
+        [p[0] for p in PRODUCTS], [p[2] for p in PRODUCTS],
+        [{"name": p[1], "magazine_ids_str": p[3]} for p in PRODUCTS],
+    )
+    save_lexical_index(built)
+    monkeypatch.setattr(lexical_index, "_index_key", None)
+    yield built
+    os.remove(artifact_path(LEXICAL_INDEX_FILE))
+
+
+def test_tokenize():
+    assert tokenize("Cybex Balios S Lux, 2в1 ёжик") == ["cybex", "balios", "lux", "2в1", "ежик"]
+    assert tokenize(None) == []
+
+
+def test_name_tokens_are_boosted(index):
+    (tf,) = [tf for doc_idx, tf in index["postings"]["balios"] if doc_idx == 0]
+    assert tf == NAME_BOOST
+    assert index["doc_len"][0] == 3 * NAME_BOOST + 3
+    assert index["doc_mags"][1] == ["1", "2"]
+
+
+def test_bm25_score_matches_formula(index):
+    ((product_id, score),) = search_lexical("balios")
+
+    n_docs, df, tf = len(PRODUCTS), 1, NAME_BOOST
+    idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * index["doc_len"][0] / index["avgdl"])
+    assert product_id == "p1"
+    assert score == pytest.approx(idf * tf * (BM25_K1 + 1) / (tf + norm))
+
+
+def test_name_match_ranks_above_description_match(index):
+    assert [product_id for product_id, _ in search_lexical("Cybex")] == ["p1", "p2"]
+
+
+def test_magazine_filter_and_limit(index):
+    # «коляски» у дождевика — другая словоформа, магазин 3 отфильтрован в любом случае
+    assert {product_id for product_id, _ in search_lexical("коляска", allowed_magazine_ids=[2])} == {"p2", "p3"}
+    assert {product_id for product_id, _ in search_lexical("cybex", allowed_magazine_ids="2")} == {"p2"}
+    assert len(search_lexical("коляска", limit=1)) == 1
+    assert search_lexical("bugaboo") == [] and search_lexical("") == []
+
+
+def test_no_index_on_disk():
+    assert search_lexical("cybex") == []
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]], k=60)
+
+    # a: 1/61 + 1/62, c: 1/63 + 1/61, b: 1/62, d: 1/63
+    assert fused == ["a", "c", "b", "d"]
+    assert reciprocal_rank_fusion([]) == []
+    # Первое место одного списка против второго в обоих
+    assert reciprocal_rank_fusion([["x", "y"], ["z", "y"]], k=1)[0] == "y"
@@ -0,0 +1,148 @@
+"""pgvector без версий: записи сборки доходят до таблицы только после публикации версии."""
+
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import app.update_vectors as uv
+from app.core.services.feed_categories import CategoryFilter
+from app.core.services.feed_validators import feed_state
+from app.core.services.search_config import INDEX_VERSION_PATH
+
+
+FEED = "https://shop.example/feed.xml"
+
+
+class FakePg:
+    """Таблица product_vectors в памяти: {id: строка upsert_rows}, правки — одной «транзакцией»."""
+
+    def __init__(self, rows=None):
+        self.rows = dict(rows or {})
+        self.commits = 0
+
+    async def apply(self, engine, delete_ids, upsert_pages):
+        assert engine is self
+        staged = {row_id: row for row_id, row in self.rows.items() if row_id not in set(delete_ids)}
+        async for page in upsert_pages:
+            staged.update({row["id"]: row for row in page})
+        self.rows = staged
+        self.commits += 1
+        return len(staged)
+
+
+@pytest.fixture
+def pg(monkeypatch):
+    fake = FakePg()
+    monkeypatch.setattr(uv, "apply_vector_changes", fake.apply)
+    uv.open_index_build()
+    yield fake
+    # Опубликованная в тесте версия тоже уходит: следующий тест начинает с пустой базы
+    for version in {uv.build_version, uv.current_index_version()}:
+        uv.drop_index_version(version)
+    if os.path.exists(INDEX_VERSION_PATH):
+        os.remove(INDEX_VERSION_PATH)
+
+
+def products(*numbers):
+    return [
+        {"vector_id": f"feed_x_{n}", "metadata": {"name": f"Коляска {n}"}, "text": f"Коляска {n}"}
+        for n in numbers
+    ]
+
+
+def store(batch, pg, pg_ids=None):
+    embeddings = [[float(i + 1), 1.0, 0.0, 0.0] for i in range(len(batch))]
+    shard = uv.open_build_shard(FEED)
+    return asyncio.run(uv.store_batch(batch, embeddings, FEED, ["5"], shard, pg, pg_ids))
+
+
+def test_writes_wait_for_publish(pg):
+    pg.rows = {"feed_x_9": {"id": "feed_x_9"}}
+
+    assert store(products(1, 2, 3), pg, pg_ids={"feed_x_1", "feed_x_2"}) == 3
+    uv.delete_vanished(["feed_x_9"], pg)
+    assert pg.commits == 0 and set(pg.rows) == {"feed_x_9"}
+
+    asyncio.run(uv.sync_pgvector(pg))
+
+    assert pg.commits == 1
+    assert set(pg.rows) == {"feed_x_1", "feed_x_2"}   # Неизменённый feed_x_3 там уже лежит
+    row = pg.rows["feed_x_1"]
+    assert row["source_url"] == FEED and row["magazine_ids"] == [5] and row["document"] == "Коляска 1"
+    assert '"mag_5": true' in row["metadata"]
+
+
+def test_rejected_build_leaves_table_alone(pg):
+    store(products(1), pg)
+    uv.delete_vanished(["feed_x_9"], pg)
+
+    # Следующая сборка (после drop_index_version отвергнутой) начинает с чистого листа
+    uv.drop_index_version(uv.build_version)
+    uv.open_index_build()
+    asyncio.run(uv.sync_pgvector(pg))
+
+    assert pg.commits == 0
+
+
+def test_without_pgvector_nothing_is_staged(pg):
+    store(products(1), None)
+    uv.delete_vanished(["feed_x_1"], None)
+
+    assert uv.pg_upserts == {} and uv.pg_deletes == set()
+
+
+def test_unchanged_feed_fills_missing_pgvector_rows(pg, monkeypatch):
+    # Рабочая версия с фидом есть, а pgvector включили позже: в таблице только один товар
+    store(products(1, 2, 3), None)
+    uv.publish_build()
+    uv.open_index_build()
+
+    async def load_feed_ids(engine, source_url):
+        assert engine is pg and source_url == FEED
+        return {"feed_x_1"}
+
+    monkeypatch.setattr(uv, "load_feed_ids", load_feed_ids)
+
+    async def carry_over():
+        async with uv.UpsertWriter() as writer:
+            return await uv.carry_over_feed(FEED, ["5"], writer, pg_engine=pg)
+
+    assert asyncio.run(carry_over()) == 3
+    asyncio.run(uv.sync_pgvector(pg))
+
+    assert set(pg.rows) == {"feed_x_2", "feed_x_3"}
+    assert pg.rows["feed_x_2"]["document"] == "Коляска 2"
+
+
+def test_index_is_current_checks_pgvector_rows(pg, monkeypatch):
+    store(products(1, 2, 3), None)
+    uv.publish_build()
+    magazines = [SimpleNamespace(id=5, category_rules=None)]
+    state = feed_state(["5"], CategoryFilter.for_magazines(magazines).key())
+    pg_rows = {"count": 1}
+    probes = []
+
+    async def count_vectors(engine, source_urls):
+        assert list(source_urls) == [FEED]
+        return pg_rows["count"]
+
+    async def probe_feed(session, url, validators):
+        probes.append(url)
+        return validators
+
+    monkeypatch.setattr(uv, "count_vectors", count_vectors)
+    monkeypatch.setattr(uv, "probe_feed", probe_feed)
+
+    def is_current(pg_engine):
+        return asyncio.run(uv.index_is_current(None, {FEED: magazines}, {FEED: {"state": state}}, pg_engine))
+
+    # pgvector отстал от Chroma: цикл не пропускается (и фиды даже не опрашиваются)
+    assert not is_current(pg)
+    assert probes == []
+    assert is_current(None)
+
+    pg_rows["count"] = 3
+    assert is_current(pg)
+    assert probes == [FEED, FEED]
@@ -0,0 +1,96 @@
+"""Характеристики товара из <param> и жёсткие условия из запроса юзера."""
+
+import pytest
+
+from app.core.services.product_attributes import (
+    RELAXATION_ORDER, constraint_filters, constraints_key, extract_constraints, extract_product_attributes,
+    parse_age_from_months, parse_query_constraints, parse_weight_kg, parse_wheel_inch, relax_constraints,
+)
+from app.core.services.search_filters import combine_where, match_where
+
+
+def test_extract_product_attributes():
+    attributes = extract_product_attributes("24 990.00", [
+        ("Вес ребёнка", "до 22 кг"),
+        ("Вес коляски", "7,2 кг"),
+        ("Диаметр колёс", "25 см"),
+        ("Механизм складывания", "книжка"),
+        ("Возраст", "от 6 месяцев до 3 лет"),
+    ])
+
+    assert attributes == {
+        "price_num": 24990.0, "weight_kg": 7.2, "wheel_inch": 9.8, "fold_type": "book", "age_from_months": 6,
+    }
+
+
+@pytest.mark.parametrize("parse, raw, value", [
+    (parse_weight_kg, "7500 г", 7.5),
+    (parse_weight_kg, "150 кг", None),
+    (parse_wheel_inch, '10"', 10.0),
+    (parse_wheel_inch, "250 мм", 9.8),
+    (parse_age_from_months, "с рождения", 0),
+    (parse_age_from_months, "1 год", 12),
+])
+def test_param_parsers(parse, raw, value):
+    assert parse(raw) == value
+
+
+@pytest.mark.parametrize("text, constraints", [
+    ("коляска до 30 тыс", {"price_max": 30000.0}),
+    ("бюджет 25000", {"price_max": 25000.0}),
+    ("от 20 до 40 тыс, колеса от 10 дюймов", {"price_min": 20000.0, "price_max": 40000.0, "wheel_min": 10.0}),
+    ("прогулочная трость до 7 кг", {"weight_max": 7.0, "fold_type": "cane", "category": "walk"}),
+    ("2 в 1 с рождения", {"age_max": 0, "category": "modular"}),
+    # Голые числа без валюты — возраст, а не цена
+    ("коляска для ребенка 6 месяцев", {}),
+    # Год модели и предлог «к» — не цена
+    ("легкая коляска за 2024 год", {}),
+    ("модель 2 в 1 от 2000 года", {"category": "modular"}),
+    ("от 2000 до 2024 года", {}),
+    ("нужна до 5 к лету", {}),
+    ("коляска 2024 г. до 30 тыс", {"price_max": 30000.0}),
+    # После «за» / «от» — только с валютой или «тыс»; диапазон «от ... до» правдоподобен и без них
+    ("за 15000", {}),
+    ("за 15000 руб", {"price_max": 15000.0}),
+    ("от 20к", {"price_min": 20000.0}),
+    ("от 10000 до 20000", {"price_min": 10000.0, "price_max": 20000.0}),
+    ("до 25000", {"price_max": 25000.0}),
+    ("до 30 к руб", {"price_max": 30000.0}),
+    ("", {}),
+])
+def test_parse_query_constraints(text, constraints):
+    assert parse_query_constraints(text) == constraints
+
+
+def test_text_overrides_quiz():
+    quiz = {"q1": ["stroller_folds_like_a_cane"]}
+    assert extract_constraints("", quiz) == {"fold_type": "cane"}
+    assert extract_constraints("книжка до 20 тыс", quiz) == {"fold_type": "book", "price_max": 20000.0}
+
+
+def test_relaxation_drops_category_first_and_price_last():
+    constraints = {key: 1 for key in RELAXATION_ORDER}
+    dropped = []
+    while constraints:
+        relaxed = relax_constraints(constraints)
+        (key,) = set(constraints) - set(relaxed)
+        dropped.append(key)
+        constraints = relaxed
+
+    assert dropped == list(RELAXATION_ORDER)
+    assert dropped[0] == "category" and dropped[-1] == "price_max"
+
+
+def test_constraints_key_is_order_independent():
+    assert constraints_key({"price_max": 1, "fold_type": "cane"}) == constraints_key({"fold_type": "cane", "price_max": 1})
+
+
+def test_constraint_filters_match_metadata():
+    where = combine_where(*constraint_filters(parse_query_constraints("прогулочная трость до 30 тыс до 7 кг")))
+    product = {"price_num": 25000.0, "weight_kg": 6.5, "fold_type": "cane", "category_kind": "walk"}
+
+    assert match_where(product, where)
+    assert not match_where({**product, "price_num": 31000.0}, where)
+    assert not match_where({**product, "category_kind": "modular"}, where)
+    # Нет поля — условие не выполнено (как в Chroma)
+    assert not match_where({k: v for k, v in product.items() if k != "weight_kg"}, where)
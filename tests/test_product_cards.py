@@ -0,0 +1,64 @@
+"""Карточки товаров для контекста LLM и упаковка контекста в бюджет токенов."""
+
+import pytest
+
+from app.core.services.product_cards import (
+    FALLBACK_DESCRIPTION_CHARS, build_product_card, estimate_tokens, pack_products_context, render_product,
+    select_key_params,
+)
+from app.core.services.search_config import CARD_DESCRIPTION_CHARS, CARD_MAX_PARAMS
+
+
+def hit(n: int, card: str = "Вес: 7 кг", distance=0.2) -> dict:
+    meta = {"name": f"Коляска {n}", "price": "19990", "url": f"https://shop.example/{n}", "card": card}
+    return {"id": f"p{n}", "metadata": meta, "distance": distance}
+
+
+def test_key_params_go_first_and_are_limited():
+    params = [(f"Цвет {i}", "серый") for i in range(10)] + [("Вес коляски", "7 кг"), ("Диаметр колёс", "8")]
+    selected = select_key_params(params)
+
+    assert selected[:2] == [("Вес коляски", "7 кг"), ("Диаметр колёс", "8")]
+    assert len(selected) == CARD_MAX_PARAMS
+
+
+def test_card_trims_description_on_word_boundary():
+    card = build_product_card([("Вес", "7 кг")], "Лёгкая\n\nколяска " * 100)
+    params, description = card.split("\n")
+
+    assert params == "Вес: 7 кг"
+    assert description.startswith("Коротко: Лёгкая коляска") and description.endswith("…")
+    assert len(description) <= len("Коротко: ") + CARD_DESCRIPTION_CHARS + 1
+    assert build_product_card([], "") == ""
+
+
+def test_render_product_card_and_fallback():
+    text = render_product(hit(1, card="Вес: 7 кг\nКоротко: лёгкая"))
+    assert "  Вес: 7 кг\n  Коротко: лёгкая\n" in text and "Релевантность: 80%" in text
+
+    old = {"id": "p2", "metadata": {"name": "Старая", "description": "слово " * 500}, "distance": None}
+    text = render_product(old)
+    assert "Релевантность" not in text   # Найдена только по BM25
+    description = text.split("Описание: ")[1].split("\n")[0]
+    assert len(description) <= FALLBACK_DESCRIPTION_CHARS + 1
+
+
+def test_context_stays_within_budget_in_relevance_order():
+    hits = [hit(n, card="Характеристика; " * 20) for n in range(20)]
+    budget = 3 * estimate_tokens(render_product(hits[0]))
+
+    context = pack_products_context(hits, token_budget=budget)
+
+    assert [f"Коляска {n}</b>" in context for n in range(4)] == [True, True, True, False]
+    assert sum(estimate_tokens(render_product(h)) for h in hits[:3]) <= budget
+
+
+def test_first_product_always_fits():
+    huge = hit(1, card="очень длинная карточка " * 500)
+    assert pack_products_context([huge, hit(2)], token_budget=10) == render_product(huge)
+    assert pack_products_context([], token_budget=10) == ""
+
+
+@pytest.mark.parametrize("text, tokens", [("", 1), ("абв", 2), ("а" * 300, 101)])
+def test_estimate_tokens(text, tokens):
+    assert estimate_tokens(text) == tokens
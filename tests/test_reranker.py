@@ -0,0 +1,69 @@
+"""Переранжирование кандидатов: признаки по всему пулу одним проходом и их веса."""
+
+import numpy as np
+import pytest
+
+from app.core.services.reranker import FEATURES, QUIZ_RULES, RERANK_WEIGHTS, feature_matrix, rerank_hits
+from app.core.services.search_service import QUIZ_TRANSLATIONS
+
+
+def hit(product_id: str, distance=0.3, **meta) -> dict:
+    return {"id": product_id, "metadata": {"name": product_id, **meta}, "distance": distance}
+
+
+def column(matrix: np.ndarray, name: str) -> list:
+    return matrix[:, FEATURES.index(name)].tolist()
+
+
+def test_feature_order_matches_weights():
+    assert FEATURES == ("similarity", "quiz", "price", "name")
+    assert set(RERANK_WEIGHTS) == set(FEATURES)
+
+
+def test_quiz_rules_cover_known_answers():
+    assert set(QUIZ_RULES) <= set(QUIZ_TRANSLATIONS)
+
+
+def test_similarity_bm25_only_hit_gets_worst_distance():
+    hits = [hit("a", 0.2), hit("b", None), hit("c", 0.5)]
+    assert column(feature_matrix(hits), "similarity") == pytest.approx([0.8, 0.5, 0.5])
+    assert column(feature_matrix([hit("a", None)]), "similarity") == [0.0]
+
+
+def test_price_feature():
+    hits = [hit("in", price_num=20000.0), hit("over", price_num=33000.0), hit("far", price_num=90000.0), hit("none")]
+    prices = column(feature_matrix(hits, constraints={"price_max": 30000.0}), "price")
+
+    assert prices == pytest.approx([1.0, 0.9, 0.0, 0.0])
+    assert column(feature_matrix(hits), "price") == [0.0] * 4   # Нет ценовых условий — признак не работает
+    assert column(feature_matrix(hits, constraints={"price_min": 25000.0}), "price")[0] == pytest.approx(0.8)
+
+
+def test_quiz_feature_is_share_of_matched_answers():
+    hits = [hit("cane", fold_type="cane", weight_kg=6.0), hit("book", fold_type="book", weight_kg=12.0)]
+    quiz = {"subtype": "stroller_folds_like_a_cane", "scenario": ["air_travel", "unknown_answer"]}
+
+    assert column(feature_matrix(hits, quiz_json=quiz), "quiz") == pytest.approx([1.0, 0.0])
+    assert column(feature_matrix(hits, quiz_json={"scenario": "car_trips"}), "quiz") == pytest.approx([1.0, 0.0])
+
+
+def test_name_feature():
+    hits = [hit("Cybex Balios S Lux"), hit("Yoya Plus")]
+    assert column(feature_matrix(hits, user_query="cybex balios"), "name") == pytest.approx([1.0, 0.0])
+
+
+def test_rerank_applies_weights():
+    # Чуть дальше по вектору, но точное название: бонус name (0.2) больше разницы similarity (0.1)
+    near, named = hit("Yoya Plus", 0.3), hit("Cybex Balios", 0.4)
+    assert [h["id"] for h in rerank_hits([near, named], user_query="cybex balios")] == ["Cybex Balios", "Yoya Plus"]
+
+    # Разница similarity больше максимального бонуса quiz (0.15) — порядок по вектору
+    close, fits = hit("close", 0.1, fold_type="book"), hit("fits", 0.4, fold_type="cane")
+    quiz = {"subtype": "stroller_folds_like_a_cane"}
+    assert [h["id"] for h in rerank_hits([close, fits], quiz_json=quiz)] == ["close", "fits"]
+
+
+def test_ties_keep_original_order():
+    hits = [hit(str(i), 0.3) for i in range(5)]
+    assert rerank_hits(hits) == hits
+    assert rerank_hits(hits[:1]) == hits[:1]
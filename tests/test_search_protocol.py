@@ -0,0 +1,76 @@
+"""Кадры протокола поискового сервиса: туда-обратно без потерь, битые кадры — FrameError."""
+
+import asyncio
+import struct
+
+import numpy as np
+import pytest
+
+from app.core.services.search_protocol import (
+    MAX_FRAME_SIZE, OP_QUERY, FrameError, FrameTooLarge, encode_frame, read_frame,
+)
+
+
+def read_frames(data: bytes, count: int = 1) -> list:
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return [await read_frame(reader) for _ in range(count)]
+
+    return asyncio.run(main())
+
+
+def body(raw_header: bytes, blob: bytes = b"") -> bytes:
+    payload = struct.pack(">I", len(raw_header)) + raw_header + blob
+    return struct.pack(">I", len(payload)) + payload
+
+
+def test_roundtrip_with_matrix():
+    matrix = np.random.default_rng(0).standard_normal((3, 8)).astype(np.float64)
+    header = {"op": OP_QUERY, "n_results": 5, "where": {"mag_1": True}, "text": "коляска"}
+
+    ((got_header, got_matrix),) = read_frames(encode_frame(header, matrix))
+
+    assert got_header == header
+    assert got_matrix.dtype == np.dtype("<f4") and got_matrix.shape == (3, 8)
+    assert np.array_equal(got_matrix, matrix.astype(np.float32))
+
+
+def test_several_frames_in_one_stream():
+    data = encode_frame({"op": "ping"}) + encode_frame({"ok": True}, np.zeros((0, 4)))
+    (first, second) = read_frames(data, 2)
+
+    assert first == ({"op": "ping"}, None)
+    assert second[0] == {"ok": True} and second[1].shape == (0, 4)
+
+
+@pytest.mark.parametrize("data", [
+    body(b"{not json"),
+    body(b'"just a string"'),
+    body(b'{"matrix_shape": [2, 4]}', b"\x00" * 12),   # Матрица короче формы
+    body(b'{"matrix_shape": "2x4"}', b"\x00" * 32),
+    struct.pack(">I", 2) + b"\x00\x01",                  # Длина заголовка не влезает
+])
+def test_broken_frame(data):
+    with pytest.raises(FrameError):
+        read_frames(data)
+
+
+def test_broken_frame_keeps_stream_aligned():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(body(b"{not json") + encode_frame({"op": "ping"}))
+        reader.feed_eof()
+        with pytest.raises(FrameError):
+            await read_frame(reader)
+        return await read_frame(reader)
+
+    assert asyncio.run(main()) == ({"op": "ping"}, None)
+
+
+def test_too_large_and_closed_connection():
+    with pytest.raises(FrameTooLarge):
+        read_frames(struct.pack(">I", MAX_FRAME_SIZE + 1))
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_frames(encode_frame({"op": "ping"})[:-1])